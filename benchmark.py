@@ -0,0 +1,342 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+from typing import Callable, Dict, List
+
+# Бенчмарки измеряют сам код, поэтому кэш выписок, состояние и индекс участников по умолчанию
+# отключены; явно заданные переменные окружения сохраняются
+for _name in ('EXCERPT_CACHE_ENABLED', 'STATE_STORE_ENABLED', 'FOUNDER_INDEX_ENABLED', 'RUN_JOURNAL_ENABLED'):
+    os.environ.setdefault(_name, 'false')
+os.environ.setdefault('GOOGLE_SHEET_ID', 'benchmark')
+
+from config import BASE_DIR
+from synthetic_excerpt import generate_corpus, sheet_rows
+from pdf_extractor import PDFExtractor
+from egrul_sections import EgrulDocument
+from data_processor import DataProcessor
+from google_sheets_handler import GoogleSheetsHandler
+from pipeline import Pipeline
+
+RESULTS_DIR = os.path.join(BASE_DIR, 'bench_results')
+
+# Замедление медианы больше этой доли при сравнении считается регрессией
+REGRESSION_THRESHOLD = 0.10
+
+
+class FakeEgrulParser:
+    """Заглушка парсера ЕГРЮЛ: отдает готовые выписки из корпуса с заданной задержкой."""
+
+    def __init__(self, paths: Dict[str, str], latency=0.0):
+        self.paths = paths
+        self.latency = latency
+
+    def get_pdf(self, inn, max_age=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.paths.get(inn)
+
+    def close(self):
+        pass
+
+
+class _Request:
+    def __init__(self, call, latency):
+        self.call = call
+        self.latency = latency
+
+    def execute(self, num_retries=0):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.call()
+
+
+class FakeSheetsService:
+    """
+    Заглушка клиента Sheets API в памяти процесса: spreadsheets().values() с методами
+    get, update и batchUpdate в объеме, который использует GoogleSheetsHandler.
+
+    :param rows: строки листа начиная со второй (A2)
+    :param latency: задержка каждого запроса в секундах
+    """
+
+    def __init__(self, rows: List[List[str]], latency=0.0):
+        self.rows = [list(row) for row in rows]
+        self.latency = latency
+        self.requests = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range):
+        first_row, last_row, first_col, last_col = _parse_range(range)
+        return self._request(lambda: {'values': [
+            row[first_col:last_col + 1] for row in self.rows[first_row - 2:None if last_row is None else last_row - 1]
+        ]})
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        return self._request(lambda: self._write(range, body['values']))
+
+    def batchUpdate(self, spreadsheetId, body):
+        return self._request(lambda: [self._write(item['range'], item['values']) for item in body['data']])
+
+    def _request(self, call):
+        self.requests += 1
+        return _Request(call, self.latency)
+
+    def _write(self, range_name, values):
+        first_row, _, first_col, _ = _parse_range(range_name)
+        for offset, values_row in enumerate(values):
+            row = self.rows[first_row - 2 + offset]
+            row[first_col:first_col + len(values_row)] = values_row
+        return {'updatedRows': len(values)}
+
+
+def _parse_range(range_name):
+    """A1-диапазон вида A2:E или A5:E5 -> (первая строка, последняя строка или None, колонки с 0)."""
+    start, end = range_name.split(':')
+    first = re.match(r'([A-Z]+)(\d+)', start)
+    last = re.match(r'([A-Z]+)(\d*)', end)
+    return (int(first.group(2)), int(last.group(2)) if last.group(2) else None,
+            ord(first.group(1)) - ord('A'), ord(last.group(1)) - ord('A'))
+
+
+def measure(func: Callable, repeat, operations=1, warmup=1) -> Dict:
+    """
+    Выполняет func repeat раз после warmup прогревочных вызовов.
+
+    :param operations: число операций в одном вызове (для пересчета в операции в секунду)
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings)
+    return {
+        'repeat': repeat,
+        'operations': operations,
+        'min_ms': round(min(timings) * 1000, 3),
+        'median_ms': round(median * 1000, 3),
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'ops_per_sec': round(operations / median, 1) if median else None,
+    }
+
+
+class BenchmarkSuite:
+    """
+    Набор бенчмарков разбора, сравнения и записи на синтетическом корпусе выписок.
+
+    :param quick: меньший корпус и меньше повторов, для быстрой проверки
+    """
+
+    def __init__(self, workdir, quick=False, seed=0, egrul_latency=0.0, sheets_latency=0.0):
+        self.workdir = workdir
+        self.quick = quick
+        self.seed = seed
+        self.egrul_latency = egrul_latency
+        self.sheets_latency = sheets_latency
+        self.repeat = 3 if quick else 10
+
+        count = 20 if quick else 100
+        self.small = generate_corpus(os.path.join(workdir, 'small'), count, founders=3, pages=4, seed=seed)
+        self.medium = generate_corpus(os.path.join(workdir, 'medium'), count, founders=20, pages=12,
+                                      holding_share=0.2, seed=seed, first_inn=7710000000)
+        self.holding = generate_corpus(os.path.join(workdir, 'holding'), 5 if quick else 20, founders=300,
+                                       pages=60, holding_share=0.6, seed=seed, first_inn=7720000000)
+        self.extractor = PDFExtractor()
+
+    def run(self, only=None) -> Dict[str, Dict]:
+        benchmarks = {
+            'extract_small': self.bench_extract_small,
+            'extract_holding': self.bench_extract_holding,
+            'founders_section_parse': self.bench_founders_section_parse,
+            'founder_strings_parse': self.bench_founder_strings_parse,
+            'diff_process': self.bench_diff_process,
+            'diff_process_many': self.bench_diff_process_many,
+            'sheets_batch_write': self.bench_sheets_batch_write,
+            'pipeline_end_to_end': self.bench_pipeline,
+        }
+        results = {}
+        for name, bench in benchmarks.items():
+            if only and name not in only:
+                continue
+            results[name] = bench()
+            print(f"{name:<24} median {results[name]['median_ms']:>10.3f} ms  "
+                  f"{results[name]['ops_per_sec'] or 0:>10.1f} ops/s", file=sys.stderr)
+        return results
+
+    def _check_extraction(self, companies):
+        """Проверяет, что разбор корпуса совпадает с заложенными в выписки данными."""
+        for company in companies:
+            data = self.extractor.extract_data(company['path'])
+            expected = {(founder['name'], founder['inn']) for founder in company['founders']}
+            actual = {(founder['name'], founder['inn']) for founder in (data or {}).get('founders', [])}
+            if expected != actual or data['short_name'] != company['short_name']:
+                raise AssertionError(f"Extraction mismatch for {company['path']}")
+
+    def bench_extract_small(self):
+        self._check_extraction(self.small)
+        return measure(lambda: [self.extractor.extract_data(c['path']) for c in self.small],
+                       self.repeat, operations=len(self.small))
+
+    def bench_extract_holding(self):
+        self._check_extraction(self.holding)
+        return measure(lambda: [self.extractor.extract_data(c['path']) for c in self.holding],
+                       self.repeat, operations=len(self.holding))
+
+    def bench_founders_section_parse(self):
+        texts = [self.extractor.extract_text(c['path']) for c in self.medium + self.holding]
+        return measure(lambda: [EgrulDocument(text).founders for text in texts], self.repeat, operations=len(texts))
+
+    def bench_founder_strings_parse(self):
+        processor = DataProcessor()
+        cells = [row[2] for row in sheet_rows(self.medium + self.holding, 0.0, self.seed)]
+        return measure(lambda: [processor._parse_founders(cell) for cell in cells], self.repeat,
+                       operations=len(cells))
+
+    def _records(self, companies):
+        return {c['inn']: {'short_name': c['short_name'],
+                           'founders': [{'name': f['name'], 'inn': f['inn']} for f in c['founders']]}
+                for c in companies}
+
+    def _current_rows(self, companies):
+        return {row[0]: {'name': row[1], 'current_founders': row[2], 'former_founders': row[3],
+                         'change_date': row[4]}
+                for row in sheet_rows(companies, 0.3, self.seed)}
+
+    def bench_diff_process(self):
+        companies = self.small + self.medium + self.holding
+        records, current = self._records(companies), self._current_rows(companies)
+        processor = DataProcessor()
+        return measure(lambda: [processor.process(inn, records[inn], current[inn]) for inn in records],
+                       self.repeat, operations=len(records))
+
+    def bench_diff_process_many(self):
+        companies = self.small + self.medium + self.holding
+        records, current = self._records(companies), self._current_rows(companies)
+        processor = DataProcessor()
+        return measure(lambda: processor.process_many(records, current), self.repeat, operations=len(records))
+
+    def _sheets_handler(self, rows):
+        return GoogleSheetsHandler(service=FakeSheetsService(rows, self.sheets_latency))
+
+    def bench_sheets_batch_write(self):
+        companies = self.small + self.medium
+        rows = sheet_rows(companies, 0.0, self.seed)
+        updates = [(row[0], {'name': row[1], 'current_founders': row[2] + ', НОВЫЙ УЧАСТНИК 770000000002',
+                             'former_founders': '', 'change_date': '01.07.2024'}) for row in rows]
+
+        def write_all():
+            handler = self._sheets_handler(rows)
+            for inn, data in updates:
+                handler.update_company_data(inn, data)
+            handler.close()
+
+        return measure(write_all, self.repeat, operations=len(updates))
+
+    def bench_pipeline(self):
+        companies = self.small + self.medium
+        paths = {c['inn']: c['path'] for c in companies}
+        rows = sheet_rows(companies, 0.3, self.seed)
+
+        def run_pipeline():
+            handler = self._sheets_handler(rows)
+            pipeline = Pipeline(lambda: FakeEgrulParser(paths, self.egrul_latency), self.extractor,
+                                DataProcessor(), handler)
+            stats = pipeline.run(list(paths))
+            handler.close()
+            if stats['failed']:
+                raise AssertionError(f"Pipeline failures: {stats}")
+
+        return measure(run_pipeline, max(1, self.repeat // 2), operations=len(paths))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD) -> bool:
+    """
+    Сравнивает медианы с сохраненным отчетом и печатает изменения.
+
+    :return: True, если ни один бенчмарк не замедлился больше threshold
+    """
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = json.load(file)
+    ok = True
+    print(f"Compared with {baseline_path} (commit {baseline.get('commit')})", file=sys.stderr)
+    for name, result in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None or not previous['median_ms']:
+            continue
+        change = result['median_ms'] / previous['median_ms'] - 1
+        marker = ''
+        if change > threshold:
+            marker = '  REGRESSION'
+            ok = False
+        print(f"{name:<24} {previous['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms  {change:+.1%}{marker}",
+              file=sys.stderr)
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарки разбора выписок, сравнения участников и записи в таблицу')
+    parser.add_argument('--quick', action='store_true', help='меньший корпус и меньше повторов')
+    parser.add_argument('--only', help='список бенчмарков через запятую')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--egrul-latency', type=float, default=0.0, help='задержка заглушки ЕГРЮЛ, сек')
+    parser.add_argument('--sheets-latency', type=float, default=0.0, help='задержка заглушки Sheets API, сек')
+    parser.add_argument('--output', help=f'файл результатов (по умолчанию в {RESULTS_DIR})')
+    parser.add_argument('--compare', help='отчет предыдущего запуска для сравнения')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='parcer-inn-bench-')
+    try:
+        suite = BenchmarkSuite(workdir, quick=args.quick, seed=args.seed, egrul_latency=args.egrul_latency,
+                               sheets_latency=args.sheets_latency)
+        results = suite.run(set(args.only.split(',')) if args.only else None)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = _git_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'quick': args.quick, 'seed': args.seed, 'egrul_latency': args.egrul_latency,
+                   'sheets_latency': args.sheets_latency},
+        'results': results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit or 'nocommit'}.json")
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+
+    if args.compare and not compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
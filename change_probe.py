@@ -0,0 +1,102 @@
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+from config import EGRUL_PROBE_ENABLED, EGRUL_PROBE_MAX_AGE
+from excerpt_cache import get_excerpt_cache
+from state_store import get_state_store
+
+logger = logging.getLogger(__name__)
+
+# Поля строки результата поиска API ЕГРЮЛ, которые меняются вместе с регистрационными данными:
+# наименования, руководитель, ОГРН, ИНН, КПП, адрес, даты регистрации и прекращения деятельности.
+# Токены и служебные поля меняются при каждом запросе и в отпечаток не входят.
+SEARCH_ROW_FIELDS = ('n', 'c', 'g', 'o', 'i', 'p', 'a', 'r', 'e')
+
+
+def fingerprint_search_row(row: Dict) -> str:
+    """Отпечаток строки JSON-результата поиска (EgrulHttpParser)."""
+    digest = hashlib.sha1()
+    for field in SEARCH_ROW_FIELDS:
+        digest.update(f"{field}={' '.join(str(row.get(field, '')).split())}\x00".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def fingerprint_result_text(text) -> str:
+    """Отпечаток текста строки .res-text на странице поиска (EgrulParser)."""
+    return hashlib.sha1(' '.join(text.split()).encode('utf-8')).hexdigest()
+
+
+class ChangeProbe:
+    """
+    Решает, нужна ли полная выписка, по отпечатку результата поиска.
+
+    Результат поиска содержит регистрационные данные компании, но не состав участников,
+    поэтому совпадение отпечатка не гарантирует отсутствие изменений. Закэшированная
+    выписка используется, только пока она моложе max_age; после этого выписка
+    скачивается заново независимо от отпечатка.
+    """
+
+    def __init__(self, state_store, excerpt_cache, max_age=EGRUL_PROBE_MAX_AGE):
+        self.state_store = state_store
+        self.cache = excerpt_cache
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.counters = {'probes': 0, 'skipped': 0, 'changed': 0, 'expired': 0}
+
+    def cached_if_unchanged(self, inn, fingerprint, max_age=None) -> Optional[str]:
+        """
+        Путь к закэшированной выписке, если отпечаток не изменился и выписка не старше max_age.
+
+        :param max_age: более строгое ограничение возраста для этого запроса, в секундах
+        """
+        with self._lock:
+            self.counters['probes'] += 1
+        stored = self.state_store.get_probe(inn)
+        if stored is None or stored != fingerprint:
+            self._count('changed')
+            return None
+        if max_age is None or max_age > self.max_age:
+            max_age = self.max_age
+        pdf_path = self.cache.get_pdf(inn, max_age=max_age)
+        if pdf_path is None:
+            self._count('expired')
+            return None
+        self._count('skipped')
+        logger.info("Search result for INN %s is unchanged, reusing cached excerpt", inn)
+        return pdf_path
+
+    def remember(self, inn, fingerprint):
+        """Сохраняет отпечаток, соответствующий только что скачанной выписке."""
+        self.state_store.save_probe(inn, fingerprint, time.time())
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+
+_probe = None
+_probe_lock = threading.Lock()
+
+
+def get_change_probe():
+    """
+    Возвращает общий для процесса ChangeProbe или None, если проба отключена
+    или для нее нет хранилища состояния и кэша выписок.
+    """
+    global _probe
+    if not EGRUL_PROBE_ENABLED:
+        return None
+    with _probe_lock:
+        if _probe is None:
+            state_store = get_state_store()
+            excerpt_cache = get_excerpt_cache()
+            if state_store is None or excerpt_cache is None:
+                return None
+            _probe = ChangeProbe(state_store, excerpt_cache)
+        return _probe
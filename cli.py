@@ -0,0 +1,157 @@
+import sys
+import json
+import argparse
+from datetime import datetime
+
+# Модули с тяжелыми зависимостями (Selenium, googleapiclient, PyPDF2) импортируются внутри команд,
+# чтобы каждая команда загружала только то, что ей нужно
+
+
+def _validate_config():
+    """Проверяет настройки Google Sheets; при ошибке завершает команду с понятным сообщением."""
+    from config import validate_config
+    try:
+        validate_config()
+    except (ValueError, FileNotFoundError) as e:
+        print(f"parcer-inn: {e}", file=sys.stderr)
+        sys.exit(2)
+
+
+def _print(entry):
+    print(json.dumps(entry, ensure_ascii=False), flush=True)
+
+
+def cmd_fetch(args):
+    """Получает выписки и печатает наименование и участников каждой компании; с --write записывает в таблицу."""
+    if args.write:
+        _validate_config()
+        from main import process_companies
+        stats = process_companies(args.inns)
+        _print({'stats': stats})
+        return 0 if stats and not stats['failed'] else 1
+
+    from concurrent.futures import ThreadPoolExecutor
+    from main import create_egrul_parser
+    from pdf_extractor import PDFExtractor
+    from lookup_service import CompanyLookup, CompanyLookupError
+
+    lookup = CompanyLookup(lambda: create_egrul_parser(args.backend), PDFExtractor(), fetch_workers=args.workers)
+
+    def fetch(inn):
+        try:
+            data, fetched_at, _ = lookup.get(inn, max_age=args.max_age)
+        except CompanyLookupError as e:
+            return {'inn': inn, 'error': str(e)}
+        return {'inn': inn, **data, 'fetched_at': datetime.fromtimestamp(fetched_at).isoformat(timespec='seconds')}
+
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(args.workers, len(args.inns)))) as executor:
+            # Результаты печатаются в порядке ИНН в командной строке
+            for entry in executor.map(fetch, args.inns):
+                failed += 'error' in entry
+                _print(entry)
+    finally:
+        lookup.close()
+    return 1 if failed else 0
+
+
+def cmd_parse(args):
+    """Разбирает выписки ЕГРЮЛ из PDF-файлов без обращения к сети и таблице."""
+    from pdf_extractor import PDFExtractor
+
+    if args.workers > 1:
+        results = PDFExtractor.extract_many(args.pdfs, workers=args.workers, include_full_text=args.full_text)
+    else:
+        extractor = PDFExtractor()
+        results = ((path, extractor.extract_data(path, include_full_text=args.full_text)) for path in args.pdfs)
+
+    failed = 0
+    for path, data in results:
+        if data is None:
+            failed += 1
+            _print({'path': path, 'error': 'extraction failed'})
+        else:
+            _print({'path': path, **data})
+    return 1 if failed else 0
+
+
+def cmd_run(args):
+    """Обработка таблицы: однократный прогон (--once) или планировщик, как python main.py."""
+    _validate_config()
+    from main import process_companies, run_scheduler
+
+    if args.once or args.inns:
+        stats = process_companies(args.inns or None)
+        _print({'stats': stats})
+        return 0 if stats and not stats['failed'] else 1
+    run_scheduler()
+    return 0
+
+
+def cmd_worker(args):
+    """Узел распределенной обработки: берет порции ИНН у координатора (COORDINATOR_ENABLED на основном узле)."""
+    from main import create_egrul_parser
+    from pdf_extractor import PDFExtractor
+    from coordinator import Worker
+    from config import COORDINATOR_URL, WORKER_THREADS
+
+    worker = Worker(lambda: create_egrul_parser(args.backend), PDFExtractor(),
+                    coordinator_url=args.coordinator or COORDINATOR_URL, threads=args.threads or WORKER_THREADS)
+    stats = worker.run(exit_when_idle=args.exit_when_idle)
+    _print({'stats': stats})
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='parcer-inn', description='Парсер выписок ЕГРЮЛ с записью в Google Sheets')
+    parser.add_argument('--log-level', help='уровень логирования (по умолчанию LOG_LEVEL, для fetch и parse - WARNING)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fetch = commands.add_parser('fetch', help='получить выписки по ИНН и вывести участников (JSON по строке на ИНН)')
+    fetch.add_argument('inns', nargs='+', metavar='inn')
+    fetch.add_argument('--backend', choices=('http', 'selenium'), help='бэкенд ЕГРЮЛ (по умолчанию EGRUL_BACKEND)')
+    fetch.add_argument('--max-age', type=float, help='допустимый возраст выписки из кэша, сек')
+    fetch.add_argument('--workers', type=int, default=4, help='одновременных обращений к ЕГРЮЛ')
+    fetch.add_argument('--write', action='store_true', help='обработать ИНН конвейером и записать в таблицу')
+    fetch.set_defaults(handler=cmd_fetch, quiet=True)
+
+    parse = commands.add_parser('parse', help='разобрать PDF-выписки (JSON по строке на файл)')
+    parse.add_argument('pdfs', nargs='+', metavar='pdf')
+    parse.add_argument('--workers', type=int, default=1, help='процессов разбора; больше 1 - пул процессов')
+    parse.add_argument('--full-text', action='store_true', help='включить полный текст выписки')
+    parse.set_defaults(handler=cmd_parse, quiet=True)
+
+    run = commands.add_parser('run', help='обработать таблицу: планировщик или однократный прогон')
+    run.add_argument('inns', nargs='*', metavar='inn', help='обработать только эти ИНН (однократно)')
+    run.add_argument('--once', action='store_true', help='один прогон по всей таблице без планировщика')
+    run.set_defaults(handler=cmd_run, quiet=False)
+
+    worker = commands.add_parser('worker', help='узел распределенной обработки: получение и разбор выписок')
+    worker.add_argument('--coordinator', help='адрес координатора (по умолчанию COORDINATOR_URL)')
+    worker.add_argument('--backend', choices=('http', 'selenium'), help='бэкенд ЕГРЮЛ (по умолчанию EGRUL_BACKEND)')
+    worker.add_argument('--threads', type=int, help='ИНН порции, обрабатываемых одновременно (WORKER_THREADS)')
+    worker.add_argument('--exit-when-idle', action='store_true', help='завершиться, когда порции закончатся')
+    worker.set_defaults(handler=cmd_worker, quiet=False)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'backend', False) is None:
+        from config import EGRUL_BACKEND
+        args.backend = EGRUL_BACKEND
+
+    # Логирование настраивается до импорта main, который иначе настроит его с уровнем по умолчанию
+    from logger import setup_logging
+    if args.log_level:
+        setup_logging(args.log_level.upper())
+    elif args.quiet and not getattr(args, 'write', False):
+        setup_logging('WARNING')
+    else:
+        setup_logging()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
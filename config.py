@@ -8,23 +8,155 @@ load_dotenv()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Настройки Google Sheets
-SHEET_ID = os.getenv('GOOGLE_SHEET_ID')
+# Адрес локального эмулятора Sheets API (python sheets_emulator.py), например http://127.0.0.1:8766/;
+# с эмулятором credentials.json не нужен, а GOOGLE_SHEET_ID по умолчанию 'local'
+SHEETS_API_ENDPOINT = os.getenv('SHEETS_API_ENDPOINT')
+SHEET_ID = os.getenv('GOOGLE_SHEET_ID', 'local' if SHEETS_API_ENDPOINT else None)
 CREDENTIALS_FILE = os.path.join(BASE_DIR, 'credentials.json')
+# Повторы запросов чтения и одиночной записи при 429 (квота) и 5xx, с экспоненциальной паузой
+SHEETS_API_RETRIES = int(os.getenv('SHEETS_API_RETRIES', 3))
+# Снимок листа: диапазон A2:E читается один раз за прогон и обслуживается из памяти
+SHEETS_SNAPSHOT = os.getenv('SHEETS_SNAPSHOT', 'true').lower() in ('1', 'true', 'yes')
+SHEETS_SNAPSHOT_MAX_AGE = int(os.getenv('SHEETS_SNAPSHOT_MAX_AGE', 0))  # в секундах, 0 - без ограничения
+# Отложенная запись: строки копятся в буфере и уходят одним values.batchUpdate
+SHEETS_BATCH_WRITES = os.getenv('SHEETS_BATCH_WRITES', 'true').lower() in ('1', 'true', 'yes')
+SHEETS_BATCH_SIZE = int(os.getenv('SHEETS_BATCH_SIZE', 200))  # строк в одном запросе
+SHEETS_FLUSH_INTERVAL = int(os.getenv('SHEETS_FLUSH_INTERVAL', 60))  # в секундах
 
 # Настройки парсера EGRUL
 EGRUL_URL = 'https://egrul.nalog.ru/index.html'
+# Бэкенд получения выписок: 'selenium' (браузер) или 'http' (прямые запросы к API сайта)
+EGRUL_BACKEND = os.getenv('EGRUL_BACKEND', 'selenium')
+EGRUL_BASE_URL = os.getenv('EGRUL_BASE_URL', 'https://egrul.nalog.ru')
+EGRUL_POLL_INTERVAL = float(os.getenv('EGRUL_POLL_INTERVAL', 0.5))  # в секундах
 PDF_DOWNLOAD_PATH = os.path.join(BASE_DIR, 'downloads')
 
+# Пул браузеров Chrome: запускается один раз на процесс и переиспользуется между ИНН
+DRIVER_POOL_SIZE = int(os.getenv('DRIVER_POOL_SIZE', os.getenv('PIPELINE_FETCH_WORKERS', 1)))
+DRIVER_MAX_USES = int(os.getenv('DRIVER_MAX_USES', 50))  # после стольких выписок браузер перезапускается
+CHROME_HEADLESS = os.getenv('CHROME_HEADLESS', 'true').lower() in ('1', 'true', 'yes')
+# Путь к chromedriver: явно заданный или закэшированный после первой установки webdriver_manager
+CHROMEDRIVER_PATH = os.getenv('CHROMEDRIVER_PATH')
+CHROMEDRIVER_CACHE_FILE = os.path.join(BASE_DIR, '.chromedriver_path')
+# Ожидание скачивания выписки: жесткий таймаут и период опроса директории загрузки
+DOWNLOAD_TIMEOUT = int(os.getenv('DOWNLOAD_TIMEOUT', 60))  # в секундах
+DOWNLOAD_POLL_INTERVAL = float(os.getenv('DOWNLOAD_POLL_INTERVAL', 0.2))  # в секундах
+
+# Кэш выписок: PDF хранятся по хэшу содержимого вместе с результатом разбора
+EXCERPT_CACHE_ENABLED = os.getenv('EXCERPT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+EXCERPT_CACHE_DIR = os.getenv('EXCERPT_CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+EXCERPT_CACHE_TTL = int(os.getenv('EXCERPT_CACHE_TTL', 12 * 60 * 60))  # в секундах
+EXCERPT_CACHE_MAX_BYTES = int(os.getenv('EXCERPT_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+# Сколько секунд выданный из кэша PDF не удаляется при вытеснении (пока его читает разбор)
+EXCERPT_CACHE_LEASE = int(os.getenv('EXCERPT_CACHE_LEASE', 600))
+
+# Полный текст выписки в результате разбора нужен только для отладки: без него чтение PDF
+# останавливается, как только прочитан раздел об участниках
+PDF_INCLUDE_FULL_TEXT = os.getenv('PDF_INCLUDE_FULL_TEXT', 'false').lower() in ('1', 'true', 'yes')
+# Пакетный разбор PDF в отдельных процессах (PDFExtractor.extract_many)
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', os.cpu_count() or 1))
+PDF_EXTRACT_TIMEOUT = int(os.getenv('PDF_EXTRACT_TIMEOUT', 120))  # в секундах на один файл
+
+# Локальное состояние компаний между прогонами (отпечатки и нормализованные наборы участников)
+STATE_STORE_ENABLED = os.getenv('STATE_STORE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', os.path.join(BASE_DIR, 'state.sqlite'))
+
+# Обратный индекс участников: какие компании у участника и с какой даты
+FOUNDER_INDEX_ENABLED = os.getenv('FOUNDER_INDEX_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+FOUNDER_INDEX_PATH = os.getenv('FOUNDER_INDEX_PATH', os.path.join(BASE_DIR, 'founder_index.sqlite'))
+
+# Получатели обработанных данных (sinks.py) через запятую: sheets, sqlite, jsonl, csv
+OUTPUT_SINKS = os.getenv('OUTPUT_SINKS', 'sheets')
+OUTPUT_DIR = os.getenv('OUTPUT_DIR', os.path.join(BASE_DIR, 'output'))
+OUTPUT_SQLITE_PATH = os.getenv('OUTPUT_SQLITE_PATH', os.path.join(OUTPUT_DIR, 'companies.sqlite'))
+OUTPUT_JSONL_PATH = os.getenv('OUTPUT_JSONL_PATH', os.path.join(OUTPUT_DIR, 'changes.jsonl'))  # лента изменений
+OUTPUT_CSV_PATH = os.getenv('OUTPUT_CSV_PATH', os.path.join(OUTPUT_DIR, 'companies.csv'))
+OUTPUT_BATCH_SIZE = int(os.getenv('OUTPUT_BATCH_SIZE', 500))  # строк в транзакции SQLite и между fsync ленты
+# Строки для таблицы копятся в памяти и отправляются в конце прогона
+SHEETS_SYNC_AT_END = os.getenv('SHEETS_SYNC_AT_END', 'false').lower() in ('1', 'true', 'yes')
+
+# Журнал прогона: позволяет продолжить process_companies после падения процесса
+RUN_JOURNAL_ENABLED = os.getenv('RUN_JOURNAL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RUN_JOURNAL_DIR = os.getenv('RUN_JOURNAL_DIR', os.path.join(BASE_DIR, 'journal'))
+RUN_JOURNAL_FSYNC_INTERVAL = float(os.getenv('RUN_JOURNAL_FSYNC_INTERVAL', 1.0))  # в секундах
+RUN_JOURNAL_FSYNC_BATCH = int(os.getenv('RUN_JOURNAL_FSYNC_BATCH', 100))  # записей между fsync
+RUN_JOURNAL_KEEP = int(os.getenv('RUN_JOURNAL_KEEP', 10))  # сколько журналов хранить
+# Прерванный прогон продолжается, если начат не раньше стольких секунд назад (0 - без ограничения)
+RUN_JOURNAL_MAX_AGE = int(os.getenv('RUN_JOURNAL_MAX_AGE', 6 * 3600))
+
+# Сервис поиска компаний по запросу (python lookup_service.py)
+LOOKUP_HOST = os.getenv('LOOKUP_HOST', '127.0.0.1')
+LOOKUP_PORT = int(os.getenv('LOOKUP_PORT', 8080))
+LOOKUP_LRU_SIZE = int(os.getenv('LOOKUP_LRU_SIZE', 1024))  # результатов разбора в памяти
+LOOKUP_MAX_AGE = int(os.getenv('LOOKUP_MAX_AGE', EXCERPT_CACHE_TTL))  # свежесть по умолчанию, в секундах
+LOOKUP_FETCH_WORKERS = int(os.getenv('LOOKUP_FETCH_WORKERS', 4))  # одновременных обращений к ЕГРЮЛ
+
 # Настройки обработки данных
 MAX_RETRIES = 3
-RETRY_DELAY = 5  # в секундах
+RETRY_DELAY = 5  # в секундах, база экспоненциальной паузы между повторами
+RETRY_MAX_DELAY = int(os.getenv('RETRY_MAX_DELAY', 120))  # в секундах
+
+# Проба изменений по результату поиска: выписка скачивается заново, только если изменились
+# регистрационные данные в результате поиска или закэшированная выписка старше EGRUL_PROBE_MAX_AGE
+EGRUL_PROBE_ENABLED = os.getenv('EGRUL_PROBE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+EGRUL_PROBE_MAX_AGE = int(os.getenv('EGRUL_PROBE_MAX_AGE', 7 * 24 * 60 * 60))  # в секундах
+
+# Общий ограничитель обращений к ЕГРЮЛ (темп в ИНН в минуту, регулируется по AIMD)
+EGRUL_RATE_INITIAL = float(os.getenv('EGRUL_RATE_INITIAL', 10))
+EGRUL_RATE_MIN = float(os.getenv('EGRUL_RATE_MIN', 1))
+EGRUL_RATE_MAX = float(os.getenv('EGRUL_RATE_MAX', 60))
+EGRUL_RATE_INCREASE = float(os.getenv('EGRUL_RATE_INCREASE', 0.5))  # прибавка за каждую успешную выписку
+EGRUL_RATE_DECREASE = float(os.getenv('EGRUL_RATE_DECREASE', 0.5))  # множитель при признаках перегрузки
+EGRUL_RATE_BURST = int(os.getenv('EGRUL_RATE_BURST', 2))
+# Автоматический выключатель: пауза всех потоков после серии неудач подряд
+EGRUL_BREAKER_THRESHOLD = int(os.getenv('EGRUL_BREAKER_THRESHOLD', 5))
+EGRUL_BREAKER_COOLDOWN = int(os.getenv('EGRUL_BREAKER_COOLDOWN', 60))  # в секундах
+EGRUL_BREAKER_MAX_COOLDOWN = int(os.getenv('EGRUL_BREAKER_MAX_COOLDOWN', 900))  # в секундах
+
+# Настройки конвейера обработки: число потоков каждой стадии и размер очередей между ними
+PIPELINE_FETCH_WORKERS = int(os.getenv('PIPELINE_FETCH_WORKERS', 1))
+PIPELINE_EXTRACT_WORKERS = int(os.getenv('PIPELINE_EXTRACT_WORKERS', 2))
+PIPELINE_DIFF_WORKERS = int(os.getenv('PIPELINE_DIFF_WORKERS', 1))
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 8))
+
+# Распределенная обработка (coordinator.py): координатор делит список ИНН на порции с арендой,
+# узлы обработки (python cli.py worker) получают и разбирают выписки, а запись в таблицу выполняет координатор
+COORDINATOR_ENABLED = os.getenv('COORDINATOR_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# По умолчанию координатор доступен только локально; на другом адресе (например 0.0.0.0) нужен COORDINATOR_TOKEN
+COORDINATOR_HOST = os.getenv('COORDINATOR_HOST', '127.0.0.1')
+COORDINATOR_PORT = int(os.getenv('COORDINATOR_PORT', 8090))
+COORDINATOR_URL = os.getenv('COORDINATOR_URL', 'http://127.0.0.1:8090')  # адрес координатора для узлов
+COORDINATOR_TOKEN = os.getenv('COORDINATOR_TOKEN')  # общий секрет узлов и координатора (заголовок X-Coordinator-Token)
+COORDINATOR_DB_PATH = os.getenv('COORDINATOR_DB_PATH', os.path.join(BASE_DIR, 'work_queue.sqlite'))
+SHARD_UNIT_SIZE = int(os.getenv('SHARD_UNIT_SIZE', 25))  # ИНН в одной порции
+SHARD_LEASE_SECONDS = int(os.getenv('SHARD_LEASE_SECONDS', 300))  # аренда порции без продления узлом
+SHARD_MAX_ATTEMPTS = int(os.getenv('SHARD_MAX_ATTEMPTS', 3))  # выдач порции, после которых ее ИНН считаются ошибкой
+WORKER_THREADS = int(os.getenv('WORKER_THREADS', 1))  # потоков загрузки на узле, у каждого свой парсер
+WORKER_POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', 5))  # пауза узла без работы, сек
+
+# Метрики стадий обработки: гистограммы длительностей, трассы ИНН и отчет по итогам прогона
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))  # HTTP /metrics в формате Prometheus, 0 - выключено
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')  # для сбора с другой машины - 0.0.0.0
+METRICS_SAMPLE_SIZE = int(os.getenv('METRICS_SAMPLE_SIZE', 10000))  # значений на стадию для перцентилей
+METRICS_TRACE_LIMIT = int(os.getenv('METRICS_TRACE_LIMIT', 10000))  # ИНН с трассой за прогон
+METRICS_KEEP = int(os.getenv('METRICS_KEEP', 20))  # сколько отчетов хранить
 
 # Настройки логирования
 LOG_FILE = os.path.join(BASE_DIR, 'parcer_inn.log')
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text или json (одна запись JSON в строке, с полями inn и stage)
 
 # Настройки планировщика
-UPDATE_TIME = os.getenv('UPDATE_TIME', "00:00")  # Время ежедневного обновления
+UPDATE_TIME = os.getenv('UPDATE_TIME', "00:00")  # Время ежедневного обновления (режим daily)
+# continuous - непрерывная проверка по очереди приоритетов, daily - весь список раз в сутки в UPDATE_TIME
+SCHEDULER_MODE = os.getenv('SCHEDULER_MODE', 'continuous')
+SCHEDULER_WINDOW = int(os.getenv('SCHEDULER_WINDOW', 24 * 60 * 60))  # каждая компания проверяется не реже, сек
+SCHEDULER_TICK = int(os.getenv('SCHEDULER_TICK', 300))  # период обработки очередной порции, сек
+SCHEDULER_REFRESH_INTERVAL = int(os.getenv('SCHEDULER_REFRESH_INTERVAL', 900))  # перечитывание списка ИНН, сек
+SCHEDULER_CHANGED_DAYS = int(os.getenv('SCHEDULER_CHANGED_DAYS', 30))  # изменения моложе - повышенный приоритет
+SCHEDULER_CHANGED_FACTOR = float(os.getenv('SCHEDULER_CHANGED_FACTOR', 4))  # во сколько раз чаще проверять
 
 # Настройки колонок в Google Sheets
 COLUMN_INN = 'A'
@@ -44,12 +176,14 @@ PROXY = os.getenv('PROXY_URL')
 def get_project_path(relative_path):
     return os.path.abspath(os.path.join(BASE_DIR, relative_path))
 
-# Проверка наличия критически важных настроек
-if not SHEET_ID:
-    raise ValueError("GOOGLE_SHEET_ID не установлен. Пожалуйста, добавьте его в файл .env")
+# Проверка наличия критически важных настроек. Вызывается перед работой с таблицей, а не при импорте,
+# чтобы команды без Google Sheets (разбор PDF, получение выписки) запускались без этих настроек
+def validate_config():
+    if not SHEET_ID:
+        raise ValueError("GOOGLE_SHEET_ID не установлен. Пожалуйста, добавьте его в файл .env")
 
-if not os.path.exists(CREDENTIALS_FILE):
-    raise FileNotFoundError(f"Файл credentials.json не найден по пути {CREDENTIALS_FILE}")
+    if not SHEETS_API_ENDPOINT and not os.path.exists(CREDENTIALS_FILE):
+        raise FileNotFoundError(f"Файл credentials.json не найден по пути {CREDENTIALS_FILE}")
 
 # Создание директории для загрузки PDF, если она не существует
 if not os.path.exists(PDF_DOWNLOAD_PATH):
@@ -0,0 +1,435 @@
+import os
+import json
+import time
+import queue
+import socket
+import ipaddress
+import sqlite3
+import logging
+import threading
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from logger import log_context
+from metrics import span
+from config import COORDINATOR_ENABLED, COORDINATOR_HOST, COORDINATOR_PORT, COORDINATOR_URL, COORDINATOR_TOKEN, \
+    COORDINATOR_DB_PATH, SHARD_UNIT_SIZE, SHARD_LEASE_SECONDS, SHARD_MAX_ATTEMPTS, WORKER_THREADS, \
+    WORKER_POLL_INTERVAL, TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'X-Coordinator-Token'
+
+
+class WorkQueue:
+    """
+    Очередь порций ИНН с арендой в SQLite.
+
+    Порция выдается узлу на lease_seconds; узел продлевает аренду, пока обрабатывает ее.
+    Порция с истекшей арендой снова становится доступной, а после max_attempts выдач
+    считается неудачной. Очередь переживает перезапуск координатора.
+    """
+
+    def __init__(self, db_path=COORDINATOR_DB_PATH, lease_seconds=SHARD_LEASE_SECONDS,
+                 max_attempts=SHARD_MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS units (
+                id INTEGER PRIMARY KEY,
+                run_id INTEGER NOT NULL,
+                inns TEXT NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                results TEXT,
+                finished_at REAL,
+                collected INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS units_state ON units (state, id);
+        ''')
+        self._conn.commit()
+
+    def add_run(self, inn_list, unit_size=SHARD_UNIT_SIZE) -> int:
+        """
+        Делит список ИНН на порции нового прогона. Невыполненные порции прежних прогонов
+        отменяются, чтобы узлы не обрабатывали устаревший список.
+
+        :return: номер прогона
+        """
+        with self._lock:
+            run_id = (self._conn.execute('SELECT MAX(run_id) FROM units').fetchone()[0] or 0) + 1
+            self._conn.execute("UPDATE units SET state = 'cancelled' WHERE state IN ('pending', 'leased')")
+            self._conn.executemany(
+                "INSERT INTO units (run_id, inns, state) VALUES (?, ?, 'pending')",
+                [(run_id, json.dumps(inn_list[i:i + unit_size])) for i in range(0, len(inn_list), unit_size)]
+            )
+            self._conn.commit()
+        return run_id
+
+    def claim(self, worker) -> Optional[Dict]:
+        """Выдает узлу следующую свободную порцию или None, если выдавать нечего."""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            row = self._conn.execute(
+                "SELECT id, inns, attempts FROM units WHERE state = 'pending' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            unit_id, inns, attempts = row
+            self._conn.execute(
+                "UPDATE units SET state = 'leased', worker = ?, lease_expires = ?, attempts = ? WHERE id = ?",
+                (worker, now + self.lease_seconds, attempts + 1, unit_id))
+            self._conn.commit()
+        return {'id': unit_id, 'inns': json.loads(inns), 'lease_seconds': self.lease_seconds}
+
+    def heartbeat(self, unit_id, worker) -> bool:
+        """Продлевает аренду; False, если порция больше не принадлежит узлу."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE units SET lease_expires = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+                (time.time() + self.lease_seconds, unit_id, worker))
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def complete(self, unit_id, worker, results: List[Dict]) -> bool:
+        """
+        Сохраняет результаты порции. Принимается первый результат, в том числе от узла,
+        чья аренда уже истекла: данные от этого не хуже, а повторная обработка не нужна.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE units SET state = 'done', worker = ?, results = ?, finished_at = ? "
+                "WHERE id = ? AND state IN ('pending', 'leased')",
+                (worker, json.dumps(results, ensure_ascii=False), time.time(), unit_id))
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def expire(self):
+        with self._lock:
+            self._expire(time.time())
+
+    def _expire(self, now):
+        """Возвращает в очередь порции с истекшей арендой. Вызывается под блокировкой."""
+        expired = self._conn.execute(
+            "SELECT id, worker, attempts FROM units WHERE state = 'leased' AND lease_expires < ?", (now,)).fetchall()
+        for unit_id, worker, attempts in expired:
+            if attempts >= self.max_attempts:
+                logger.error("Unit %s lease expired on %s after %s attempts, giving up", unit_id, worker, attempts)
+                self._conn.execute("UPDATE units SET state = 'failed', finished_at = ? WHERE id = ?", (now, unit_id))
+            else:
+                logger.warning("Unit %s lease expired on %s, returning it to the queue", unit_id, worker)
+                self._conn.execute("UPDATE units SET state = 'pending', worker = NULL WHERE id = ?", (unit_id,))
+        if expired:
+            self._conn.commit()
+
+    def collect(self, run_id) -> List[Tuple[List[str], Optional[List[Dict]]]]:
+        """
+        Забирает завершенные и неудачные порции прогона, которые еще не забирались.
+
+        :return: список (ИНН порции, результаты или None для неудачной порции)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, inns, state, results FROM units WHERE run_id = ? AND state IN ('done', 'failed') "
+                "AND collected = 0 ORDER BY id", (run_id,)).fetchall()
+            if rows:
+                self._conn.executemany('UPDATE units SET collected = 1 WHERE id = ?', [(row[0],) for row in rows])
+                self._conn.commit()
+        return [(json.loads(inns), json.loads(results) if state == 'done' else None)
+                for _, inns, state, results in rows]
+
+    def status(self, run_id=None) -> Dict:
+        with self._lock:
+            if run_id is None:
+                run_id = self._conn.execute('SELECT MAX(run_id) FROM units').fetchone()[0]
+            rows = self._conn.execute(
+                'SELECT state, COUNT(*) FROM units WHERE run_id = ? GROUP BY state', (run_id,)).fetchall()
+            workers = self._conn.execute(
+                "SELECT worker, COUNT(*) FROM units WHERE run_id = ? AND state = 'leased' GROUP BY worker",
+                (run_id,)).fetchall()
+        return {'run_id': run_id, 'units': dict(rows), 'workers': dict(workers)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Coordinator:
+    """
+    Координатор распределенной обработки: раздает порции ИНН узлам по HTTP (JSON)
+    и отдает их результаты конвейеру, который сравнивает данные и пишет в таблицу
+    из одного процесса (Pipeline(coordinator=...)).
+    """
+
+    def __init__(self, work_queue: WorkQueue, unit_size=SHARD_UNIT_SIZE, token=COORDINATOR_TOKEN):
+        self.work_queue = work_queue
+        self.unit_size = unit_size
+        self.token = token
+        self.server = None
+        self._changed = threading.Event()
+
+    def start(self, host=COORDINATOR_HOST, port=COORDINATOR_PORT):
+        """
+        Запускает HTTP-сервер для узлов в фоновом потоке.
+
+        :raises ValueError: адрес доступен не только локально, а токен не задан - иначе любой узел сети
+            мог бы прислать через /complete произвольные данные участников, которые попадут в таблицу
+        """
+        if not self.token and not _is_loopback(host):
+            raise ValueError(f"COORDINATOR_TOKEN обязателен, если координатор слушает не только localhost: {host}")
+        self.server = ThreadingHTTPServer((host, port), make_handler(self))
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever, name='coordinator-server', daemon=True)
+        thread.start()
+        logger.info("Coordinator listening on http://%s:%s", self.server.server_address[0],
+                    self.server.server_address[1])
+        return self.server
+
+    def notify(self):
+        self._changed.set()
+
+    def run(self, inn_list, progress_interval=60) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        Ставит список ИНН в очередь и отдает результаты по мере того, как узлы завершают порции.
+
+        :return: итератор (ИНН, данные выписки или None, если ИНН обработать не удалось)
+        """
+        run_id = self.work_queue.add_run(list(inn_list), self.unit_size)
+        logger.info("Run %s: %s INNs queued in units of %s", run_id, len(inn_list), self.unit_size)
+        last_progress = time.monotonic()
+        while True:
+            self._changed.clear()
+            # Состояние читается до collect: если все порции уже завершены, collect заберет
+            # их все, включая завершенные, пока потребитель обрабатывал прошлые результаты
+            status = self.work_queue.status(run_id)
+            finished = not status['units'].get('pending') and not status['units'].get('leased')
+            for inns, results in self.work_queue.collect(run_id):
+                if results is None:
+                    for inn in inns:
+                        yield inn, None
+                    continue
+                for result in results:
+                    yield result['inn'], result.get('data')
+
+            if finished:
+                logger.info("Run %s finished: %s", run_id, status['units'])
+                return
+            if time.monotonic() - last_progress >= progress_interval:
+                logger.info("Run %s progress: %s", run_id, status)
+                last_progress = time.monotonic()
+            # Истекшие аренды проверяются и без обращений узлов, чтобы неудачные порции не задерживали прогон
+            if not self._changed.wait(1.0):
+                self.work_queue.expire()
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+        self.work_queue.close()
+
+
+def _is_loopback(host) -> bool:
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def make_handler(coordinator: Coordinator):
+    work_queue = coordinator.work_queue
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            logger.debug("%s %s", self.address_string(), format % args)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/status':
+                if self._authorized():
+                    self._send_json(work_queue.status())
+            else:
+                self._send_json({'error': 'not found'}, status=404)
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+                worker = request['worker']
+                if self.path == '/claim':
+                    self._send_json({'unit': work_queue.claim(worker)})
+                elif self.path == '/heartbeat':
+                    self._send_json({'ok': work_queue.heartbeat(request['unit'], worker)})
+                elif self.path == '/complete':
+                    accepted = work_queue.complete(request['unit'], worker, request['results'])
+                    if accepted:
+                        coordinator.notify()
+                    self._send_json({'ok': accepted})
+                else:
+                    self._send_json({'error': 'not found'}, status=404)
+            except (ValueError, KeyError) as e:
+                self._send_json({'error': f'bad request: {e}'}, status=400)
+
+        def _authorized(self):
+            if coordinator.token and self.headers.get(TOKEN_HEADER) != coordinator.token:
+                self._send_json({'error': 'forbidden'}, status=403)
+                return False
+            return True
+
+        def _send_json(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+class Worker:
+    """
+    Узел обработки: получает порции ИНН у координатора, скачивает и разбирает выписки
+    и возвращает разобранные данные. Доступ к таблице узлу не нужен.
+
+    :param parser_factory: функция без аргументов, создающая парсер ЕГРЮЛ; каждый поток получает свой
+    :param threads: сколько ИНН порции обрабатывается одновременно
+    """
+
+    def __init__(self, parser_factory: Callable, pdf_extractor, coordinator_url=COORDINATOR_URL,
+                 threads=WORKER_THREADS, name=None, token=COORDINATOR_TOKEN, poll_interval=WORKER_POLL_INTERVAL):
+        self.parser_factory = parser_factory
+        self.pdf_extractor = pdf_extractor
+        self.url = coordinator_url.rstrip('/')
+        self.threads = max(1, threads)
+        self.name = name or f'{socket.gethostname()}-{os.getpid()}'
+        self.poll_interval = poll_interval
+        self.session = requests.Session()
+        if token:
+            self.session.headers[TOKEN_HEADER] = token
+        self._parsers = queue.LifoQueue()
+        self.stats = {'units': 0, 'inns': 0, 'failed': 0, 'lost_units': 0}
+
+    def _post(self, path, **payload):
+        payload['worker'] = self.name
+        response = self.session.post(self.url + path, json=payload, timeout=TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def run(self, exit_when_idle=False):
+        """Обрабатывает порции, пока координатор их выдает; без exit_when_idle ждет новые прогоны."""
+        logger.info("Worker %s polling %s", self.name, self.url)
+        try:
+            while True:
+                try:
+                    unit = self._post('/claim')['unit']
+                except Exception as e:
+                    logger.warning("Coordinator is unavailable: %s", e)
+                    unit = None
+                if unit is None:
+                    if exit_when_idle:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                self.process_unit(unit)
+        finally:
+            self.close()
+        return self.stats
+
+    def process_unit(self, unit):
+        from concurrent.futures import ThreadPoolExecutor
+
+        logger.info("Claimed unit %s with %s INNs", unit['id'], len(unit['inns']))
+        lost = threading.Event()
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(unit, stop, lost),
+                                     name=f"heartbeat-{unit['id']}", daemon=True)
+        heartbeat.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                results = list(executor.map(lambda inn: self._process_inn(inn, lost), unit['inns']))
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        if lost.is_set():
+            self.stats['lost_units'] += 1
+            logger.warning("Unit %s was reassigned, dropping its results", unit['id'])
+            return
+        self.stats['units'] += 1
+        self.stats['inns'] += len(results)
+        self.stats['failed'] += sum(1 for result in results if result['data'] is None)
+        try:
+            if not self._post('/complete', unit=unit['id'], results=results)['ok']:
+                logger.warning("Coordinator already has results for unit %s", unit['id'])
+        except Exception as e:
+            # Аренда истечет, и порцию обработает другой узел
+            logger.error("Failed to report unit %s: %s", unit['id'], e)
+
+    def _process_inn(self, inn, lost) -> Dict:
+        if lost.is_set():
+            return {'inn': inn, 'data': None}
+        try:
+            parser = self._parsers.get_nowait()
+        except queue.Empty:
+            try:
+                parser = self.parser_factory()
+            except Exception as e:
+                logger.error("Failed to create EGRUL parser: %s", e, exc_info=True)
+                return {'inn': inn, 'data': None}
+        try:
+            with log_context(inn=inn, stage='fetch'), span('pipeline.fetch', inn):
+                pdf_file = parser.get_pdf(inn)
+            if not pdf_file:
+                logger.warning("Failed to get PDF for INN: %s", inn)
+                return {'inn': inn, 'data': None}
+            with log_context(inn=inn, stage='extract'), span('pipeline.extract', inn):
+                data = self.pdf_extractor.extract_data(pdf_file, include_full_text=False)
+            return {'inn': inn, 'data': data}
+        except Exception as e:
+            logger.error("Error processing INN %s: %s", inn, e, exc_info=True)
+            return {'inn': inn, 'data': None}
+        finally:
+            self._parsers.put(parser)
+
+    def _heartbeat(self, unit, stop, lost):
+        interval = max(1.0, unit['lease_seconds'] / 3)
+        while not stop.wait(interval):
+            try:
+                if not self._post('/heartbeat', unit=unit['id'])['ok']:
+                    lost.set()
+                    return
+            except Exception as e:
+                logger.warning("Heartbeat for unit %s failed: %s", unit['id'], e)
+
+    def close(self):
+        while not self._parsers.empty():
+            parser = self._parsers.get_nowait()
+            if hasattr(parser, 'close'):
+                parser.close()
+        self.session.close()
+
+
+_coordinator = None
+_coordinator_lock = threading.Lock()
+
+
+def get_coordinator():
+    """Возвращает общий для процесса координатор с запущенным сервером или None, если режим отключен."""
+    global _coordinator
+    if not COORDINATOR_ENABLED:
+        return None
+    with _coordinator_lock:
+        if _coordinator is None:
+            _coordinator = Coordinator(WorkQueue())
+            _coordinator.start()
+        return _coordinator
@@ -1,48 +1,254 @@
 import logging
+from array import array
+from bisect import bisect_left
 from datetime import datetime
-from typing import Dict, List, Tuple, Set
+from typing import Dict, Iterator, List, Tuple, Set
+from state_store import founder_key, parse_founder_string, compute_fingerprint
+from metrics import span
 
 logger = logging.getLogger(__name__)
 
 
+# Пара (компания, участник) упаковывается в одно число: индекс компании в старших 32 битах
+_COMPANY_SHIFT = 32
+_FOUNDER_MASK = (1 << _COMPANY_SHIFT) - 1
+
+
+class ChangeSet:
+    """
+    Изменения участников по всему портфелю, результат DataProcessor.process_many.
+
+    Участники хранятся как целочисленные идентификаторы в отсортированных массивах
+    упакованных пар (компания, участник), поэтому изменения каждой компании - это
+    непрерывный отрезок массива. Идентификаторы и строки участников свои у каждой компании,
+    чтобы написание участника в строке компании не зависело от других компаний.
+    """
+    __slots__ = ('inns', 'names', 'change_dates', 'labels', 'added', 'removed', 'unchanged', 'current_date')
+
+    def __init__(self, inns, names, change_dates, labels, added, removed, unchanged, current_date):
+        self.inns: List[str] = inns
+        self.names: List[str] = names
+        self.change_dates: List[str] = change_dates
+        self.labels: List[List[str]] = labels  # компания -> идентификатор участника -> строка для таблицы
+        self.added: array = added
+        self.removed: array = removed
+        self.unchanged: array = unchanged
+        self.current_date = current_date
+
+    def __len__(self):
+        return len(self.inns)
+
+    def _groups(self, codes) -> Dict[int, List[int]]:
+        groups = {}
+        for code in codes:
+            groups.setdefault(code >> _COMPANY_SHIFT, []).append(code & _FOUNDER_MASK)
+        return groups
+
+    def changed_indices(self) -> List[int]:
+        changed = {code >> _COMPANY_SHIFT for code in self.added} | {code >> _COMPANY_SHIFT for code in self.removed}
+        return sorted(changed)
+
+    def changed_companies(self) -> List[str]:
+        return [self.inns[index] for index in self.changed_indices()]
+
+    def founders(self, inn) -> Dict[str, List[str]]:
+        """Участники одной компании: added, removed, unchanged."""
+        index = self.inns.index(inn)
+        low, high = index << _COMPANY_SHIFT, (index + 1) << _COMPANY_SHIFT
+        result = {}
+        for kind in ('added', 'removed', 'unchanged'):
+            codes = getattr(self, kind)
+            start, end = bisect_left(codes, low), bisect_left(codes, high)
+            result[kind] = [self.labels[index][code & _FOUNDER_MASK] for code in codes[start:end]]
+        return result
+
+    def iter_updates(self) -> Iterator[Tuple[str, Dict]]:
+        """Строки для записи в таблицу в формате DataProcessor.process."""
+        added = self._groups(self.added)
+        removed = self._groups(self.removed)
+        unchanged = self._groups(self.unchanged)
+        for index, inn in enumerate(self.inns):
+            current = added.get(index, []) + unchanged.get(index, [])
+            former = removed.get(index, [])
+            changed = index in added or index in removed
+            labels = self.labels[index]
+            yield inn, {
+                'name': self.names[index],
+                'current_founders': ', '.join(sorted(labels[i] for i in current)),
+                'former_founders': ', '.join(sorted(labels[i] for i in former)),
+                'change_date': self.current_date if changed else self.change_dates[index],
+            }
+
+    def summary(self) -> Dict[str, int]:
+        return {'companies': len(self.inns), 'changed': len(self.changed_companies()),
+                'added': len(self.added), 'removed': len(self.removed), 'unchanged': len(self.unchanged)}
+
+
+def _merge_sorted(current, new) -> Tuple[array, array, array]:
+    """Один проход по двум отсортированным массивам: (добавленные, удаленные, без изменений)."""
+    added, removed, unchanged = array('q'), array('q'), array('q')
+    i = j = 0
+    len_current, len_new = len(current), len(new)
+    while i < len_current and j < len_new:
+        a, b = current[i], new[j]
+        if a == b:
+            unchanged.append(a)
+            i += 1
+            j += 1
+        elif a < b:
+            removed.append(a)
+            i += 1
+        else:
+            added.append(b)
+            j += 1
+    removed.extend(current[i:])
+    added.extend(new[j:])
+    return added, removed, unchanged
+
+
 class DataProcessor:
-    def __init__(self):
+    def __init__(self, state_store=None, founder_index=None):
         self.current_date = datetime.now().strftime("%d.%m.%Y")
+        self.state_store = state_store
+        self.founder_index = founder_index
 
     def process(self, inn: str, pdf_data: Dict, current_data: Dict) -> Dict:
         try:
-            logger.info(f"Processing data for INN: {inn}")
+            with span('diff.process', inn):
+                logger.info("Processing data for INN: %s", inn)
 
-            new_founders = self._parse_founders(pdf_data.get('founders', []))
-            current_founders = self._parse_founders(current_data.get('current_founders', ''))
-            former_founders = self._parse_founders(current_data.get('former_founders', ''))
+                new_founders = self._parse_founders(pdf_data.get('founders', []))
+                current_founders = self._stored_founders(inn)
+                if current_founders is None:
+                    current_founders = self._parse_founders(current_data.get('current_founders', ''))
 
-            added_founders, removed_founders = self._compare_founders(current_founders, new_founders)
+                added_founders, removed_founders = self._compare_founders(current_founders, new_founders)
 
-            updated_data = {
-                'name': pdf_data.get('short_name', current_data.get('name', '')),
-                'current_founders': self._format_founders(new_founders),
-                'former_founders': self._format_founders(removed_founders),
-                'change_date': self.current_date if (added_founders or removed_founders) else current_data.get('change_date', '')
-            }
+                updated_data = {
+                    'name': pdf_data.get('short_name', current_data.get('name', '')),
+                    'current_founders': self._format_founders(new_founders),
+                    'former_founders': self._format_founders({key: current_founders[key] for key in removed_founders}),
+                    'change_date': self.current_date if (added_founders or removed_founders) else current_data.get('change_date', '')
+                }
 
-            logger.info(f"Processed data for INN {inn}: {updated_data}")
-            return updated_data
+                logger.debug("Processed data for INN %s: %s", inn, updated_data)
+                return updated_data
         except Exception as e:
-            logger.error(f"Error processing data for INN {inn}: {str(e)}", exc_info=True)
+            logger.error("Error processing data for INN %s: %s", inn, e, exc_info=True)
             return current_data
 
-    def _parse_founders(self, founders_data) -> Set[str]:
+    def process_many(self, records: Dict[str, Dict], current_rows: Dict[str, Dict]) -> ChangeSet:
+        """
+        Сравнивает участников всех компаний прогона за один проход. Строки результата совпадают
+        со строками process для каждой компании.
+
+        Пакетный путь для сравнения целого портфеля, когда все выписки уже разобраны (бенчмарк,
+        GoogleSheetsHandler.write_changes); конвейер сравнивает компании по одной через process.
+
+        :param records: ИНН -> результат PDFExtractor.extract_data
+        :param current_rows: ИНН -> текущая строка таблицы (GoogleSheetsHandler.get_company_data)
+        :return: ChangeSet с добавленными, удаленными и неизменными участниками
+        """
+        labels: List[List[str]] = []
+
+        def intern(ids, company_labels, founders):
+            result = []
+            for key, label in founders.items():
+                founder_id = ids.get(key)
+                if founder_id is None:
+                    founder_id = ids[key] = len(company_labels)
+                    company_labels.append(label)
+                result.append(founder_id)
+            return result
+
+        inns, names, change_dates = [], [], []
+        current_codes, new_codes = [], []
+        for index, (inn, pdf_data) in enumerate(records.items()):
+            current_data = current_rows.get(inn) or {}
+            inns.append(inn)
+            names.append(pdf_data.get('short_name', current_data.get('name', '')))
+            change_dates.append(current_data.get('change_date', ''))
+
+            # Сначала новые участники, чтобы в таблицу попадало написание из выписки
+            new_founders = self._parse_founders(pdf_data.get('founders', []))
+            current_founders = self._stored_founders(inn)
+            if current_founders is None:
+                current_founders = self._parse_founders(current_data.get('current_founders', ''))
+
+            ids: Dict[str, int] = {}
+            company_labels: List[str] = []
+            labels.append(company_labels)
+            base = index << _COMPANY_SHIFT
+            new_codes.extend(base | founder_id for founder_id in intern(ids, company_labels, new_founders))
+            current_codes.extend(base | founder_id for founder_id in intern(ids, company_labels, current_founders))
+
+        added, removed, unchanged = _merge_sorted(array('q', sorted(current_codes)), array('q', sorted(new_codes)))
+        change_set = ChangeSet(inns, names, change_dates, labels, added, removed, unchanged, self.current_date)
+
+        # Индекс участников обновляется только для изменившихся компаний
+        if self.founder_index is not None:
+            for index in change_set.changed_indices():
+                self.index_founders(inns[index], names[index], records[inns[index]].get('founders', []))
+
+        logger.info("Processed %s companies in batch: %s", len(inns), change_set.summary())
+        return change_set
+
+    def state_for(self, pdf_data: Dict) -> Tuple[str, str, List[Tuple[str, str]]]:
+        """Возвращает (отпечаток, наименование, участники) для сохранения в хранилище состояния."""
+        name = pdf_data.get('short_name', '')
+        founders = [(founder['name'], founder['inn']) for founder in pdf_data.get('founders', [])]
+        return compute_fingerprint(name, founders), name, founders
+
+    def is_unchanged(self, inn: str, pdf_data: Dict) -> bool:
+        """Проверяет, совпадает ли выписка с состоянием последнего успешного прогона."""
+        if self.state_store is None:
+            return False
+        fingerprint, _, _ = self.state_for(pdf_data)
+        return self.state_store.get_fingerprint(inn) == fingerprint
+
+    def index_founders(self, inn, name, founders):
+        """
+        Обновляет индекс участников по выписке компании. process этого не делает: конвейер
+        вызывает метод только после подтвержденной записи строки (Pipeline._on_rows_written).
+        """
+        if self.founder_index is None:
+            return
+        # Ошибка индекса не должна мешать обновлению таблицы
+        try:
+            self.founder_index.update_company(inn, name, founders)
+        except Exception as e:
+            logger.error("Error updating founder index for INN %s: %s", inn, e, exc_info=True)
+
+    def _stored_founders(self, inn):
+        if self.state_store is None:
+            return None
+        stored = self.state_store.get_founders(inn)
+        if stored is None:
+            return None
+        return {key: ' '.join(filter(None, [name, founder_inn])) for key, (name, founder_inn) in stored.items()}
+
+    def _parse_founders(self, founders_data) -> Dict[str, str]:
+        """Возвращает участников в виде: нормализованный ключ -> строка для таблицы."""
         if isinstance(founders_data, list):
-            return set(f"{founder['name']} {founder['inn']}" for founder in founders_data)
+            # У иностранных участников ИНН может отсутствовать
+            return {
+                founder_key(founder['name'], founder['inn']): ' '.join(filter(None, [founder['name'], founder['inn']]))
+                for founder in founders_data
+            }
         elif isinstance(founders_data, str):
-            return set(founder.strip() for founder in founders_data.split(',') if founder.strip())
-        return set()
+            # В ячейках встречаются переводы строк и даты после ИНН; участник сравнивается по ключу
+            founders = {}
+            for founder in founders_data.split(','):
+                if founder.strip():
+                    name, inn = parse_founder_string(founder)
+                    founders[founder_key(name, inn)] = ' '.join(founder.split())
+            return founders
+        return {}
 
-    def _format_founders(self, founders: Set[str]) -> str:
-        return ', '.join(sorted(founders))
+    def _format_founders(self, founders: Dict[str, str]) -> str:
+        return ', '.join(sorted(founders.values()))
 
-    def _compare_founders(self, current: Set[str], new: Set[str]) -> Tuple[Set[str], Set[str]]:
-        added = new - current
-        removed = current - new
-        return added, removed
\ No newline at end of file
+    def _compare_founders(self, current: Dict[str, str], new: Dict[str, str]) -> Tuple[Set[str], Set[str]]:
+        added = new.keys() - current.keys()
+        removed = current.keys() - new.keys()
+        return added, removed
@@ -0,0 +1,63 @@
+import os
+import time
+import fnmatch
+import logging
+from config import DOWNLOAD_TIMEOUT, DOWNLOAD_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Временные файлы, которые Chrome создает во время скачивания
+PARTIAL_SUFFIXES = ('.crdownload', '.tmp', '.part')
+
+
+class DownloadTimeout(Exception):
+    """Файл не появился в директории загрузки за отведенное время."""
+
+
+def _is_complete_pdf(path):
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            if f.read(5) != b'%PDF-':
+                return False
+            f.seek(max(0, size - 1024))
+            return b'%%EOF' in f.read()
+    except OSError:
+        return False
+
+
+def wait_for_download(directory, pattern='*.pdf', timeout=DOWNLOAD_TIMEOUT, poll_interval=DOWNLOAD_POLL_INTERVAL):
+    """
+    Ждет появления полностью скачанного файла в директории и возвращает путь к нему.
+
+    Файл считается готовым, когда в директории нет незавершенных загрузок (.crdownload),
+    его размер не изменился между двумя опросами и он является целым PDF.
+    Директория должна принадлежать одному запросу, иначе можно получить чужой файл.
+
+    :raises DownloadTimeout: если файл не появился за timeout секунд
+    """
+    deadline = time.monotonic() + timeout
+    last_sizes = {}
+
+    while True:
+        try:
+            entries = [entry for entry in os.scandir(directory) if entry.is_file()]
+        except FileNotFoundError:
+            entries = []
+
+        has_partial = any(entry.name.endswith(PARTIAL_SUFFIXES) for entry in entries)
+        sizes = {
+            entry.path: entry.stat().st_size
+            for entry in entries
+            if fnmatch.fnmatch(entry.name, pattern) and not entry.name.endswith(PARTIAL_SUFFIXES)
+        }
+
+        if not has_partial:
+            for path, size in sizes.items():
+                if size > 0 and last_sizes.get(path) == size and _is_complete_pdf(path):
+                    return path
+        last_sizes = sizes
+
+        if time.monotonic() > deadline:
+            raise DownloadTimeout(f"Файл {pattern} не появился в {directory} за {timeout} с")
+        time.sleep(poll_interval)
@@ -0,0 +1,220 @@
+import os
+import atexit
+import queue
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import WebDriverException
+from webdriver_manager.chrome import ChromeDriverManager
+from config import USER_AGENT, DRIVER_POOL_SIZE, DRIVER_MAX_USES, CHROME_HEADLESS, CHROMEDRIVER_PATH, \
+    CHROMEDRIVER_CACHE_FILE
+
+logger = logging.getLogger(__name__)
+
+# Ресурсы страницы ЕГРЮЛ, которые не нужны для поиска и скачивания выписки.
+# Стили не блокируются: без них панели pnl-result/pnl-nodata видимы сразу, и ожидание
+# результатов поиска (wait_for_search_results) срабатывало бы до их заполнения
+BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.ico', '*.webp',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+]
+
+
+def get_driver_path():
+    """
+    Возвращает путь к chromedriver.
+
+    webdriver_manager при каждом вызове install() проверяет версию по сети, поэтому путь
+    сохраняется в CHROMEDRIVER_CACHE_FILE и переиспользуется, пока файл драйвера существует.
+    """
+    if CHROMEDRIVER_PATH:
+        return CHROMEDRIVER_PATH
+
+    if os.path.exists(CHROMEDRIVER_CACHE_FILE):
+        with open(CHROMEDRIVER_CACHE_FILE, encoding='utf-8') as f:
+            cached_path = f.read().strip()
+        if cached_path and os.path.exists(cached_path):
+            return cached_path
+
+    driver_path = ChromeDriverManager().install()
+    with open(CHROMEDRIVER_CACHE_FILE, 'w', encoding='utf-8') as f:
+        f.write(driver_path)
+    logger.info("Chromedriver установлен и закэширован: %s", driver_path)
+    return driver_path
+
+
+class PooledDriver:
+    """Браузер из пула со своей директорией загрузок."""
+
+    def __init__(self, driver, download_dir):
+        self.driver = driver
+        self.download_dir = download_dir
+        self.uses = 0
+
+    def set_download_dir(self, path):
+        """Направляет загрузки браузера в указанную директорию."""
+        os.makedirs(path, exist_ok=True)
+        self.driver.execute_cdp_cmd('Page.setDownloadBehavior', {'behavior': 'allow', 'downloadPath': path})
+
+    def is_alive(self):
+        try:
+            self.driver.execute_script('return 1')
+            return True
+        except WebDriverException:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except WebDriverException as e:
+            logger.warning("Ошибка при закрытии браузера: %s", e)
+
+
+class DriverPool:
+    """
+    Пул headless-браузеров Chrome.
+
+    Браузеры создаются по мере необходимости, но не больше size, и возвращаются в пул после
+    каждой аренды. Браузер перезапускается после max_uses аренд или если он перестал отвечать.
+    """
+
+    def __init__(self, download_root, size=DRIVER_POOL_SIZE, max_uses=DRIVER_MAX_USES, headless=CHROME_HEADLESS):
+        self.download_root = download_root
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.headless = headless
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._driver_path = None
+
+    def _build_options(self):
+        options = Options()
+        options.add_argument(f'user-agent={USER_AGENT}')
+        if self.headless:
+            options.add_argument('--headless=new')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--disable-extensions')
+        options.add_argument('--window-size=1280,800')
+        options.add_argument('--blink-settings=imagesEnabled=false')
+
+        prefs = {
+            "download.prompt_for_download": False,
+            "download.directory_upgrade": True,
+            "safebrowsing.enabled": True,
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.fonts": 2,
+        }
+        options.add_experimental_option("prefs", prefs)
+        return options
+
+    def _start_driver(self):
+        if self._driver_path is None:
+            self._driver_path = get_driver_path()
+
+        with self._lock:
+            driver_id = self._next_id
+            self._next_id += 1
+        download_dir = os.path.join(self.download_root, f'worker-{driver_id}')
+        os.makedirs(download_dir, exist_ok=True)
+
+        driver = webdriver.Chrome(service=Service(self._driver_path), options=self._build_options())
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
+        pooled = PooledDriver(driver, download_dir)
+        pooled.set_download_dir(download_dir)
+        logger.info("Запущен браузер пула #%s", driver_id)
+        return pooled
+
+    def _acquire(self):
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._start_driver()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+
+            # Все браузеры заняты; ждем возврата или освобождения места после перезапуска
+            try:
+                return self._idle.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def _discard(self, pooled):
+        pooled.quit()
+        shutil.rmtree(pooled.download_dir, ignore_errors=True)
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def lease(self):
+        """Выдает браузер из пула на время блока with."""
+        if self._closed:
+            raise RuntimeError("Пул браузеров закрыт")
+
+        pooled = self._acquire()
+        pooled.uses += 1
+        try:
+            yield pooled
+        finally:
+            if self._closed:
+                self._discard(pooled)
+            elif pooled.uses >= self.max_uses:
+                logger.info("Браузер отработал %s выписок, перезапуск", pooled.uses)
+                self._discard(pooled)
+            elif not pooled.is_alive():
+                logger.warning("Браузер перестал отвечать, перезапуск")
+                self._discard(pooled)
+            else:
+                self._release(pooled)
+
+    def _release(self, pooled):
+        try:
+            pooled.set_download_dir(pooled.download_dir)
+        except WebDriverException:
+            logger.warning("Не удалось вернуть браузер в пул, перезапуск")
+            self._discard(pooled)
+            return
+        self._idle.put(pooled)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(pooled)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_driver_pool(download_root):
+    """Возвращает общий для процесса пул браузеров, создавая его при первом обращении."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool(download_root)
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,284 @@
+import os
+import time
+import tempfile
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from config import EGRUL_BASE_URL, EGRUL_POLL_INTERVAL, PDF_DOWNLOAD_PATH, MAX_RETRIES, TIMEOUT, USER_AGENT, PROXY
+from excerpt_cache import get_excerpt_cache
+from rate_limiter import get_rate_limiter, backoff_delay, TIMEOUT as SIGNAL_TIMEOUT, THROTTLED, ERROR
+from change_probe import get_change_probe, fingerprint_search_row
+from metrics import span, inc
+
+logger = logging.getLogger(__name__)
+
+
+class EgrulHttpError(Exception):
+    """Ошибка обмена с API сайта ЕГРЮЛ."""
+
+
+class EgrulHttpTimeout(EgrulHttpError):
+    """Сайт не подготовил результат поиска или выписку за отведенное время."""
+
+
+class EgrulThrottled(EgrulHttpError):
+    """Сайт ограничивает частоту запросов (HTTP 429/503 или капча)."""
+
+
+# Коды ответа, которыми сайт сообщает о перегрузке
+THROTTLE_STATUS_CODES = (429, 503)
+# Начало файла PDF; другой ответ (страница ограничения, HTML с ошибкой) выпиской не считается
+PDF_SIGNATURE = b'%PDF-'
+
+
+class EgrulHttpParser:
+    """
+    Получает выписки ЕГРЮЛ без браузера, напрямую через API, которое использует страница поиска:
+
+    POST /                       -> {"t": токен поиска}
+    GET  /search-result/{t}      -> {"rows": [{"t": токен строки, "i": ИНН, ...}]}
+    GET  /vyp-request/{t}        -> {"t": токен выписки}
+    GET  /vyp-status/{t}         -> {"status": "wait" | "ready"}
+    GET  /vyp-download/{t}       -> PDF
+    """
+
+    def __init__(self, base_url=EGRUL_BASE_URL, download_path=PDF_DOWNLOAD_PATH, excerpt_cache=None,
+                 rate_limiter=None, change_probe=None):
+        self.base_url = base_url.rstrip('/')
+        self.download_path = download_path
+        os.makedirs(self.download_path, exist_ok=True)
+        self.cache = excerpt_cache or get_excerpt_cache()
+        self.limiter = rate_limiter or get_rate_limiter()
+        self.probe = change_probe or get_change_probe()
+
+        # Одна сессия с пулом keep-alive соединений на весь прогон
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': USER_AGENT,
+            'X-Requested-With': 'XMLHttpRequest',
+            'Referer': f'{self.base_url}/index.html',
+        })
+        if PROXY:
+            self.session.proxies.update({'http': PROXY, 'https': PROXY})
+
+    def get_pdf(self, inn, max_age=None):
+        """:param max_age: наибольший допустимый возраст выписки из кэша в секундах (0 - скачать заново)"""
+        if self.cache is not None:
+            cached_path = self.cache.get_pdf(inn, max_age=max_age)
+            if cached_path:
+                inc('excerpts', source='cache')
+                return cached_path
+
+        row, fingerprint = None, None
+        if self.probe is not None:
+            found, row = self.probe_search(inn)
+            if found and row is None:
+                return None
+            if row is not None:
+                fingerprint = fingerprint_search_row(row)
+                cached_path = self.probe.cached_if_unchanged(inn, fingerprint, max_age)
+                if cached_path:
+                    self.limiter.mark_completed()
+                    inc('excerpts', source='probe')
+                    return cached_path
+
+        pdf_path = self._get_pdf(inn, row)
+        if pdf_path:
+            inc('excerpts', source='egrul')
+        if pdf_path and self.cache is not None:
+            self.cache.put_pdf(inn, pdf_path)
+            if fingerprint is not None:
+                self.probe.remember(inn, fingerprint)
+        return pdf_path
+
+    def probe_search(self, inn):
+        """
+        Поиск для пробы изменений.
+
+        :return: (поиск выполнен, строка результата или None); при ошибке - (False, None)
+        """
+        self.limiter.acquire()
+        try:
+            row = self.search(inn)
+            self.limiter.on_success(completed=row is None)
+            return True, row
+        except (requests.RequestException, EgrulHttpError, ValueError) as e:
+            logger.warning("Не удалось выполнить пробу для ИНН: %s. Ошибка: %s", inn, e)
+            self.limiter.on_failure(self._failure_kind(e))
+            return False, None
+
+    def _get_pdf(self, inn, row=None):
+        """:param row: строка результата поиска, если поиск уже выполнен пробой"""
+        for attempt in range(MAX_RETRIES):
+            if attempt:
+                inc('retries', stage='egrul')
+            self.limiter.acquire()
+            try:
+                logger.info("Попытка %s получить данные для ИНН: %s", attempt + 1, inn)
+                if row is None:
+                    row = self.search(inn)
+                if row is None:
+                    logger.warning("Результат для ИНН %s не найден", inn)
+                    self.limiter.on_success()
+                    return None
+
+                # Токен строки одноразовый: при повторе поиск выполняется заново
+                row_token, row = row.get('t'), None
+                if not row_token:
+                    raise EgrulHttpError(f"В результате поиска нет токена строки для ИНН {inn}")
+                with span('egrul.download', inn):
+                    token = self.request_excerpt(row_token)
+                    self.wait_for_excerpt(token)
+                    pdf_path = self.download_excerpt(token, inn)
+                logger.info("PDF успешно скачан: %s", pdf_path)
+                self.limiter.on_success()
+                return pdf_path
+
+            except (requests.RequestException, EgrulHttpError, ValueError) as e:
+                kind = self._failure_kind(e)
+                logger.warning("Ошибка при попытке получить данные для ИНН: %s (%s). Ошибка: %s", inn, kind, e)
+                self.limiter.on_failure(kind)
+                row = None
+
+            if attempt + 1 < MAX_RETRIES:
+                with span('egrul.backoff', inn):
+                    time.sleep(backoff_delay(attempt))
+
+        logger.error("Не удалось получить PDF для ИНН: %s после %s попыток", inn, MAX_RETRIES)
+        return None
+
+    def search(self, inn):
+        """Выполняет поиск и возвращает строку результата с нужным ИНН или None."""
+        with span('egrul.search', inn):
+            data = self._post_json('/', data={'query': inn, 'region': '', 'page': '', 'vyp3CaptchaToken': ''})
+            self._check_captcha(data)
+            search_token = data.get('t')
+            if not search_token:
+                raise EgrulHttpError(f"Сервер не вернул токен поиска: {data}")
+
+            deadline = time.monotonic() + TIMEOUT
+            while True:
+                result = self._get_json(f'/search-result/{search_token}')
+                if result.get('status') != 'wait':
+                    break
+                if time.monotonic() > deadline:
+                    raise EgrulHttpTimeout("Таймаут ожидания результатов поиска")
+                time.sleep(EGRUL_POLL_INTERVAL)
+
+            rows = result.get('rows', [])
+            if not rows:
+                logger.warning("Нет данных для ИНН: %s", inn)
+                return None
+            for row in rows:
+                if row.get('i') == inn:
+                    return row
+            logger.warning("Результат для ИНН %s не найден в списке", inn)
+            return None
+
+    def request_excerpt(self, row_token):
+        data = self._get_json(f'/vyp-request/{row_token}')
+        self._check_captcha(data)
+        token = data.get('t')
+        if not token:
+            raise EgrulHttpError(f"Сервер не вернул токен выписки: {data}")
+        return token
+
+    def wait_for_excerpt(self, token):
+        """Опрашивает статус выписки, пока она не будет готова."""
+        deadline = time.monotonic() + TIMEOUT
+        while True:
+            status = self._get_json(f'/vyp-status/{token}').get('status')
+            if status == 'ready':
+                return
+            if status != 'wait':
+                raise EgrulHttpError(f"Неожиданный статус выписки: {status}")
+            if time.monotonic() > deadline:
+                raise EgrulHttpTimeout("Таймаут ожидания готовности выписки")
+            time.sleep(EGRUL_POLL_INTERVAL)
+
+    def download_excerpt(self, token, inn):
+        """
+        Скачивает выписку в downloads/<ИНН>.pdf через временный файл.
+
+        :raises EgrulThrottled: вместо PDF пришла страница (обычно ограничение частоты или капча)
+        """
+        response = self.session.get(f'{self.base_url}/vyp-download/{token}', timeout=TIMEOUT, stream=True)
+        self._check_response(response)
+
+        pdf_path = os.path.join(self.download_path, f"{inn}.pdf")
+        # Свой временный файл на каждое скачивание: одну выписку могут получать несколько потоков
+        tmp_file = tempfile.NamedTemporaryFile(dir=self.download_path, prefix=f'{inn}-', suffix='.part', delete=False)
+        try:
+            header = b''
+            with tmp_file:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    if len(header) < len(PDF_SIGNATURE):
+                        header += chunk[:len(PDF_SIGNATURE) - len(header)]
+                    tmp_file.write(chunk)
+            if header != PDF_SIGNATURE:
+                raise EgrulThrottled(f"Вместо выписки получен ответ {response.headers.get('Content-Type')}: "
+                                     f"{header!r}")
+            os.replace(tmp_file.name, pdf_path)
+        except BaseException:
+            try:
+                os.remove(tmp_file.name)
+            except OSError:
+                pass
+            raise
+        return pdf_path
+
+    def _get_json(self, path):
+        response = self.session.get(f'{self.base_url}{path}', params={'r': self._timestamp()}, timeout=TIMEOUT)
+        self._check_response(response)
+        return response.json()
+
+    def _post_json(self, path, data):
+        response = self.session.post(f'{self.base_url}{path}', data=data, timeout=TIMEOUT)
+        self._check_response(response)
+        return response.json()
+
+    @staticmethod
+    def _failure_kind(error):
+        """Вид неудачи для ограничителя обращений."""
+        if isinstance(error, EgrulThrottled):
+            return THROTTLED
+        if isinstance(error, (requests.Timeout, EgrulHttpTimeout)):
+            return SIGNAL_TIMEOUT
+        return ERROR
+
+    @staticmethod
+    def _check_response(response):
+        if response.status_code in THROTTLE_STATUS_CODES:
+            raise EgrulThrottled(f"HTTP {response.status_code} для {response.url}")
+        response.raise_for_status()
+
+    @staticmethod
+    def _check_captcha(data):
+        if data.get('captchaRequired'):
+            raise EgrulThrottled("Сайт требует ввода капчи")
+
+    @staticmethod
+    def _timestamp():
+        return int(time.time() * 1000)
+
+    def close(self):
+        self.session.close()
+
+    def __del__(self):
+        self.close()
+
+
+if __name__ == "__main__":
+    from logger import setup_logging
+
+    setup_logging()
+    parser = EgrulHttpParser()
+    inn = "7704256957"
+    pdf_path = parser.get_pdf(inn)
+    if pdf_path:
+        print(f"PDF файл был успешно скачан: {pdf_path}")
+    else:
+        print("Не удалось получить PDF файл.")
@@ -1,34 +1,28 @@
 import os
 import time
+import uuid
+import shutil
 import logging
-import glob
 from dotenv import load_dotenv
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from webdriver_manager.chrome import ChromeDriverManager
-from config import EGRUL_URL, MAX_RETRIES, RETRY_DELAY, TIMEOUT, USER_AGENT
+from config import EGRUL_URL, MAX_RETRIES, TIMEOUT
+from driver_pool import get_driver_pool
+from download_watcher import wait_for_download, DownloadTimeout
+from excerpt_cache import get_excerpt_cache
+from rate_limiter import get_rate_limiter, backoff_delay, TIMEOUT as SIGNAL_TIMEOUT, NO_BUTTON, ERROR
+from change_probe import get_change_probe, fingerprint_result_text
+from metrics import span, inc
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 load_dotenv()
 
 
 class EgrulParser:
-    def __init__(self):
-        options = Options()
-        options.add_argument(f'user-agent={USER_AGENT}')
-        options.add_argument('--disable-gpu')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--window-size=1920,1080')
-        options.add_argument('--start-maximized')
-
+    def __init__(self, driver_pool=None, excerpt_cache=None, rate_limiter=None, change_probe=None):
         self.project_path = os.getenv('PROJECT_PATH')
         if not self.project_path:
             raise ValueError("PROJECT_PATH должен быть указан в файле .env")
@@ -36,71 +30,161 @@ class EgrulParser:
         self.download_path = os.path.join(self.project_path, 'downloads')
         os.makedirs(self.download_path, exist_ok=True)
 
-        prefs = {
-            "download.default_directory": self.download_path,
-            "download.prompt_for_download": False,
-            "download.directory_upgrade": True,
-            "safebrowsing.enabled": True
-        }
-        options.add_experimental_option("prefs", prefs)
-
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=options)
+        # Браузеры живут в общем пуле процесса и переживают отдельные прогоны
+        self.driver_pool = driver_pool or get_driver_pool(os.path.join(self.download_path, 'browsers'))
+        self.driver = None
+        self.pooled = None
+        self.cache = excerpt_cache or get_excerpt_cache()
+        self.limiter = rate_limiter or get_rate_limiter()
+        self.probe = change_probe or get_change_probe()
 
     def wait_for_element(self, by, value, timeout=TIMEOUT):
         return WebDriverWait(self.driver, timeout).until(
             EC.presence_of_element_located((by, value))
         )
 
-    def get_pdf(self, inn):
-        for attempt in range(MAX_RETRIES):
+    def get_pdf(self, inn, max_age=None):
+        """:param max_age: наибольший допустимый возраст выписки из кэша в секундах (0 - скачать заново)"""
+        if self.cache is not None:
+            cached_path = self.cache.get_pdf(inn, max_age=max_age)
+            if cached_path:
+                inc('excerpts', source='cache')
+                return cached_path
+
+        fingerprint = None
+        with self.driver_pool.lease() as pooled:
+            self.driver = pooled.driver
+            self.pooled = pooled
             try:
-                logger.info(f"Попытка {attempt + 1} получить данные для ИНН: {inn}")
-                self.driver.get(EGRUL_URL)
+                searched = False
+                if self.probe is not None:
+                    result_text = self.probe_search(inn)
+                    if result_text is not None:
+                        searched = True
+                        fingerprint = fingerprint_result_text(result_text)
+                        cached_path = self.probe.cached_if_unchanged(inn, fingerprint, max_age)
+                        if cached_path:
+                            self.limiter.mark_completed()
+                            inc('excerpts', source='probe')
+                            return cached_path
+                pdf_path = self._get_pdf(inn, searched)
+            finally:
+                self.driver = None
+                self.pooled = None
+
+        if pdf_path:
+            inc('excerpts', source='egrul')
+        if pdf_path and self.cache is not None:
+            self.cache.put_pdf(inn, pdf_path)
+            if fingerprint is not None:
+                self.probe.remember(inn, fingerprint)
+        return pdf_path
+
+    def probe_search(self, inn):
+        """Выполняет поиск для пробы изменений и возвращает текст строки результата или None."""
+        self.limiter.acquire()
+        try:
+            self.search(inn)
+            self.limiter.on_success(completed=False)
+        except Exception as e:
+            logger.warning("Не удалось выполнить пробу для ИНН: %s. Ошибка: %s", inn, e)
+            self.limiter.on_failure(SIGNAL_TIMEOUT if isinstance(e, TimeoutException) else ERROR)
+            return None
+        for row in self.driver.find_elements(By.CSS_SELECTOR, ".res-text"):
+            if inn in row.text:
+                return row.text
+        return None
 
-                inn_input = self.wait_for_element(By.NAME, "query")
-                inn_input.clear()
-                inn_input.send_keys(inn)
-                logger.info(f"Введен ИНН: {inn}")
+    def search(self, inn):
+        """Открывает страницу поиска, ищет ИНН и ждет результатов."""
+        with span('egrul.search', inn):
+            self.driver.get(EGRUL_URL)
 
-                search_button = self.wait_for_element(By.ID, "btnSearch")
-                search_button.click()
-                logger.info("Нажата кнопка поиска")
+            inn_input = self.wait_for_element(By.NAME, "query")
+            inn_input.clear()
+            inn_input.send_keys(inn)
+            logger.info("Введен ИНН: %s", inn)
 
-                time.sleep(5)
+            search_button = self.wait_for_element(By.ID, "btnSearch")
+            search_button.click()
+            logger.info("Нажата кнопка поиска")
 
+            self.wait_for_search_results()
+
+    def _get_pdf(self, inn, searched=False):
+        """:param searched: результаты поиска уже открыты пробой, первая попытка начинается с них"""
+        for attempt in range(MAX_RETRIES):
+            if attempt:
+                inc('retries', stage='egrul')
+            self.limiter.acquire()
+            try:
+                logger.info("Попытка %s получить данные для ИНН: %s", attempt + 1, inn)
+                if not searched:
+                    self.search(inn)
+                searched = False
                 self.check_search_results(inn)
 
                 excerpt_button = self.find_excerpt_button()
-                if excerpt_button:
-                    self.click_button_with_js(excerpt_button)
-                    logger.info("Нажата кнопка 'Получить выписку'")
-                else:
+                if not excerpt_button:
                     logger.error("Не найдена кнопка 'Получить выписку'")
                     self.save_screenshot(f"error_screenshot_{inn}_no_button.png")
+                    self.limiter.on_failure(NO_BUTTON)
+                    self._backoff(attempt)
                     continue
 
-                time.sleep(10)
-
-                pdf_path = self.find_and_rename_pdf(inn)
-                if pdf_path:
-                    logger.info(f"PDF успешно скачан и переименован: {pdf_path}")
-                    return pdf_path
-                else:
-                    logger.error(f"Не удалось найти или переименовать PDF файл для ИНН: {inn}")
-
+                # Отдельная директория на каждый запрос: в ней может оказаться только наш файл
+                request_dir = os.path.join(self.pooled.download_dir, f"{inn}-{uuid.uuid4().hex[:8]}")
+                self.pooled.set_download_dir(request_dir)
+                try:
+                    with span('egrul.download', inn):
+                        self.click_button_with_js(excerpt_button)
+                        logger.info("Нажата кнопка 'Получить выписку'")
+                        pdf_path = self.find_and_rename_pdf(inn, request_dir)
+                finally:
+                    shutil.rmtree(request_dir, ignore_errors=True)
+                logger.info("PDF успешно скачан и переименован: %s", pdf_path)
+                self.limiter.on_success()
+                return pdf_path
+
+            except DownloadTimeout as e:
+                logger.error("Не удалось дождаться PDF файла для ИНН: %s. Ошибка: %s", inn, e)
+                self.limiter.on_failure(SIGNAL_TIMEOUT)
             except TimeoutException as e:
-                logger.warning(f"Таймаут при ожидании элемента для ИНН: {inn}. Ошибка: {str(e)}")
+                logger.warning("Таймаут при ожидании элемента для ИНН: %s. Ошибка: %s", inn, e)
                 self.save_screenshot(f"timeout_screenshot_{inn}.png")
+                self.limiter.on_failure(SIGNAL_TIMEOUT)
             except Exception as e:
-                logger.error(f"Ошибка при попытке получить данные для ИНН: {inn}. Ошибка: {str(e)}", exc_info=True)
+                logger.error("Ошибка при попытке получить данные для ИНН: %s. Ошибка: %s", inn, e, exc_info=True)
                 self.save_screenshot(f"error_screenshot_{inn}.png")
+                self.limiter.on_failure(ERROR)
 
-            time.sleep(RETRY_DELAY)
+            self._backoff(attempt)
 
-        logger.error(f"Не удалось получить PDF для ИНН: {inn} после {MAX_RETRIES} попыток")
+        logger.error("Не удалось получить PDF для ИНН: %s после %s попыток", inn, MAX_RETRIES)
         return None
 
+    @staticmethod
+    def _backoff(attempt):
+        if attempt + 1 < MAX_RETRIES:
+            with span('egrul.backoff'):
+                time.sleep(backoff_delay(attempt))
+
+    def save_screenshot(self, filename):
+        """Сохраняет снимок страницы для разбора ошибки; сбой при сохранении не прерывает повторы."""
+        try:
+            screenshot_dir = os.path.join(self.download_path, 'screenshots')
+            os.makedirs(screenshot_dir, exist_ok=True)
+            self.driver.save_screenshot(os.path.join(screenshot_dir, filename))
+        except Exception as e:
+            logger.warning("Не удалось сохранить снимок страницы %s: %s", filename, e)
+
+    def wait_for_search_results(self, timeout=TIMEOUT):
+        """Ждет появления панели результатов или сообщения об отсутствии данных."""
+        WebDriverWait(self.driver, timeout).until(EC.any_of(
+            EC.visibility_of_element_located((By.ID, "pnl-result")),
+            EC.visibility_of_element_located((By.ID, "pnl-nodata")),
+        ))
+
     def check_search_results(self, inn):
         logger.info("Проверка результатов поиска")
 
@@ -109,15 +193,15 @@ class EgrulParser:
             result_rows = self.driver.find_elements(By.CSS_SELECTOR, ".res-text")
             for row in result_rows:
                 if inn in row.text:
-                    logger.info(f"Найден результат для ИНН: {inn}")
+                    logger.info("Найден результат для ИНН: %s", inn)
                     return
-            logger.warning(f"Результат для ИНН {inn} не найден в списке")
+            logger.warning("Результат для ИНН %s не найден в списке", inn)
         elif self.check_element_exists(By.ID, "pnl-nodata"):
-            logger.warning(f"Нет данных для ИНН: {inn}")
+            logger.warning("Нет данных для ИНН: %s", inn)
         else:
             logger.warning("Не найдены ни результаты, ни сообщение об отсутствии данных")
-        logger.info(f"Текущий URL: {self.driver.current_url}")
-        logger.info(f"Исходный код страницы: {self.driver.page_source[:500]}...")
+        logger.debug("Текущий URL: %s", self.driver.current_url)
+        logger.debug("Исходный код страницы: %s...", self.driver.page_source[:500])
 
     def check_element_exists(self, by, value):
         try:
@@ -139,23 +223,23 @@ class EgrulParser:
     def click_button_with_js(self, button):
         self.driver.execute_script("arguments[0].click();", button)
 
-    def find_and_rename_pdf(self, inn):
-        # Ищем файл, начинающийся с 'ul' и заканчивающийся на '.pdf'
-        pdf_files = glob.glob(os.path.join(self.download_path, 'ul-*.pdf'))
-        if pdf_files:
-            # Берем самый свежий файл, если их несколько
-            latest_pdf = max(pdf_files, key=os.path.getctime)
-            new_filename = f"{inn}.pdf"
-            new_filepath = os.path.join(self.download_path, new_filename)
-            os.rename(latest_pdf, new_filepath)
-            return new_filepath
-        return None
+    def find_and_rename_pdf(self, inn, request_dir):
+        # Ждем файл, начинающийся с 'ul' и заканчивающийся на '.pdf'
+        downloaded_pdf = wait_for_download(request_dir, pattern='ul-*.pdf')
+        new_filename = f"{inn}.pdf"
+        new_filepath = os.path.join(self.download_path, new_filename)
+        os.replace(downloaded_pdf, new_filepath)
+        return new_filepath
 
-    def __del__(self):
-        self.driver.quit()
+    def close(self):
+        # Браузер принадлежит пулу и закрывается вместе с ним при завершении процесса
+        self.driver = None
 
 
 if __name__ == "__main__":
+    from logger import setup_logging
+
+    setup_logging()
     parser = EgrulParser()
     inn = "7704256957"
     pdf_path = parser.get_pdf(inn)
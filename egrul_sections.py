@@ -0,0 +1,273 @@
+import re
+import sys
+import glob
+import os
+from typing import Dict, List, Optional, Tuple
+
+# Разделы выписки ЕГРЮЛ верхнего уровня: ключ -> заголовок
+SECTION_TITLES = [
+    ('address', 'Место нахождения и адрес юридического лица'),
+    ('registration', 'Сведения о регистрации'),
+    ('registrar', 'Сведения о регистрирующем органе по месту нахождения юридического лица'),
+    ('status', 'Сведения о состоянии юридического лица'),
+    ('capital', 'Сведения об уставном капитале / складочном капитале / уставном фонде / паевом фонде'),
+    ('management_company', 'Сведения об управляющей организации'),
+    ('management', 'Сведения о лице, имеющем право без доверенности действовать от имени юридического лица'),
+    ('founders', 'Сведения об участниках / учредителях юридического лица'),
+    ('company_share', 'Сведения о доле в уставном капитале общества, принадлежащей обществу'),
+    ('register_holder', 'Сведения о держателе реестра акционеров акционерного общества'),
+    ('tax', 'Сведения об учете в налоговом органе'),
+    ('pension', 'Сведения о регистрации в качестве страхователя по обязательному пенсионному страхованию'),
+    ('social', 'Сведения о регистрации в качестве страхователя по обязательному социальному страхованию'),
+    ('activities', 'Сведения о видах экономической деятельности'),
+    ('licenses', 'Сведения о лицензиях'),
+    ('branches', 'Сведения о филиалах и представительствах'),
+    ('records', 'Сведения о записях, внесенных в Единый государственный реестр юридических лиц'),
+]
+
+# Поля внутри разделов. Поля без ключа только завершают значение предыдущего поля.
+FIELD_TITLES = [
+    ('entry', 'ГРН и дата внесения в ЕГРЮЛ сведений о данном лице'),
+    (None, 'ГРН и дата внесения в ЕГРЮЛ записи об исправлении технической ошибки в указанных сведениях'),
+    ('record', 'ГРН и дата внесения в ЕГРЮЛ записи, содержащей указанные сведения'),
+    ('person_name', 'Фамилия Имя Отчество'),
+    ('person_name', 'Фамилия Имя'),
+    ('org_name', 'Полное наименование'),
+    ('nominal', 'Номинальная стоимость доли (в рублях)'),
+    ('share', 'Размер доли (в процентах)'),
+    ('share', 'Размер доли (в десятичных дробях)'),
+    ('share', 'Размер доли (в виде простой дроби)'),
+    (None, 'Пол'),
+    (None, 'Гражданство'),
+    (None, 'Государство'),
+    (None, 'Должность'),
+]
+
+# Колонтитул страницы, который разрывает значения полей
+PAGE_FOOTER_PATTERN = re.compile(
+    r'Страница\s*\d+\s*из\s*\d*\s*Выписка из ЕГРЮЛ\s*[\d.]*\s*[\d:]*\s*ОГРН\s*\d+')
+DATE_PATTERN = re.compile(r'\d{0,2}\.\d{2}\.\d{4}')
+INN_VALUE_PATTERN = re.compile(r'\d{10,12}')
+
+
+def _title_regex(title):
+    # Ячейки таблицы склеиваются при извлечении текста, поэтому пробелы между словами необязательны
+    return r'\s*'.join(re.escape(word) for word in title.split())
+
+
+def _build_marker_pattern():
+    markers = [(f'section:{key}', title) for key, title in SECTION_TITLES]
+    markers += [(f'field:{key or ""}', title) for key, title in FIELD_TITLES]
+    # Более длинные заголовки проверяются раньше, чтобы "Фамилия Имя" не перехватывала "Фамилия Имя Отчество"
+    markers.sort(key=lambda marker: len(marker[1]), reverse=True)
+    kinds = [kind for kind, _ in markers]
+    alternatives = [f'({_title_regex(title)})' for _, title in markers]
+    # ИНН и ОГРН не должны совпадать внутри других слов ("ИНН юридического лица" допустим)
+    kinds += ['field:inn', 'field:ogrn']
+    alternatives += [r'(\bИНН\b)', r'(\bОГРН\b)']
+    # Опережающая проверка первой буквы отсекает большинство позиций без перебора всех альтернатив
+    first_letters = ''.join(sorted({title[0] for _, title in markers} | {'И', 'О'}))
+    return re.compile(f'(?=[{first_letters}])(?:' + '|'.join(alternatives) + ')'), kinds
+
+
+MARKER_PATTERN, MARKER_KINDS = _build_marker_pattern()
+
+_SECTIONS_BY_LENGTH = sorted(SECTION_TITLES, key=lambda section: len(section[1]), reverse=True)
+SECTION_PATTERN = re.compile(
+    '(?=[СМ])(?:' + '|'.join(f'({_title_regex(title)})' for _, title in _SECTIONS_BY_LENGTH) + ')')
+SECTION_KEYS = [key for key, _ in _SECTIONS_BY_LENGTH]
+# Порядок разделов в выписке: заголовок раздела, который должен идти раньше текущего, - это цитата
+# внутри текущего раздела (например, в сведениях об участнике), а не начало нового раздела
+SECTION_ORDER = {key: order for order, (key, _) in enumerate(SECTION_TITLES)}
+
+
+class SectionTracker:
+    """
+    Отслеживает заголовки разделов по мере поступления страниц выписки.
+
+    Раздел считается прочитанным целиком, когда после его заголовка встретился заголовок
+    одного из следующих по порядку разделов. Раздел "Сведения о записях" всегда последний,
+    после него нужных данных нет.
+    """
+
+    def __init__(self):
+        self.seen: List[str] = []
+
+    def feed(self, text):
+        for match in SECTION_PATTERN.finditer(text):
+            key = SECTION_KEYS[match.lastindex - 1]
+            if not self.seen or SECTION_ORDER[key] > SECTION_ORDER[self.seen[-1]]:
+                self.seen.append(key)
+
+    def is_complete(self, key) -> bool:
+        if 'records' in self.seen:
+            return True
+        return key in self.seen and self.seen.index(key) < len(self.seen) - 1
+
+
+class FounderRecord:
+    """Участник / учредитель юридического лица."""
+    __slots__ = ('name', 'inn', 'record_date', 'share', 'nominal')
+
+    def __init__(self, name='', inn='', record_date='', share='', nominal=''):
+        self.name = name
+        self.inn = inn
+        self.record_date = record_date
+        self.share = share
+        self.nominal = nominal
+
+    def to_dict(self) -> Dict[str, str]:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __repr__(self):
+        return f"FounderRecord({self.name!r}, {self.inn!r}, {self.record_date!r}, {self.share!r})"
+
+
+class EgrulDocument:
+    """
+    Текст выписки ЕГРЮЛ, разобранный за один проход.
+
+    Текст размечается одним составным регулярным выражением по заголовкам разделов и полей,
+    значение поля - это текст до следующего маркера. Время разбора линейно по длине текста.
+
+    :ivar sections: ключ раздела -> (начало, конец) в тексте
+    :ivar founders: участники из раздела "Сведения об участниках / учредителях"
+    """
+
+    def __init__(self, text):
+        self.text = PAGE_FOOTER_PATTERN.sub(' ', text)
+        self.sections: Dict[str, Tuple[int, int]] = {}
+        self._tokens: List[Tuple[str, int, int]] = []
+        self._tokenize()
+        self.founders = self._parse_persons('founders')
+
+    def _tokenize(self):
+        matches = list(MARKER_PATTERN.finditer(self.text))
+        current_section = None
+        for i, match in enumerate(matches):
+            kind = MARKER_KINDS[match.lastindex - 1]
+            value_end = matches[i + 1].start() if i + 1 < len(matches) else len(self.text)
+            if kind.startswith('section:'):
+                key = kind[len('section:'):]
+                # Новый раздел начинается только заголовком, который идет в выписке после текущего;
+                # заголовок прежнего или того же раздела - это цитата, она лишь завершает значение поля
+                if current_section is None or SECTION_ORDER[key] > SECTION_ORDER[current_section]:
+                    if current_section is not None:
+                        self._close_section(current_section, match.start())
+                    self.sections[key] = (match.start(), len(self.text))
+                    current_section = key
+                else:
+                    kind = 'field:'
+            self._tokens.append((kind, match.end(), value_end))
+        if current_section is not None:
+            self._close_section(current_section, len(self.text))
+
+    def _close_section(self, key, end):
+        start, _ = self.sections[key]
+        self.sections[key] = (start, end)
+
+    def has_section(self, key) -> bool:
+        return key in self.sections
+
+    def section_text(self, key) -> str:
+        if key not in self.sections:
+            return ''
+        start, end = self.sections[key]
+        return self.text[start:end]
+
+    def _parse_persons(self, section_key) -> List[FounderRecord]:
+        if section_key not in self.sections:
+            return []
+        start, end = self.sections[section_key]
+
+        records = []
+        current: Optional[FounderRecord] = None
+        dated = False
+        for kind, value_start, value_end in self._tokens:
+            if value_start <= start or value_start > end:
+                continue
+            field = kind[len('field:'):] if kind.startswith('field:') else None
+            if not field:
+                continue
+            value = self.text[value_start:value_end].strip()
+
+            if field == 'entry':
+                if current is not None:
+                    records.append(current)
+                current = FounderRecord(record_date=_first_date(value))
+                dated = False
+                continue
+            if current is None:
+                continue
+
+            # Датой участия считается дата записи, которая внесла сведения о лице (ФИО и ИНН),
+            # а при ее отсутствии - дата первого внесения сведений о нем
+            if field == 'record':
+                if current.inn and not dated:
+                    current.record_date = _first_date(value) or current.record_date
+                    dated = True
+                continue
+
+            # Сведения о представителях и управляющих внутри записи участника не перезаписывают его данные
+            if field == 'person_name' and not current.name:
+                current.name = ' '.join(value.split())
+            elif field == 'org_name' and not current.name:
+                current.name = ' '.join(value.split())
+            elif field == 'inn' and not current.inn:
+                match = INN_VALUE_PATTERN.match(value)
+                current.inn = match.group(0) if match else ''
+            elif field == 'share' and not current.share:
+                current.share = value.split(' ')[0] if value else ''
+            elif field == 'nominal' and not current.nominal:
+                current.nominal = value.split(' ')[0] if value else ''
+
+        if current is not None:
+            records.append(current)
+
+        # Записи без наименования - это служебные строки раздела, а не участники
+        unique = {}
+        for record in records:
+            if record.name and (record.name, record.inn) not in unique:
+                unique[(record.name, record.inn)] = record
+        return list(unique.values())
+
+
+def _first_date(value):
+    match = DATE_PATTERN.search(value)
+    return match.group(0) if match else ''
+
+
+def parse_founders(text) -> List[FounderRecord]:
+    return EgrulDocument(text).founders
+
+
+def compare_with_legacy(pdf_paths):
+    """
+    Сравнивает разбор участников с прежним регулярным выражением PDFExtractor на наборе выписок.
+
+    :return: список (путь, только в старом разборе, только в новом разборе) для расходящихся файлов
+    """
+    from pdf_extractor import PDFExtractor
+
+    extractor = PDFExtractor()
+    differences = []
+    for path in pdf_paths:
+        text = extractor.extract_text(path)
+        legacy = {(f['name'], f['inn']) for f in extractor._extract_founders_legacy(text)}
+        structured = {(r.name, r.inn) for r in parse_founders(text)}
+        if legacy != structured:
+            differences.append((path, legacy - structured, structured - legacy))
+    return differences
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          'downloads', '*.pdf')))
+    differences = compare_with_legacy(paths)
+    for path, only_legacy, only_structured in differences:
+        print(path)
+        for name, inn in sorted(only_legacy):
+            print(f"  - {name} {inn}")
+        for name, inn in sorted(only_structured):
+            print(f"  + {name} {inn}")
+    print(f"Проверено файлов: {len(paths)}, с расхождениями: {len(differences)}")
@@ -0,0 +1,171 @@
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _build_placeholder_pdf():
+    """Минимальный PDF с таблицей xref, который читает PyPDF2."""
+    objects = [
+        b"<</Type/Catalog/Pages 2 0 R>>",
+        b"<</Type/Pages/Kids[3 0 R]/Count 1>>",
+        b"<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>",
+    ]
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += b"%d 0 obj" % number + obj + b"endobj\n"
+    xref_offset = len(body)
+    body += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    body += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    body += b"trailer<</Size %d/Root 1 0 R>>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return body
+
+
+# PDF-заглушка, если файл выписки не передан
+PLACEHOLDER_PDF = _build_placeholder_pdf()
+
+
+class EgrulStub:
+    """
+    Локальная заглушка API egrul.nalog.ru для проверки EgrulHttpParser без сети.
+
+    :param pdf_source: функция ИНН -> байты PDF или None, если компания не найдена
+    :param wait_polls: сколько раз статус выписки отвечает "wait" до "ready"
+    :param latency: задержка каждого ответа в секундах
+    :param throttle_rate: доля запросов, на которые заглушка отвечает HTTP 429
+    """
+
+    def __init__(self, pdf_source=None, wait_polls=1, latency=0.0, throttle_rate=0.0):
+        self.pdf_source = pdf_source or (lambda inn: PLACEHOLDER_PDF)
+        self.wait_polls = wait_polls
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.searches = {}  # токен поиска -> ИНН
+        self.excerpts = {}  # токен выписки -> [ИНН, оставшиеся опросы]
+        self.lock = threading.Lock()
+        self.request_count = 0
+
+    def new_token(self):
+        return uuid.uuid4().hex
+
+
+def make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            if self._delay():
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            form = parse_qs(self.rfile.read(length).decode('utf-8'))
+            inn = form.get('query', [''])[0]
+            token = stub.new_token()
+            with stub.lock:
+                stub.searches[token] = inn
+            self._send_json({'t': token, 'captchaRequired': False})
+
+        def do_GET(self):
+            if self._delay():
+                return
+            parts = urlparse(self.path).path.strip('/').split('/')
+            if len(parts) != 2:
+                self._send_json({'error': 'not found'}, status=404)
+                return
+            action, token = parts
+
+            if action == 'search-result':
+                inn = stub.searches.get(token)
+                if inn is None or stub.pdf_source(inn) is None:
+                    self._send_json({'rows': []})
+                else:
+                    self._send_json({'rows': [{'t': f'row-{token}', 'i': inn, 'k': 'ul'}]})
+            elif action == 'vyp-request':
+                inn = stub.searches.get(token[len('row-'):])
+                if inn is None:
+                    self._send_json({'error': 'unknown token'}, status=404)
+                    return
+                excerpt_token = stub.new_token()
+                with stub.lock:
+                    stub.excerpts[excerpt_token] = [inn, stub.wait_polls]
+                self._send_json({'t': excerpt_token, 'captchaRequired': False})
+            elif action == 'vyp-status':
+                with stub.lock:
+                    entry = stub.excerpts.get(token)
+                    if entry is None:
+                        status = 'error'
+                    elif entry[1] > 0:
+                        entry[1] -= 1
+                        status = 'wait'
+                    else:
+                        status = 'ready'
+                self._send_json({'status': status})
+            elif action == 'vyp-download':
+                entry = stub.excerpts.get(token)
+                if entry is None:
+                    self._send_json({'error': 'unknown token'}, status=404)
+                    return
+                body = stub.pdf_source(entry[0])
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/pdf')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send_json({'error': 'not found'}, status=404)
+
+        def _delay(self):
+            """Задержка ответа; возвращает True, если запрос отклонен с HTTP 429."""
+            with stub.lock:
+                stub.request_count += 1
+            if stub.latency:
+                time.sleep(stub.latency)
+            if stub.throttle_rate and random.random() < stub.throttle_rate:
+                if self.command == 'POST':
+                    self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self._send_json({'error': 'too many requests'}, status=429)
+                return True
+            return False
+
+        def _send_json(self, data, status=200):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def start_stub_server(stub=None, host='127.0.0.1', port=0):
+    """Запускает заглушку в фоновом потоке и возвращает сервер (адрес в server.server_address)."""
+    stub = stub or EgrulStub()
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    server.stub = stub
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    pdf_bytes = PLACEHOLDER_PDF
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as f:
+            pdf_bytes = f.read()
+    server = start_stub_server(EgrulStub(pdf_source=lambda inn: pdf_bytes), port=8765)
+    print(f"Заглушка ЕГРЮЛ запущена: http://{server.server_address[0]}:{server.server_address[1]}"
+          f" (EGRUL_BASE_URL для EgrulHttpParser)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from config import EXCERPT_CACHE_ENABLED, EXCERPT_CACHE_DIR, EXCERPT_CACHE_TTL, EXCERPT_CACHE_MAX_BYTES, \
+    EXCERPT_CACHE_LEASE
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(path):
+    """SHA-256 содержимого файла."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExcerptCache:
+    """
+    Дисковый кэш выписок ЕГРЮЛ.
+
+    PDF хранятся в objects/<sha256>.pdf, индекс в SQLite связывает ИНН с хэшем последней
+    выписки, временем загрузки и сроком жизни записи. Для каждого хэша в таблице parsed
+    сохраняется результат PDFExtractor, чтобы повторный разбор того же файла не требовался.
+    При превышении max_bytes удаляются давно не использованные файлы, кроме выданных
+    за последние lease секунд: их путь может еще читать стадия разбора.
+    """
+
+    def __init__(self, cache_dir=EXCERPT_CACHE_DIR, ttl=EXCERPT_CACHE_TTL, max_bytes=EXCERPT_CACHE_MAX_BYTES,
+                 lease=EXCERPT_CACHE_LEASE):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lease = lease
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS excerpts (
+                inn TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                ttl REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS objects (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS parsed (
+                hash TEXT PRIMARY KEY,
+                parser_version INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_objects_last_access ON objects (last_access);
+            CREATE INDEX IF NOT EXISTS idx_parsed_last_access ON parsed (last_access);
+            CREATE INDEX IF NOT EXISTS idx_excerpts_hash ON excerpts (hash);
+        ''')
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(objects)')}
+        if 'parsed' in columns:
+            # Индекс прежней версии: результаты разбора хранились в objects, в том числе строками
+            # без файла (size 0). Колонки остаются пустыми: DROP COLUMN есть не во всех версиях SQLite
+            self._conn.executescript('''
+                INSERT OR REPLACE INTO parsed (hash, parser_version, data, last_access)
+                    SELECT hash, parser_version, parsed, last_access FROM objects WHERE parsed IS NOT NULL;
+                UPDATE objects SET parsed = NULL, parser_version = NULL WHERE parsed IS NOT NULL;
+                DELETE FROM objects WHERE size = 0;
+            ''')
+        self._conn.commit()
+        self.counters = {'pdf_hits': 0, 'pdf_misses': 0, 'parsed_hits': 0, 'parsed_misses': 0, 'evictions': 0}
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, f'{digest}.pdf')
+
+    def get_pdf(self, inn, max_age=None):
+        """
+        Возвращает путь к закэшированной выписке или None, если ее нет или она устарела.
+        Выданный файл не вытесняется в течение lease секунд.
+
+        :param max_age: переопределяет срок жизни записи, в секундах
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT hash, fetched_at, ttl FROM excerpts WHERE inn = ?', (inn,)).fetchone()
+            if row is not None:
+                digest, fetched_at, ttl = row
+                path = self._object_path(digest)
+                if now - fetched_at <= (ttl if max_age is None else max_age) and os.path.exists(path):
+                    self._conn.execute('UPDATE objects SET last_access = ? WHERE hash = ?', (now, digest))
+                    self._conn.commit()
+                    self.counters['pdf_hits'] += 1
+                    logger.info("Выписка для ИНН %s взята из кэша", inn)
+                    return path
+            self.counters['pdf_misses'] += 1
+            return None
+
+    def get_fetched_at(self, inn):
+        """Время последней загрузки выписки для ИНН (unix time) или None."""
+        with self._lock:
+            row = self._conn.execute('SELECT fetched_at FROM excerpts WHERE inn = ?', (inn,)).fetchone()
+        return row[0] if row else None
+
+    def put_pdf(self, inn, pdf_path, ttl=None):
+        """Сохраняет скачанную выписку и возвращает ее хэш."""
+        digest = file_hash(pdf_path)
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            tmp_path = f'{object_path}.{threading.get_ident()}.tmp'
+            shutil.copyfile(pdf_path, tmp_path)
+            os.replace(tmp_path, object_path)
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO objects (hash, size, last_access) VALUES (?, ?, ?) '
+                'ON CONFLICT(hash) DO UPDATE SET last_access = excluded.last_access',
+                (digest, os.path.getsize(object_path), now))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO excerpts (inn, hash, fetched_at, ttl) VALUES (?, ?, ?, ?)',
+                (inn, digest, now, self.ttl if ttl is None else ttl))
+            self._conn.commit()
+            self._evict()
+        return digest
+
+    def get_parsed(self, digest, parser_version):
+        """Возвращает сохраненный результат разбора PDF с данным хэшем или None."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM parsed WHERE hash = ? AND parser_version = ?', (digest, parser_version)).fetchone()
+            if row is None:
+                self.counters['parsed_misses'] += 1
+                return None
+            now = time.time()
+            self._conn.execute('UPDATE parsed SET last_access = ? WHERE hash = ?', (now, digest))
+            self._conn.execute('UPDATE objects SET last_access = ? WHERE hash = ?', (now, digest))
+            self._conn.commit()
+            self.counters['parsed_hits'] += 1
+        return json.loads(row[0])
+
+    def put_parsed(self, digest, parser_version, data):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO parsed (hash, parser_version, data, last_access) VALUES (?, ?, ?, ?)',
+                (digest, parser_version, json.dumps(data, ensure_ascii=False), time.time()))
+            self._conn.commit()
+
+    def _evict(self):
+        """Удаляет давно не использованные объекты, пока кэш не уложится в max_bytes. Вызывается под блокировкой."""
+        now = time.time()
+        # Результаты разбора файлов, которых нет в кэше, хранятся не дольше срока жизни выписки
+        self._conn.execute(
+            'DELETE FROM parsed WHERE last_access < ? AND hash NOT IN (SELECT hash FROM objects)', (now - self.ttl,))
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+        if total <= self.max_bytes:
+            self._conn.commit()
+            return
+
+        for digest, size in self._conn.execute(
+                'SELECT hash, size FROM objects WHERE last_access < ? ORDER BY last_access',
+                (now - self.lease,)).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute('DELETE FROM objects WHERE hash = ?', (digest,))
+            self._conn.execute('DELETE FROM excerpts WHERE hash = ?', (digest,))
+            self._conn.execute('DELETE FROM parsed WHERE hash = ?', (digest,))
+            try:
+                os.remove(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.counters['evictions'] += 1
+        self._conn.commit()
+        if total > self.max_bytes:
+            logger.warning("Excerpt cache is %s bytes over its limit: the remaining files were handed out "
+                           "in the last %s s", total - self.max_bytes, self.lease)
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects').fetchone()
+            parsed = self._conn.execute('SELECT COUNT(*) FROM parsed').fetchone()[0]
+        return dict(self.counters, entries=entries, bytes=total, parsed=parsed)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_excerpt_cache():
+    """Возвращает общий для процесса кэш выписок или None, если кэш отключен в конфигурации."""
+    global _cache
+    if not EXCERPT_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExcerptCache()
+        return _cache
@@ -0,0 +1,210 @@
+import re
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime, date
+from typing import Dict, List, Optional, Tuple
+from config import FOUNDER_INDEX_ENABLED, FOUNDER_INDEX_PATH
+from state_store import founder_key
+
+logger = logging.getLogger(__name__)
+
+INN_QUERY_PATTERN = re.compile(r'^(\d{10}|\d{12})$')
+
+
+def _iso_date(value, default=None):
+    """Переводит дату выписки (ДД.ММ.ГГГГ) в ISO-формат, чтобы даты сортировались как строки."""
+    if value:
+        try:
+            return datetime.strptime(value, '%d.%m.%Y').date().isoformat()
+        except ValueError:
+            pass
+    return default or date.today().isoformat()
+
+
+def query_key(founder):
+    """Ключ участника для поиска: ИНН как есть, иначе нормализованное наименование."""
+    founder = founder.strip()
+    if INN_QUERY_PATTERN.match(founder):
+        return founder
+    return founder_key(founder, '')
+
+
+class FounderIndex:
+    """
+    Обратный индекс участников: участник -> компании и компания -> участники с историей.
+
+    Каждая строка participations - период участия лица в компании. Открытый период
+    (ended_at IS NULL) закрывается, когда участник пропадает из очередной выписки.
+    """
+
+    def __init__(self, db_path=FOUNDER_INDEX_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS participations (
+                id INTEGER PRIMARY KEY,
+                founder_key TEXT NOT NULL,
+                founder_name TEXT NOT NULL,
+                founder_inn TEXT NOT NULL,
+                company_inn TEXT NOT NULL,
+                company_name TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                ended_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS participations_by_founder
+                ON participations (founder_key, company_inn);
+            CREATE INDEX IF NOT EXISTS participations_by_company
+                ON participations (company_inn, founder_key);
+            CREATE UNIQUE INDEX IF NOT EXISTS participations_active
+                ON participations (company_inn, founder_key) WHERE ended_at IS NULL;
+        ''')
+        self._conn.commit()
+
+    def update_company(self, company_inn, company_name, founders: List[Dict[str, str]],
+                       observed_at=None) -> Tuple[int, int]:
+        """
+        Приводит открытые периоды участия компании к составу участников из выписки.
+
+        :param founders: участники из PDFExtractor (name, inn и, если есть, record_date)
+        :param observed_at: дата наблюдения в ISO-формате, по умолчанию сегодня
+        :return: (число открытых периодов, число закрытых периодов)
+        """
+        observed_at = observed_at or date.today().isoformat()
+        new = {founder_key(founder['name'], founder['inn']): founder for founder in founders}
+
+        with self._lock, self._conn:
+            active = {key for key, in self._conn.execute(
+                'SELECT founder_key FROM participations WHERE company_inn = ? AND ended_at IS NULL',
+                (company_inn,))}
+
+            closed = active - new.keys()
+            self._conn.executemany(
+                'UPDATE participations SET ended_at = ? '
+                'WHERE company_inn = ? AND founder_key = ? AND ended_at IS NULL',
+                [(observed_at, company_inn, key) for key in closed])
+
+            opened = new.keys() - active
+            self._conn.executemany(
+                'INSERT INTO participations (founder_key, founder_name, founder_inn, company_inn, company_name, '
+                'started_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(key, new[key]['name'], new[key]['inn'], company_inn, company_name,
+                  _iso_date(new[key].get('record_date'), observed_at)) for key in opened])
+
+            if company_name:
+                self._conn.execute(
+                    'UPDATE participations SET company_name = ? '
+                    'WHERE company_inn = ? AND ended_at IS NULL AND company_name != ?',
+                    (company_name, company_inn, company_name))
+
+        if opened or closed:
+            logger.info("Founder index for INN %s: %s started, %s ended", company_inn, len(opened), len(closed))
+        return len(opened), len(closed)
+
+    def companies_of(self, founder, include_ended=False) -> List[Dict[str, Optional[str]]]:
+        """
+        Компании, в которых участвует лицо.
+
+        :param founder: ИНН участника или наименование (для участников без ИНН)
+        :param include_ended: включать завершенные периоды участия
+        """
+        return self._query('founder_key = ?', query_key(founder), include_ended)
+
+    def founders_of(self, company_inn, include_ended=False) -> List[Dict[str, Optional[str]]]:
+        """Участники компании, по умолчанию только текущие."""
+        return self._query('company_inn = ?', company_inn.strip(), include_ended)
+
+    def _query(self, condition, value, include_ended):
+        sql = ('SELECT founder_name, founder_inn, company_inn, company_name, started_at, ended_at '
+               f'FROM participations WHERE {condition}')
+        if not include_ended:
+            sql += ' AND ended_at IS NULL'
+        sql += ' ORDER BY started_at, company_inn'
+        with self._lock:
+            rows = self._conn.execute(sql, (value,)).fetchall()
+        columns = ('founder_name', 'founder_inn', 'company_inn', 'company_name', 'started_at', 'ended_at')
+        return [dict(zip(columns, row)) for row in rows]
+
+    def rebuild_from_state(self, state_store):
+        """Заполняет индекс по составу участников из хранилища состояния (для уже обработанных компаний)."""
+        count = 0
+        for inn, name, updated_at, founders in state_store.iter_companies():
+            observed_at = date.fromtimestamp(updated_at).isoformat()
+            self.update_company(inn, name, [{'name': founder_name, 'inn': founder_inn}
+                                            for founder_name, founder_inn in founders], observed_at)
+            count += 1
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            total, active = self._conn.execute(
+                'SELECT COUNT(*), COUNT(*) - COUNT(ended_at) FROM participations').fetchone()
+        return {'participations': total, 'active': active}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_founder_index():
+    """Возвращает общий для процесса индекс участников или None, если он отключен в конфигурации."""
+    global _index
+    if not FOUNDER_INDEX_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = FounderIndex()
+        return _index
+
+
+def _print_rows(rows):
+    for row in rows:
+        period = f"{row['started_at']} - {row['ended_at'] or 'н.в.'}"
+        print(f"{row['company_inn']}\t{row['company_name']}\t{row['founder_name']}\t{row['founder_inn']}\t{period}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Поиск по обратному индексу участников")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    person = subparsers.add_parser('person', help="компании участника (ИНН или наименование)")
+    person.add_argument('founder')
+    person.add_argument('--all', action='store_true', help="включая завершенные периоды участия")
+    company = subparsers.add_parser('company', help="участники компании")
+    company.add_argument('inn')
+    company.add_argument('--all', action='store_true', help="включая бывших участников")
+    subparsers.add_parser('rebuild', help="заполнить индекс из хранилища состояния")
+    subparsers.add_parser('stats', help="размер индекса")
+    args = parser.parse_args(argv)
+
+    index = FounderIndex()
+    started = time.perf_counter()
+    if args.command == 'person':
+        rows = index.companies_of(args.founder, include_ended=args.all)
+        _print_rows(rows)
+        count = len(rows)
+    elif args.command == 'company':
+        rows = index.founders_of(args.inn, include_ended=args.all)
+        _print_rows(rows)
+        count = len(rows)
+    elif args.command == 'rebuild':
+        from state_store import StateStore
+        count = index.rebuild_from_state(StateStore())
+    else:
+        print(index.stats())
+        count = 0
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"Записей: {count}, время: {elapsed_ms:.1f} мс", file=sys.stderr)
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,111 +1,332 @@
 import logging
+import time
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from config import SHEET_ID, CREDENTIALS_FILE, COLUMN_INN, COLUMN_NAME, COLUMN_CURRENT_FOUNDERS, COLUMN_FORMER_FOUNDERS, \
-    COLUMN_CHANGE_DATE
+from config import validate_config, SHEET_ID, CREDENTIALS_FILE, SHEETS_API_ENDPOINT, SHEETS_API_RETRIES, \
+    COLUMN_INN, COLUMN_NAME, COLUMN_CURRENT_FOUNDERS, COLUMN_FORMER_FOUNDERS, COLUMN_CHANGE_DATE, SHEETS_SNAPSHOT, \
+    SHEETS_SNAPSHOT_MAX_AGE, SHEETS_BATCH_WRITES, SHEETS_BATCH_SIZE, SHEETS_FLUSH_INTERVAL, MAX_RETRIES
+from metrics import span, inc
+from rate_limiter import backoff_delay
 
-# Настройка логгирования
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+# Количество колонок A-E в строке компании
+ROW_WIDTH = 5
+
+
+def _row_to_company_data(row):
+    return {
+        'inn': row[0],
+        'name': row[1] if len(row) > 1 else '',  # Короткое название
+        'current_founders': row[2] if len(row) > 2 else '',
+        'former_founders': row[3] if len(row) > 3 else '',
+        'change_date': row[4] if len(row) > 4 else ''
+    }
+
+
 class GoogleSheetsHandler:
-    def __init__(self):
+    def __init__(self, use_snapshot=SHEETS_SNAPSHOT, batch_writes=SHEETS_BATCH_WRITES, service=None):
+        """:param service: готовый клиент Sheets API (например, заглушка в бенчмарках) вместо аутентификации"""
         self.sheet_id = SHEET_ID
         self.creds = None
-        self.service = None
-        self._authenticate()
+        self.service = service
+        self.use_snapshot = use_snapshot
+        # Снимок листа: ИНН -> (номер строки, кортеж значений A-E)
+        self._snapshot = None
+        self._inn_order = []
+        self._snapshot_loaded_at = None
+        self.batch_writes = batch_writes
+        # Буфер отложенной записи: ИНН -> (номер строки, значения A-E)
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._flush_listeners = []
+        if self.service is None:
+            validate_config()
+            self._authenticate()
 
     def _authenticate(self):
         """Аутентификация в Google Sheets API."""
         try:
+            if SHEETS_API_ENDPOINT:
+                # Локальный эмулятор (sheets_emulator.py) не проверяет учетные данные
+                self.service = build('sheets', 'v4', credentials=AnonymousCredentials(),
+                                     client_options={'api_endpoint': SHEETS_API_ENDPOINT},
+                                     static_discovery=True, cache_discovery=False)
+                logger.info("Using Google Sheets API emulator at %s", SHEETS_API_ENDPOINT)
+                return
             self.creds = Credentials.from_service_account_file(
                 CREDENTIALS_FILE,
                 scopes=['https://www.googleapis.com/auth/spreadsheets']
             )
-            self.service = build('sheets', 'v4', credentials=self.creds)
+            # Документ описания API берется из копии в пакете googleapiclient, без запроса к сети
+            self.service = build('sheets', 'v4', credentials=self.creds, static_discovery=True, cache_discovery=False)
             logger.info("Successfully authenticated with Google Sheets API")
         except Exception as e:
-            logger.error(f"Authentication failed: {str(e)}", exc_info=True)
+            logger.error("Authentication failed: %s", e, exc_info=True)
             raise
 
+    def add_flush_listener(self, callback):
+        """Регистрирует callback(список ИНН), вызываемый после того, как строки записаны в таблицу."""
+        self._flush_listeners.append(callback)
+
+    def _notify_written(self, inns):
+        for callback in self._flush_listeners:
+            try:
+                callback(inns)
+            except Exception as e:
+                logger.error("Flush listener failed: %s", e, exc_info=True)
+
+    def load_snapshot(self):
+        """Читает диапазон A2:E одним запросом и строит индекс ИНН -> строка."""
+        range_name = f'{COLUMN_INN}2:{COLUMN_CHANGE_DATE}'
+        logger.info("Loading sheet snapshot from range: %s", range_name)
+        with span('sheets.read'):
+            result = self.service.spreadsheets().values().get(
+                spreadsheetId=self.sheet_id, range=range_name).execute(num_retries=SHEETS_API_RETRIES)
+        values = result.get('values', [])
+
+        snapshot = {}
+        inn_order = []
+        for row_index, row in enumerate(values, start=2):
+            if not row or not row[0]:
+                continue
+            inn = row[0]
+            inn_order.append(inn)
+            # При дубликатах ИНН используется первая строка, как и при поиске по листу
+            if inn not in snapshot:
+                cells = row[:ROW_WIDTH]
+                snapshot[inn] = (row_index, tuple(cells) + ('',) * (ROW_WIDTH - len(cells)))
+
+        self._snapshot = snapshot
+        self._inn_order = inn_order
+        self._snapshot_loaded_at = time.monotonic()
+        logger.info("Snapshot loaded: %s companies in %s rows", len(snapshot), len(values))
+        return snapshot
+
+    def invalidate_snapshot(self):
+        """Сбрасывает снимок; следующее обращение перечитает лист."""
+        self._snapshot = None
+        self._inn_order = []
+        self._snapshot_loaded_at = None
+
+    def refresh_snapshot(self):
+        """Перечитывает лист, если его отредактировали во время прогона."""
+        self.invalidate_snapshot()
+        return self.load_snapshot()
+
+    def _get_snapshot(self):
+        expired = (
+            self._snapshot is not None
+            and SHEETS_SNAPSHOT_MAX_AGE > 0
+            and time.monotonic() - self._snapshot_loaded_at > SHEETS_SNAPSHOT_MAX_AGE
+        )
+        if self._snapshot is None or expired:
+            self.load_snapshot()
+        return self._snapshot
+
+    def find_row(self, inn):
+        """Возвращает номер строки с ИНН или None."""
+        if self.use_snapshot:
+            entry = self._get_snapshot().get(inn)
+            return entry[0] if entry else None
+
+        range_name = f'{COLUMN_INN}2:{COLUMN_INN}'
+        logger.info("Searching for INN %s in range: %s", inn, range_name)
+        with span('sheets.read'):
+            result = self.service.spreadsheets().values().get(
+                spreadsheetId=self.sheet_id, range=range_name).execute(num_retries=SHEETS_API_RETRIES)
+        values = result.get('values', [])
+        for i, row in enumerate(values, start=2):
+            if row and row[0] == inn:
+                return i
+        return None
+
     def get_inn_list(self):
         """Получает список ИНН из таблицы."""
+        if self.use_snapshot:
+            try:
+                self._get_snapshot()
+                inn_list = list(self._inn_order)
+                logger.info("Retrieved %s INN numbers from snapshot", len(inn_list))
+                return inn_list
+            except HttpError as error:
+                logger.error("Error loading sheet snapshot: %s", error)
+                return []
+
         try:
             range_name = f'{COLUMN_INN}2:{COLUMN_INN}'
-            logger.info(f"Fetching INN list from range: {range_name}")
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.sheet_id, range=range_name).execute()
+            logger.info("Fetching INN list from range: %s", range_name)
+            with span('sheets.read'):
+                result = self.service.spreadsheets().values().get(
+                    spreadsheetId=self.sheet_id, range=range_name).execute(num_retries=SHEETS_API_RETRIES)
             values = result.get('values', [])
             inn_list = [row[0] for row in values if row]
-            logger.info(f"Retrieved {len(inn_list)} INN numbers")
+            logger.info("Retrieved %s INN numbers", len(inn_list))
             return inn_list
         except HttpError as error:
-            logger.error(f"Error fetching INN list: {error}")
+            logger.error("Error fetching INN list: %s", error)
             return []
 
     def get_company_data(self, inn):
         try:
+            if self.use_snapshot:
+                entry = self._get_snapshot().get(inn)
+                if entry is None:
+                    logger.warning("Company with INN %s not found in the sheet", inn)
+                    return None
+                return _row_to_company_data(entry[1])
+
             range_name = f'{COLUMN_INN}2:{COLUMN_CHANGE_DATE}'
-            logger.info(f"Fetching company data for INN {inn}")
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.sheet_id, range=range_name).execute()
+            logger.info("Fetching company data for INN %s", inn)
+            with span('sheets.read'):
+                result = self.service.spreadsheets().values().get(
+                    spreadsheetId=self.sheet_id, range=range_name).execute(num_retries=SHEETS_API_RETRIES)
             values = result.get('values', [])
             for row in values:
-                if row[0] == inn:
-                    company_data = {
-                        'inn': row[0],
-                        'name': row[1] if len(row) > 1 else '',  # Короткое название
-                        'current_founders': row[2] if len(row) > 2 else '',
-                        'former_founders': row[3] if len(row) > 3 else '',
-                        'change_date': row[4] if len(row) > 4 else ''
-                    }
-                    logger.info(f"Found data for INN {inn}: {company_data}")
+                if row and row[0] == inn:
+                    company_data = _row_to_company_data(row)
+                    logger.debug("Found data for INN %s: %s", inn, company_data)
                     return company_data
-            logger.warning(f"Company with INN {inn} not found in the sheet")
+            logger.warning("Company with INN %s not found in the sheet", inn)
             return None
         except HttpError as error:
-            logger.error(f"Error fetching company data for INN {inn}: {error}")
+            logger.error("Error fetching company data for INN %s: %s", inn, error)
             return None
 
     def update_company_data(self, inn, data):
         try:
-            range_name = f'{COLUMN_INN}2:{COLUMN_INN}'
-            logger.info(f"Searching for INN {inn} to update data")
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.sheet_id, range=range_name).execute()
-            values = result.get('values', [])
-            row_index = None
-            for i, row in enumerate(values, start=2):
-                if row and row[0] == inn:
-                    row_index = i
-                    break
-
+            logger.info("Searching for INN %s to update data", inn)
+            row_index = self.find_row(inn)
             if row_index is None:
-                logger.warning(f"Company with INN {inn} not found for update")
+                logger.warning("Company with INN %s not found for update", inn)
                 return False
 
-            range_name = f'{COLUMN_INN}{row_index}:{COLUMN_CHANGE_DATE}{row_index}'
-            values = [
-                [
-                    inn,
-                    data.get('name', ''),  # Короткое название
-                    data.get('current_founders', ''),
-                    data.get('former_founders', ''),  # Разница между старыми и новыми учредителями
-                    data.get('change_date', '')
-                ]
+            row = [
+                inn,
+                data.get('name', ''),  # Короткое название
+                data.get('current_founders', ''),
+                data.get('former_founders', ''),  # Разница между старыми и новыми учредителями
+                data.get('change_date', '')
             ]
-            body = {'values': values}
-            logger.info(f"Updating data for INN {inn}: {values}")
-            self.service.spreadsheets().values().update(
-                spreadsheetId=self.sheet_id, range=range_name,
-                valueInputOption='USER_ENTERED', body=body).execute()
-            logger.info(f"Successfully updated data for INN {inn}")
+
+            if self._is_unchanged(inn, row):
+                logger.info("Data for INN %s is unchanged, skipping update", inn)
+                if inn not in self._pending:
+                    self._notify_written([inn])
+                return True
+
+            if self.batch_writes:
+                self._pending[inn] = (row_index, row)
+                logger.info("Queued update for INN %s (%s pending)", inn, len(self._pending))
+                if (len(self._pending) >= SHEETS_BATCH_SIZE
+                        or time.monotonic() - self._last_flush >= SHEETS_FLUSH_INTERVAL):
+                    self.flush()
+                return True
+
+            range_name = f'{COLUMN_INN}{row_index}:{COLUMN_CHANGE_DATE}{row_index}'
+            body = {'values': [row]}
+            logger.debug("Updating data for INN %s: %s", inn, row)
+            with span('sheets.write'):
+                self.service.spreadsheets().values().update(
+                    spreadsheetId=self.sheet_id, range=range_name,
+                    valueInputOption='USER_ENTERED', body=body).execute(num_retries=SHEETS_API_RETRIES)
+            if self._snapshot is not None:
+                self._snapshot[inn] = (row_index, tuple(row))
+            logger.info("Successfully updated data for INN %s", inn)
+            self._notify_written([inn])
             return True
         except HttpError as error:
-            logger.error(f"Error updating company data for INN {inn}: {error}")
+            logger.error("Error updating company data for INN %s: %s", inn, error)
+            return False
+
+    def _is_unchanged(self, inn, row):
+        """Сравнивает колонки B-E с последним известным состоянием строки."""
+        pending = self._pending.get(inn)
+        if pending is not None:
+            return list(pending[1][1:]) == row[1:]
+        if self._snapshot is None:
             return False
+        entry = self._snapshot.get(inn)
+        return entry is not None and list(entry[1][1:]) == row[1:]
+
+    def flush(self):
+        """
+        Отправляет накопленные строки пачками через values.batchUpdate.
+
+        Пачка, которую не удалось записать после MAX_RETRIES попыток, остается в буфере
+        и будет отправлена при следующем сбросе; остальные пачки не повторяются.
+
+        :return: True, если буфер полностью записан
+        """
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return True
+
+        items = list(self._pending.items())
+        batches = [items[i:i + SHEETS_BATCH_SIZE] for i in range(0, len(items), SHEETS_BATCH_SIZE)]
+        logger.info("Flushing %s rows in %s batch(es)", len(items), len(batches))
+
+        all_written = True
+        for batch in batches:
+            if self._write_batch(batch):
+                for inn, (row_index, row) in batch:
+                    # Строку могли перезаписать новыми данными, пока шла отправка
+                    if self._pending.get(inn) == (row_index, row):
+                        del self._pending[inn]
+                    if self._snapshot is not None:
+                        self._snapshot[inn] = (row_index, tuple(row))
+                self._notify_written([inn for inn, _ in batch])
+            else:
+                all_written = False
+        return all_written
+
+    def _write_batch(self, batch):
+        body = {
+            'valueInputOption': 'USER_ENTERED',
+            'data': [
+                {
+                    'range': f'{COLUMN_INN}{row_index}:{COLUMN_CHANGE_DATE}{row_index}',
+                    'values': [row]
+                }
+                for inn, (row_index, row) in batch
+            ]
+        }
+        for attempt in range(MAX_RETRIES):
+            try:
+                with span('sheets.batch_write'):
+                    self.service.spreadsheets().values().batchUpdate(
+                        spreadsheetId=self.sheet_id, body=body).execute()
+                logger.info("Batch of %s rows written", len(batch))
+                return True
+            except HttpError as error:
+                logger.warning("Batch write attempt %s failed: %s", attempt + 1, error)
+                if attempt + 1 < MAX_RETRIES:
+                    inc('retries', stage='sheets.write')
+                    time.sleep(backoff_delay(attempt))
+        logger.error("Failed to write batch of %s rows after %s attempts, keeping it buffered",
+                     len(batch), MAX_RETRIES)
+        return False
+
+    def write_changes(self, change_set):
+        """
+        Записывает строки из ChangeSet (DataProcessor.process_many) - пакетное сравнение портфеля
+        вне конвейера; конвейер пишет строки через получатели sinks.py.
+
+        :return: число строк, для которых запись прошла успешно
+        """
+        written = 0
+        for inn, data in change_set.iter_updates():
+            if self.update_company_data(inn, data):
+                written += 1
+        return written
+
+    def close(self):
+        """Сбрасывает буфер перед завершением работы."""
+        if not self.flush():
+            logger.error("%s rows were not written to the sheet", len(self._pending))
 
 
 def test_google_sheets_handler():
@@ -129,6 +350,7 @@ def test_google_sheets_handler():
             'change_date': '2023-09-01'
         }
         update_result = handler.update_company_data(test_inn, update_data)
+        handler.flush()
         print(f"Update result: {update_result}")
 
         print(f"\nVerifying update for INN {test_inn}:")
@@ -139,4 +361,7 @@ def test_google_sheets_handler():
 
 
 if __name__ == "__main__":
+    from logger import setup_logging
+
+    setup_logging()
     test_google_sheets_handler()
\ No newline at end of file
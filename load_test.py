@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+from sheets_emulator import SheetsEmulator, start_emulator, synthetic_rows
+
+SPREADSHEET_ID = 'loadtest'
+
+
+def _configure(endpoint, batch_size):
+    """
+    Направляет GoogleSheetsHandler в эмулятор. Вызывается до импорта модулей проекта, так как
+    config читает окружение при импорте; кэш выписок, состояние, индекс и журнал отключены,
+    чтобы прогон измерял запись в таблицу, а не локальные хранилища.
+    """
+    os.environ['SHEETS_API_ENDPOINT'] = endpoint
+    os.environ['GOOGLE_SHEET_ID'] = SPREADSHEET_ID
+    if batch_size:
+        os.environ['SHEETS_BATCH_SIZE'] = str(batch_size)
+    for name in ('EXCERPT_CACHE_ENABLED', 'STATE_STORE_ENABLED', 'FOUNDER_INDEX_ENABLED', 'RUN_JOURNAL_ENABLED',
+                 'EGRUL_PROBE_ENABLED'):
+        os.environ.setdefault(name, 'false')
+    # Заглушка ЕГРЮЛ не ограничивает темп, поэтому и ограничитель не должен
+    os.environ.setdefault('EGRUL_RATE_INITIAL', '100000')
+    os.environ.setdefault('EGRUL_RATE_MAX', '100000')
+    os.environ.setdefault('EGRUL_RATE_BURST', '100')
+
+
+def _sheets_stages():
+    from metrics import get_metrics
+    metrics = get_metrics()
+    if metrics is None:
+        return {}
+    return {stage: entry for stage, entry in metrics.summary().items() if stage.startswith('sheets.')}
+
+
+def run_sheets_load(rows, updates, writers):
+    """
+    Каждый писатель - отдельный GoogleSheetsHandler со своим клиентом API, как отдельные процессы
+    парсера: читает снимок листа и меняет свою долю строк (каждую writers-ю), затем сбрасывает буфер.
+    """
+    from google_sheets_handler import GoogleSheetsHandler
+
+    inns = [row[0] for row in rows[1:updates + 1]]
+    errors = []
+    unwritten = [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(writers + 1)
+    snapshot_seconds = []
+
+    def writer(index):
+        try:
+            handler = GoogleSheetsHandler()
+            started = time.perf_counter()
+            handler.get_inn_list()
+            with lock:
+                snapshot_seconds.append(time.perf_counter() - started)
+            barrier.wait()
+            for inn in inns[index::writers]:
+                handler.update_company_data(inn, {
+                    'name': f'ООО "ОБНОВЛЕНО-{inn}"',
+                    'current_founders': f'НОВЫЙ УЧАСТНИК {inn}00',
+                    'former_founders': '',
+                    'change_date': '01.07.2024',
+                })
+            handler.close()
+            with lock:
+                unwritten[0] += len(handler._pending)
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+            barrier.abort()
+
+    threads = [threading.Thread(target=writer, args=(i,), name=f'writer-{i}') for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'rows_requested': len(inns),
+        'rows_unwritten': unwritten[0],
+        'elapsed_s': round(elapsed, 3),
+        'rows_per_sec': round((len(inns) - unwritten[0]) / elapsed, 1) if elapsed else None,
+        'snapshot_s_max': round(max(snapshot_seconds), 3) if snapshot_seconds else None,
+        'errors': errors,
+    }
+
+
+def run_pipeline_load(emulator, companies, workdir, egrul_latency, fetch_workers):
+    """
+    Полный конвейер: EgrulHttpParser против локальной заглушки ЕГРЮЛ с синтетическими выписками,
+    PDFExtractor, DataProcessor и запись в эмулятор таблицы.
+    """
+    import egrul_http_parser
+    from synthetic_excerpt import generate_corpus
+    from egrul_stub_server import EgrulStub, start_stub_server
+    from egrul_http_parser import EgrulHttpParser
+    from pdf_extractor import PDFExtractor
+    from data_processor import DataProcessor
+    from google_sheets_handler import GoogleSheetsHandler
+    from pipeline import Pipeline
+
+    corpus = generate_corpus(os.path.join(workdir, 'corpus'), companies, founders=5, pages=6, holding_share=0.1)
+    pdfs = {}
+    for company in corpus:
+        with open(company['path'], 'rb') as file:
+            pdfs[company['inn']] = file.read()
+    emulator.add_spreadsheet(SPREADSHEET_ID, [['ИНН', 'Название', 'Текущие участники', 'Бывшие участники',
+                                               'Дата изменения']] + [[inn, '', '', '', ''] for inn in pdfs])
+
+    stub_server = start_stub_server(EgrulStub(pdfs.get, wait_polls=1, latency=egrul_latency))
+    egrul_http_parser.EGRUL_POLL_INTERVAL = 0.01
+    base_url = f'http://127.0.0.1:{stub_server.server_address[1]}'
+    download_path = os.path.join(workdir, 'pdf')
+    try:
+        handler = GoogleSheetsHandler()
+        pipeline = Pipeline(lambda: EgrulHttpParser(base_url=base_url, download_path=download_path),
+                            PDFExtractor(), DataProcessor(), handler, fetch_workers=fetch_workers)
+        started = time.perf_counter()
+        stats = pipeline.run(handler.get_inn_list())
+        handler.close()
+        elapsed = time.perf_counter() - started
+    finally:
+        stub_server.shutdown()
+    return {
+        'companies': companies,
+        'elapsed_s': round(elapsed, 3),
+        'companies_per_sec': round(stats['written'] / elapsed, 1) if elapsed else None,
+        'pipeline': stats,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон записи в таблицу против локального '
+                                                 'эмулятора Sheets API, без сети')
+    parser.add_argument('--rows', type=int, default=100000, help='компаний в листе эмулятора')
+    parser.add_argument('--updates', type=int, default=10000, help='сколько строк изменить')
+    parser.add_argument('--writers', type=int, default=1, help='одновременных писателей')
+    parser.add_argument('--batch-size', type=int, help='строк в одном batchUpdate (SHEETS_BATCH_SIZE)')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа эмулятора, сек')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов HTTP 429')
+    parser.add_argument('--quota-per-minute', type=int, default=0, help='квота запросов в минуту, 0 - без квоты')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='полный конвейер с заглушкой ЕГРЮЛ вместо прямой записи строк')
+    parser.add_argument('--companies', type=int, default=200, help='компаний в режиме --pipeline')
+    parser.add_argument('--egrul-latency', type=float, default=0.0, help='задержка заглушки ЕГРЮЛ, сек')
+    parser.add_argument('--fetch-workers', type=int, default=4, help='потоков загрузки в режиме --pipeline')
+    parser.add_argument('--output', help='файл для отчета JSON (по умолчанию только stdout)')
+    args = parser.parse_args(argv)
+
+    emulator = SheetsEmulator(args.latency, args.error_rate, args.quota_per_minute)
+    server = start_emulator(emulator)
+    _configure(f'http://127.0.0.1:{server.server_address[1]}/', args.batch_size)
+    from logger import setup_logging
+    setup_logging(os.getenv('LOG_LEVEL', 'WARNING'))
+
+    workdir = tempfile.mkdtemp(prefix='parcer-inn-load-')
+    try:
+        if args.pipeline:
+            result = run_pipeline_load(emulator, args.companies, workdir, args.egrul_latency, args.fetch_workers)
+        else:
+            rows = synthetic_rows(args.rows)
+            emulator.add_spreadsheet(SPREADSHEET_ID, rows)
+            result = run_sheets_load(rows, min(args.updates, args.rows), args.writers)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    from config import SHEETS_BATCH_SIZE
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'params': {key: value for key, value in vars(args).items() if key != 'output'},
+        'batch_size': SHEETS_BATCH_SIZE,
+        'result': result,
+        'emulator': emulator.stats(),
+        'stages': _sheets_stages(),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+    if result.get('errors') or result.get('rows_unwritten'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
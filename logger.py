@@ -1,52 +1,155 @@
+import sys
+import copy
+import json
+import queue
+import atexit
 import logging
-import os
-from logging.handlers import RotatingFileHandler
-from config import LOG_FILE, LOG_LEVEL, BASE_DIR
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from config import LOG_FILE, LOG_LEVEL, LOG_FORMAT
 
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
-def setup_logger(name='ParserINN'):
+# Поля контекста, которые попадают в каждую запись лога (ИНН и стадия обработки)
+CONTEXT_FIELDS = ('inn', 'stage')
+
+_context = contextvars.ContextVar('log_context', default={})
+_listener = None
+_setup_lock = threading.Lock()
+
+
+@contextmanager
+def log_context(**fields):
     """
-    Настраивает и возвращает логгер с заданными параметрами.
+    Добавляет поля (inn, stage) ко всем записям лога внутри блока в текущем потоке.
 
-    :param name: Имя логгера
-    :return: Настроенный объект логгера
+    :param fields: значения полей контекста
     """
-    # Создаем логгер
-    logger = logging.getLogger(name)
-    logger.setLevel(LOG_LEVEL)
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def get_log_context(field):
+    """Значение поля контекста (например, inn) в текущем потоке или None."""
+    return _context.get().get(field)
+
+
+class ContextFilter(logging.Filter):
+    """Переносит поля контекста в запись, если они не переданы явно через extra."""
+
+    def filter(self, record):
+        context = _context.get()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
 
-    # Создаем форматтер
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-    # Обработчик для записи в файл
-    file_handler = RotatingFileHandler(
-        LOG_FILE,
-        maxBytes=10 * 1024 * 1024,  # 10MB
-        backupCount=5
-    )
-    file_handler.setFormatter(formatter)
+class _QueueHandler(QueueHandler):
+    """
+    Готовит запись к передаче в поток записи: сообщение и трассировка формируются здесь,
+    а оформление строки (текст или JSON) выполняет обработчик в потоке записи.
+    """
 
-    # Обработчик для вывода в консоль
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись лога - один объект JSON в строке."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, log_file=LOG_FILE):
+    """
+    Настраивает логирование процесса. Повторные вызовы ничего не делают.
 
-    # Добавляем обработчики к логгеру
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    Потоки только кладут записи в очередь, а запись в файл и консоль выполняет отдельный
+    поток QueueListener, поэтому дисковый ввод-вывод не задерживает обработку.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
+        file_handler = RotatingFileHandler(
+            log_file,
+            maxBytes=10 * 1024 * 1024,  # 10MB
+            backupCount=5,
+            encoding='utf-8'
+        )
+        file_handler.setFormatter(formatter)
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _QueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+
+        _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток записи."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
 
-    return logger
 
+def setup_logger(name='ParserINN'):
+    """
+    Настраивает логирование процесса и возвращает логгер.
 
-# Создаем и настраиваем корневой логгер
-root_logger = setup_logger()
+    :param name: Имя логгера
+    :return: Объект логгера
+    """
+    setup_logging()
+    return logging.getLogger(name)
 
 
 def get_logger(name):
     """
-    Возвращает настроенный логгер для заданного имени.
+    Возвращает логгер для заданного имени.
 
     :param name: Имя модуля или компонента
-    :return: Настроенный объект логгера
+    :return: Объект логгера
     """
     return logging.getLogger(name)
 
@@ -56,10 +159,8 @@ def log_uncaught_exceptions(exc_type, exc_value, exc_traceback):
     """
     Логирует необработанные исключения.
     """
-    root_logger.critical("Uncaught exception", exc_info=(exc_type, exc_value, exc_traceback))
+    logging.getLogger('ParserINN').critical("Uncaught exception", exc_info=(exc_type, exc_value, exc_traceback))
 
 
 # Устанавливаем обработчик необработанных исключений
-import sys
-
-sys.excepthook = log_uncaught_exceptions
\ No newline at end of file
+sys.excepthook = log_uncaught_exceptions
@@ -0,0 +1,262 @@
+import re
+import json
+import math
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from typing import Callable, Dict, Optional, Tuple
+from config import LOOKUP_HOST, LOOKUP_PORT, LOOKUP_LRU_SIZE, LOOKUP_MAX_AGE, LOOKUP_FETCH_WORKERS
+
+logger = logging.getLogger(__name__)
+
+INN_PATTERN = re.compile(r'^\d{10}(\d{2})?$')
+
+
+class CompanyLookupError(Exception):
+    """Не удалось получить данные компании из ЕГРЮЛ."""
+
+
+class NotFound(CompanyLookupError):
+    """Компания не найдена в ЕГРЮЛ."""
+
+
+class _Call:
+    """Выполняющееся получение данных одного ИНН, результат которого ждут все запросившие."""
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CompanyLookup:
+    """
+    Получение данных компании по запросу с LRU-кэшем результатов разбора в памяти.
+
+    Одновременные запросы одного ИНН объединяются в одно получение выписки (single-flight),
+    а блокировка удерживается только на время работы со словарями, поэтому медленное
+    получение одного ИНН не задерживает запросы других. Число одновременных обращений
+    к ЕГРЮЛ ограничено fetch_workers, каждое из них использует свой парсер.
+
+    :param parser_factory: функция без аргументов, создающая парсер ЕГРЮЛ
+    """
+
+    def __init__(self, parser_factory: Callable, pdf_extractor, lru_size=LOOKUP_LRU_SIZE,
+                 default_max_age=LOOKUP_MAX_AGE, fetch_workers=LOOKUP_FETCH_WORKERS):
+        self.parser_factory = parser_factory
+        self.pdf_extractor = pdf_extractor
+        self.lru_size = lru_size
+        self.default_max_age = default_max_age
+
+        self._lock = threading.Lock()
+        self._lru: 'OrderedDict[str, Tuple[Dict, float]]' = OrderedDict()
+        self._inflight: Dict[str, _Call] = {}
+        self._parsers = queue.LifoQueue()
+        self._fetch_slots = threading.BoundedSemaphore(fetch_workers)
+        self.counters = {'hits': 0, 'misses': 0, 'coalesced': 0, 'fetches': 0, 'errors': 0}
+
+    def get(self, inn, max_age=None) -> Tuple[Dict, float, str]:
+        """
+        Данные компании не старше max_age секунд.
+
+        Свежесть отсчитывается от момента запроса: выписка, полученная уже после него
+        (например, одновременным запросом того же ИНН), подходит и при max_age=0.
+
+        :return: (данные, время получения выписки, источник: memory или egrul)
+        :raises ValueError: max_age отрицательный или не является конечным числом
+        :raises NotFound: компания не найдена
+        :raises CompanyLookupError: выписку не удалось получить
+        """
+        if max_age is None:
+            max_age = self.default_max_age
+        _check_max_age(max_age)
+        oldest = time.time() - max_age
+        while True:
+            with self._lock:
+                entry = self._lru.get(inn)
+                if entry is not None and entry[1] >= oldest:
+                    self._lru.move_to_end(inn)
+                    self.counters['hits'] += 1
+                    return entry[0], entry[1], 'memory'
+
+                call = self._inflight.get(inn)
+                leader = call is None
+                if leader:
+                    call = self._inflight[inn] = _Call()
+                    self.counters['misses'] += 1
+                else:
+                    self.counters['coalesced'] += 1
+
+            if leader:
+                try:
+                    call.result = self._fetch(inn, max_age)
+                except Exception as e:
+                    call.error = e
+                finally:
+                    with self._lock:
+                        del self._inflight[inn]
+                        if call.error is None:
+                            self._remember(inn, call.result)
+                        else:
+                            self.counters['errors'] += 1
+                    call.event.set()
+            else:
+                call.event.wait()
+
+            if call.error is not None:
+                raise call.error
+            data, fetched_at = call.result
+            # Присоединившийся запрос мог требовать более свежую выписку, чем получил ведущий
+            if leader or fetched_at >= oldest:
+                return data, fetched_at, 'egrul'
+
+    def _remember(self, inn, result):
+        """Добавляет результат в LRU. Вызывается под блокировкой."""
+        self._lru[inn] = result
+        self._lru.move_to_end(inn)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _fetch(self, inn, max_age) -> Tuple[Dict, float]:
+        with self._fetch_slots:
+            try:
+                parser = self._parsers.get_nowait()
+            except queue.Empty:
+                parser = self.parser_factory()
+            try:
+                with self._lock:
+                    self.counters['fetches'] += 1
+                pdf_path = parser.get_pdf(inn, max_age=max_age)
+            finally:
+                self._parsers.put(parser)
+
+        if not pdf_path:
+            raise NotFound(f"No excerpt for INN {inn}")
+        data = self.pdf_extractor.extract_data(pdf_path, include_full_text=False)
+        if not data:
+            raise CompanyLookupError(f"Failed to extract data for INN {inn}")
+        return data, self._fetched_at(inn)
+
+    def _fetched_at(self, inn):
+        cache = getattr(self.pdf_extractor, 'cache', None)
+        fetched_at = cache.get_fetched_at(inn) if cache is not None else None
+        return fetched_at or time.time()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self.counters)
+            stats['lru_size'] = len(self._lru)
+            stats['inflight'] = len(self._inflight)
+        return stats
+
+    def close(self):
+        while not self._parsers.empty():
+            parser = self._parsers.get_nowait()
+            if hasattr(parser, 'close'):
+                parser.close()
+
+
+def make_handler(lookup: CompanyLookup):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            logger.debug("%s %s", self.address_string(), format % args)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = url.path.strip('/').split('/')
+            if parts == ['stats']:
+                self._send_json(lookup.stats())
+            elif len(parts) == 2 and parts[0] == 'company':
+                self._company(parts[1], parse_qs(url.query))
+            else:
+                self._send_json({'error': 'not found'}, status=404)
+
+        def _company(self, inn, params):
+            if not INN_PATTERN.match(inn):
+                self._send_json({'error': 'invalid INN'}, status=400)
+                return
+            try:
+                max_age = _max_age(params)
+            except ValueError:
+                self._send_json({'error': 'max_age must be a non-negative number of seconds'}, status=400)
+                return
+
+            try:
+                data, fetched_at, source = lookup.get(inn, max_age)
+            except NotFound:
+                self._send_json({'error': 'company not found', 'inn': inn}, status=404)
+                return
+            except Exception as e:
+                logger.error("Lookup failed for INN %s: %s", inn, e)
+                self._send_json({'error': 'failed to fetch excerpt', 'inn': inn}, status=502)
+                return
+
+            body = {'inn': inn, 'fetched_at': round(fetched_at, 3), 'age': round(time.time() - fetched_at, 1),
+                    'source': source}
+            body.update(data)
+            self._send_json(body)
+
+        def _send_json(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def _max_age(params) -> Optional[float]:
+    """Свежесть из параметров запроса: refresh=1 - получить заново, max_age - возраст в секундах."""
+    if params.get('refresh', ['0'])[0] in ('1', 'true', 'yes'):
+        return 0
+    if 'max_age' in params:
+        max_age = float(params['max_age'][0])
+        _check_max_age(max_age)
+        return max_age
+    return None
+
+
+def _check_max_age(max_age):
+    if not math.isfinite(max_age) or max_age < 0:
+        raise ValueError(f"max_age должен быть неотрицательным числом секунд: {max_age}")
+
+
+def start_lookup_server(lookup, host=LOOKUP_HOST, port=LOOKUP_PORT):
+    """Запускает HTTP-сервер в фоновом потоке и возвращает его."""
+    server = ThreadingHTTPServer((host, port), make_handler(lookup))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='lookup-server', daemon=True)
+    thread.start()
+    return server
+
+
+def run_service(host=LOOKUP_HOST, port=LOOKUP_PORT):
+    from main import create_egrul_parser
+    from pdf_extractor import PDFExtractor
+
+    lookup = CompanyLookup(create_egrul_parser, PDFExtractor())
+    server = start_lookup_server(lookup, host, port)
+    logger.info("Lookup service listening on http://%s:%s", server.server_address[0], server.server_address[1])
+    try:
+        while True:
+            time.sleep(60)
+            logger.info("Lookup service stats: %s", lookup.stats())
+    except KeyboardInterrupt:
+        server.shutdown()
+        lookup.close()
+
+
+if __name__ == "__main__":
+    from logger import setup_logging
+
+    setup_logging()
+    run_service()
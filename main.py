@@ -2,69 +2,138 @@ import time
 import schedule
 from datetime import datetime
 import logging
-from google_sheets_handler import GoogleSheetsHandler
-from egrul_parser import EgrulParser
 from pdf_extractor import PDFExtractor
 from data_processor import DataProcessor
+from pipeline import Pipeline
+from excerpt_cache import get_excerpt_cache
+from state_store import get_state_store
+from founder_index import get_founder_index
+from run_journal import open_run_journal
+from rate_limiter import get_rate_limiter
+from change_probe import get_change_probe
+from coordinator import get_coordinator
+from sinks import create_sink
 from logger import setup_logger
+from priority_scheduler import PriorityScheduler
+from metrics import get_metrics, start_metrics_server
+from config import validate_config, EGRUL_BACKEND, SCHEDULER_MODE, UPDATE_TIME
 
 logger = setup_logger()
 
 
-def process_companies():
+def create_egrul_parser(backend=EGRUL_BACKEND):
+    """Создает парсер ЕГРЮЛ выбранного в конфигурации бэкенда."""
+    if backend == 'http':
+        from egrul_http_parser import EgrulHttpParser
+        return EgrulHttpParser()
+    if backend == 'selenium':
+        from egrul_parser import EgrulParser
+        return EgrulParser()
+    raise ValueError(f"Неизвестный бэкенд ЕГРЮЛ: {backend}")
+
+
+def process_companies(inn_list=None):
+    """
+    Обрабатывает компании из таблицы.
+
+    :param inn_list: список ИНН для обработки; по умолчанию все ИНН из таблицы
+    :return: счетчики конвейера или None при ошибке
+    """
+    # Клиент Google API импортируется при первой обработке, а не при запуске (cli.py)
+    from google_sheets_handler import GoogleSheetsHandler
+
+    gs_handler = None
+    sink = None
+    stats = None
+    journal = None
+    completed = False
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.reset_run()
     try:
         logger.info("Starting data processing")
         gs_handler = GoogleSheetsHandler()
-        egrul_parser = EgrulParser()
         pdf_extractor = PDFExtractor()
-        data_processor = DataProcessor()
+        data_processor = DataProcessor(state_store=get_state_store(), founder_index=get_founder_index())
+
+        if inn_list is None:
+            inn_list = gs_handler.get_inn_list()
+
+        # Если предыдущий прогон того же списка ИНН прервался, продолжаем его с невыполненных ИНН
+        journal = open_run_journal(inn_list)
+        sink = create_sink(gs_handler)
+        # В распределенном режиме выписки получают узлы обработки, а здесь остаются сравнение и запись
+        pipeline = Pipeline(create_egrul_parser, pdf_extractor, data_processor, gs_handler, journal=journal,
+                            coordinator=get_coordinator(), sink=sink)
+        stats = pipeline.run(inn_list)
+        completed = True
+
+        excerpt_cache = get_excerpt_cache()
+        if excerpt_cache is not None:
+            logger.info("Excerpt cache stats: %s", excerpt_cache.stats())
+        logger.info("EGRUL rate limiter: %s", get_rate_limiter().metrics())
+        change_probe = get_change_probe()
+        if change_probe is not None:
+            logger.info("Change probe stats: %s", change_probe.stats())
 
-        inn_list = gs_handler.get_inn_list()
-
-        for inn in inn_list:
-            try:
-                logger.info(f"Processing INN: {inn}")
-                pdf_file = egrul_parser.get_pdf(inn)
-                if not pdf_file:
-                    logger.warning(f"Failed to get PDF for INN: {inn}")
-                    continue
-
-                pdf_data = pdf_extractor.extract_data(pdf_file)
-                logger.info(f"Extracted data from PDF for INN {inn}: {pdf_data}")
-                logger.info(f"Number of founders extracted: {len(pdf_data.get('founders', []))}")
-
-                current_data = gs_handler.get_company_data(inn)
-                logger.info(f"Current data for INN {inn}: {current_data}")
+        logger.info("Data processing completed")
+    except Exception as e:
+        logger.error("Error in data processing: %s", e, exc_info=True)
+    finally:
+        # Записываем в получатели все, что осталось в буферах отложенной записи; буфер таблицы
+        # сбрасывает SheetsSink, а без получателя (ошибка до его создания) - сам обработчик
+        if sink is not None:
+            sink.close()
+        elif gs_handler is not None:
+            gs_handler.close()
+        if journal is not None:
+            journal.close(completed=completed)
+        if metrics is not None:
+            write_metrics(metrics, stats)
+    return stats
+
+
+def write_metrics(metrics, stats):
+    """Записывает отчет прогона с перцентилями стадий и обновляет файл метрик Prometheus."""
+    try:
+        metrics.add_collector('egrul_rate', get_rate_limiter().metrics)
+        excerpt_cache = get_excerpt_cache()
+        if excerpt_cache is not None:
+            metrics.add_collector('excerpt_cache', excerpt_cache.stats)
+        metrics.write_report(stats)
+        metrics.write_textfile()
+    except Exception as e:
+        logger.error("Error writing run metrics: %s", e, exc_info=True)
 
-                processed_data = data_processor.process(inn, pdf_data, current_data)
-                logger.info(f"Processed data for INN {inn}: {processed_data}")
-                logger.info(
-                    f"Number of current founders after processing: {len(processed_data['current_founders'].split(','))}")
-                logger.info(
-                    f"Number of former founders after processing: {len(processed_data['former_founders'].split(','))}")
 
-                update_result = gs_handler.update_company_data(inn, processed_data)
-                logger.info(f"Update result for INN {inn}: {update_result}")
+def load_change_dates(gs_handler):
+    """Перечитывает таблицу и возвращает ИНН -> дата изменения для планировщика."""
+    gs_handler.refresh_snapshot()
+    return {inn: (gs_handler.get_company_data(inn) or {}).get('change_date', '')
+            for inn in gs_handler.get_inn_list()}
 
-            except Exception as e:
-                logger.error(f"Error processing INN {inn}: {str(e)}", exc_info=True)
 
-        logger.info("Data processing completed")
-    except Exception as e:
-        logger.error(f"Error in data processing: {str(e)}", exc_info=True)
+def run_scheduler():
+    logger.info("Scheduler started in %s mode", SCHEDULER_MODE)
+    start_metrics_server()
+    if SCHEDULER_MODE == 'daily':
+        schedule.every().day.at(UPDATE_TIME).do(process_companies)
 
+        # Запускаем процесс сразу при старте
+        process_companies()
 
-def run_scheduler():
-    logger.info("Scheduler started")
-    schedule.every(24).hours.do(process_companies)
+        while True:
+            schedule.run_pending()
+            time.sleep(1)
 
-    # Запускаем процесс сразу при старте
-    process_companies()
+    from google_sheets_handler import GoogleSheetsHandler
 
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    gs_handler = GoogleSheetsHandler()
+    state_store = get_state_store()
+    last_checked = state_store.checked_times() if state_store is not None else None
+    PriorityScheduler().run_forever(process_companies, lambda: load_change_dates(gs_handler), last_checked)
 
 
 if __name__ == "__main__":
+    validate_config()
     run_scheduler()
@@ -0,0 +1,366 @@
+import os
+import glob
+import json
+import math
+import time
+import random
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from logger import get_log_context
+from config import METRICS_ENABLED, METRICS_DIR, METRICS_PORT, METRICS_HOST, METRICS_SAMPLE_SIZE, \
+    METRICS_TRACE_LIMIT, METRICS_KEEP
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'parcer_inn'
+
+# Верхние границы корзин гистограммы длительностей, в секундах
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+PERCENTILES = (50, 95, 99)
+
+
+class _StageStats:
+    """Гистограмма длительностей одной стадии."""
+    __slots__ = ('buckets', 'count', 'total', 'errors', 'samples', 'seen', 'run_errors')
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors: Dict[str, int] = {}
+        # Выборка длительностей текущего прогона для перцентилей (reservoir sampling)
+        self.samples: List[float] = []
+        self.seen = 0
+        self.run_errors: Dict[str, int] = {}
+
+
+class _Span:
+    __slots__ = ('error',)
+
+    def __init__(self):
+        self.error = None
+
+    def fail(self, error):
+        """Отмечает стадию как неудачную без исключения (например, не найдена кнопка выписки)."""
+        self.error = error
+
+
+class Metrics:
+    """
+    Метрики стадий обработки ИНН.
+
+    Для каждой стадии (egrul.search, pdf.parse, sheets.write, ...) накапливаются гистограмма
+    длительностей, число вызовов и ошибки по классам; счетчики (повторы и т.п.) хранятся
+    отдельно. Гистограммы и счетчики растут с начала процесса и отдаются в формате Prometheus,
+    а выборка для перцентилей и трассы ИНН (стадии каждого ИНН со смещением от начала его
+    обработки) сбрасываются в начале каждого прогона и попадают в отчет по его итогам.
+    """
+
+    def __init__(self, metrics_dir=METRICS_DIR, sample_size=METRICS_SAMPLE_SIZE, trace_limit=METRICS_TRACE_LIMIT):
+        self.metrics_dir = metrics_dir
+        self.sample_size = sample_size
+        self.trace_limit = trace_limit
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _StageStats] = {}
+        self._counters: Dict[tuple, float] = {}
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+        self._traces: Dict[str, Dict] = {}
+        self._run_started = time.time()
+
+    @contextmanager
+    def span(self, stage, inn=None):
+        """
+        Измеряет длительность блока как стадию stage. Исключение из блока учитывается
+        как ошибка стадии с именем класса исключения и пробрасывается дальше.
+
+        :param inn: ИНН для трассы; по умолчанию берется из контекста лога
+        """
+        span = _Span()
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            if span.error is None:
+                span.error = type(e).__name__
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started, span.error,
+                         inn or get_log_context('inn'), started_at)
+
+    def observe(self, stage, duration, error=None, inn=None, started_at=None):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = _StageStats()
+            stats.buckets[bisect_left(BUCKETS, duration)] += 1
+            stats.count += 1
+            stats.total += duration
+            if error is not None:
+                stats.errors[error] = stats.errors.get(error, 0) + 1
+                stats.run_errors[error] = stats.run_errors.get(error, 0) + 1
+
+            stats.seen += 1
+            if len(stats.samples) < self.sample_size:
+                stats.samples.append(duration)
+            else:
+                slot = random.randrange(stats.seen)
+                if slot < self.sample_size:
+                    stats.samples[slot] = duration
+
+            if inn is not None:
+                self._trace(inn, stage, duration, error, started_at or time.time() - duration)
+
+    def _trace(self, inn, stage, duration, error, started_at):
+        """Добавляет стадию в трассу ИНН. Вызывается под блокировкой."""
+        trace = self._traces.get(inn)
+        if trace is None:
+            if len(self._traces) >= self.trace_limit:
+                return
+            trace = self._traces[inn] = {'started_at': started_at, 'finished_at': started_at, 'spans': []}
+        trace['started_at'] = min(trace['started_at'], started_at)
+        trace['finished_at'] = max(trace['finished_at'], started_at + duration)
+        trace['spans'].append((stage, started_at, duration, error))
+
+    def inc(self, name, value=1, **labels):
+        """Увеличивает счетчик name (например, retries с меткой stage)."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_collector(self, name, collect: Callable[[], Dict]):
+        """
+        Регистрирует источник текущих значений (например, RateLimiter.metrics), которые
+        отдаются как gauge с префиксом name; нечисловые значения пропускаются.
+        """
+        with self._lock:
+            self._collectors[name] = collect
+
+    def reset_run(self):
+        """Начинает новый прогон: сбрасывает выборки для перцентилей и трассы."""
+        with self._lock:
+            for stats in self._stages.values():
+                stats.samples = []
+                stats.seen = 0
+                stats.run_errors = {}
+            self._traces = {}
+            self._run_started = time.time()
+
+    def summary(self) -> Dict[str, Dict]:
+        """Сводка текущего прогона по стадиям: число вызовов, ошибки и перцентили длительности в мс."""
+        with self._lock:
+            stages = {stage: (list(stats.samples), stats.seen, dict(stats.run_errors))
+                      for stage, stats in self._stages.items()}
+        summary = {}
+        for stage, (samples, seen, errors) in sorted(stages.items()):
+            if not seen:
+                continue
+            samples.sort()
+            entry = {'count': seen, 'errors': errors, 'mean_ms': round(sum(samples) / len(samples) * 1000, 1)}
+            for percentile in PERCENTILES:
+                entry[f'p{percentile}_ms'] = round(_percentile(samples, percentile) * 1000, 1)
+            entry['max_ms'] = round(samples[-1] * 1000, 1)
+            summary[stage] = entry
+        return summary
+
+    def render_prometheus(self) -> str:
+        """Метрики в текстовом формате Prometheus."""
+        with self._lock:
+            stages = {stage: (list(stats.buckets), stats.count, stats.total, dict(stats.errors))
+                      for stage, stats in self._stages.items()}
+            counters = dict(self._counters)
+            collectors = dict(self._collectors)
+
+        lines = [f'# TYPE {PREFIX}_stage_duration_seconds histogram']
+        for stage, (buckets, count, total, _) in sorted(stages.items()):
+            cumulative = 0
+            for bound, value in zip(BUCKETS + (math.inf,), buckets):
+                cumulative += value
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f'{PREFIX}_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{PREFIX}_stage_duration_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{PREFIX}_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+
+        lines.append(f'# TYPE {PREFIX}_stage_errors_total counter')
+        for stage, (_, _, _, errors) in sorted(stages.items()):
+            for error, value in sorted(errors.items()):
+                lines.append(f'{PREFIX}_stage_errors_total{{stage="{stage}",error="{error}"}} {value}')
+
+        declared = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in declared:
+                lines.append(f'# TYPE {PREFIX}_{name}_total counter')
+                declared.add(name)
+            lines.append(f'{PREFIX}_{name}_total{_labels(labels)} {value:g}')
+
+        for name, collect in sorted(collectors.items()):
+            try:
+                values = collect() or {}
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", name, e)
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'# TYPE {PREFIX}_{name}_{key} gauge')
+                    lines.append(f'{PREFIX}_{name}_{key} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path=None) -> str:
+        """
+        Записывает метрики в файл для textfile collector node_exporter.
+        Файл заменяется атомарно, чтобы сборщик не прочитал его наполовину.
+        """
+        path = path or os.path.join(self.metrics_dir, f'{PREFIX}.prom')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+        return path
+
+    def write_report(self, pipeline_stats=None, slowest=10) -> Optional[str]:
+        """
+        Записывает отчет по итогам прогона: перцентили стадий, счетчики и трассы самых
+        медленных ИНН; полные трассы всех ИНН - в соседний файл JSONL. Сводка выводится в лог.
+
+        :param pipeline_stats: счетчики конвейера (Pipeline.run)
+        :return: путь к отчету
+        """
+        summary = self.summary()
+        with self._lock:
+            traces = {inn: dict(trace, spans=list(trace['spans'])) for inn, trace in self._traces.items()}
+            counters = dict(self._counters)
+            run_started = self._run_started
+
+        for stage, entry in summary.items():
+            logger.info("Stage %-20s count %6d  p50 %8.1f ms  p95 %8.1f ms  p99 %8.1f ms  errors %s",
+                        stage, entry['count'], entry['p50_ms'], entry['p95_ms'], entry['p99_ms'],
+                        sum(entry['errors'].values()))
+
+        ranked = sorted(traces.items(), key=lambda item: item[1]['finished_at'] - item[1]['started_at'],
+                        reverse=True)
+        report = {
+            'started_at': datetime.fromtimestamp(run_started).isoformat(timespec='seconds'),
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'pipeline': pipeline_stats,
+            'stages': summary,
+            'counters': {name + _labels(labels): value for (name, labels), value in sorted(counters.items())},
+            'slowest': [_trace_entry(inn, trace) for inn, trace in ranked[:slowest]],
+        }
+
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        name = datetime.fromtimestamp(run_started).strftime('run-%Y%m%d-%H%M%S')
+        path = os.path.join(self.metrics_dir, f'{name}.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        with open(os.path.join(self.metrics_dir, f'{name}-traces.jsonl'), 'w', encoding='utf-8') as file:
+            for inn, trace in traces.items():
+                file.write(json.dumps(_trace_entry(inn, trace), ensure_ascii=False) + '\n')
+        self._prune()
+        logger.info("Run metrics report written to %s", path)
+        return path
+
+    def _prune(self):
+        reports = sorted(glob.glob(os.path.join(self.metrics_dir, 'run-*[0-9].json')))
+        for report in reports[:-METRICS_KEEP] if METRICS_KEEP > 0 else []:
+            for path in (report, report[:-len('.json')] + '-traces.jsonl'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def _percentile(samples, percentile):
+    """Перцентиль отсортированной выборки с линейной интерполяцией."""
+    if len(samples) == 1:
+        return samples[0]
+    position = (len(samples) - 1) * percentile / 100
+    low = int(position)
+    high = min(low + 1, len(samples) - 1)
+    return samples[low] + (samples[high] - samples[low]) * (position - low)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def _trace_entry(inn, trace):
+    started_at = trace['started_at']
+    return {
+        'inn': inn,
+        'total_ms': round((trace['finished_at'] - started_at) * 1000, 1),
+        'spans': [
+            {'stage': stage, 'offset_ms': round((span_start - started_at) * 1000, 1),
+             'duration_ms': round(duration * 1000, 1), 'error': error}
+            for stage, span_start, duration, error in sorted(trace['spans'], key=lambda span: span[1])
+        ],
+    }
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Возвращает общий для процесса реестр метрик или None, если метрики отключены."""
+    global _metrics
+    if not METRICS_ENABLED:
+        return None
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+@contextmanager
+def span(stage, inn=None):
+    """Metrics.span общего реестра; при отключенных метриках только выполняет блок."""
+    metrics = get_metrics()
+    if metrics is None:
+        yield _Span()
+        return
+    with metrics.span(stage, inn) as current:
+        yield current
+
+
+def inc(name, value=1, **labels):
+    """Metrics.inc общего реестра; при отключенных метриках ничего не делает."""
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.inc(name, value, **labels)
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Отдает метрики по HTTP (GET /metrics) в фоновом потоке; при port=0 ничего не делает."""
+    metrics = get_metrics()
+    if metrics is None or not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            logger.debug("%s %s", self.address_string(), format % args)
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info("Metrics endpoint listening on http://%s:%s/metrics", host, server.server_address[1])
+    return server
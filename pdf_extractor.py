@@ -1,8 +1,16 @@
 import re
+import signal
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 import PyPDF2
 from logger import get_logger
+from excerpt_cache import get_excerpt_cache, file_hash
+from egrul_sections import EgrulDocument, SectionTracker
+from metrics import span, inc
+from config import PDF_INCLUDE_FULL_TEXT, PDF_EXTRACT_WORKERS, PDF_EXTRACT_TIMEOUT
 from colorama import init, Fore, Style
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Tuple, Optional
 
 init(autoreset=True)
 
@@ -10,7 +18,12 @@ logger = get_logger(__name__)
 
 
 class PDFExtractor:
-    def __init__(self):
+    # Увеличивается при изменении логики разбора, чтобы не использовать устаревшие результаты из кэша
+    PARSER_VERSION = 4
+
+    def __init__(self, excerpt_cache=None, include_full_text=PDF_INCLUDE_FULL_TEXT):
+        self.cache = excerpt_cache or get_excerpt_cache()
+        self.include_full_text = include_full_text
         self.company_name_pattern = re.compile(
             r'(?:ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ|Полное наименование на русском языке)\s*"([^"]+)"',
             re.DOTALL | re.IGNORECASE
@@ -24,31 +37,123 @@ class PDFExtractor:
             re.DOTALL
         )
 
-    def extract_data(self, pdf_path):
+    def extract_data(self, pdf_path, include_full_text=None):
+        """
+        Извлекает наименования и участников из выписки.
+
+        Страницы читаются по одной и чтение прекращается после раздела об участниках,
+        если не запрошен полный текст (include_full_text, по умолчанию PDF_INCLUDE_FULL_TEXT).
+        """
+        if include_full_text is None:
+            include_full_text = self.include_full_text
         try:
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text = ''
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    page_text = self._preprocess_text(page_text)
-                    text += page_text + '\n'
-
-            data = {
-                'full_name': self._extract_full_company_name(text),
-                'short_name': self._extract_short_company_name(text),
-                'founders': self._extract_founders(text),
-                'full_text': text
-            }
-
-            logger.info(f"Successfully extracted data from {pdf_path}")
+            digest = None
+            if self.cache is not None:
+                digest = file_hash(pdf_path)
+                cached_data = self.cache.get_parsed(digest, self.PARSER_VERSION)
+                if cached_data is not None and (not include_full_text or 'full_text' in cached_data):
+                    logger.info("Using cached extraction result for %s", pdf_path)
+                    inc('pdf_cache_hits')
+                    return cached_data
+
+            with span('pdf.parse'):
+                if include_full_text:
+                    text = self.extract_text(pdf_path)
+                else:
+                    text = self._extract_required_text(pdf_path)
+
+                data = {
+                    'full_name': self._extract_full_company_name(text),
+                    'short_name': self._extract_short_company_name(text),
+                    'founders': self._extract_founders(text),
+                }
+            if include_full_text:
+                data['full_text'] = text
+
+            if self.cache is not None:
+                self.cache.put_parsed(digest, self.PARSER_VERSION, data)
+
+            logger.info("Successfully extracted data from %s", pdf_path)
             return data
         except Exception as e:
-            logger.error(f"Error extracting data from {pdf_path}: {str(e)}", exc_info=True)
+            logger.error("Error extracting data from %s: %s", pdf_path, e, exc_info=True)
             return None
 
+    @staticmethod
+    def extract_many(pdf_paths: Iterable[str], workers=PDF_EXTRACT_WORKERS, timeout=PDF_EXTRACT_TIMEOUT,
+                     include_full_text=False) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        Разбирает набор PDF в пуле процессов и отдает пары (путь, данные) по мере готовности.
+
+        Каждый процесс создает свой PDFExtractor один раз, задачам передается только путь.
+        Для файла, разбор которого упал, завис дольше timeout секунд или привел к аварийному
+        завершению процесса, возвращаются данные None; остальные файлы обрабатываются дальше.
+        """
+        pending = list(pdf_paths)
+        pending.reverse()
+        crashes = {}
+        max_in_flight = max(1, workers) * 4
+        context = multiprocessing.get_context('spawn')
+
+        while pending:
+            executor = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context,
+                                           initializer=_init_worker, initargs=(include_full_text,))
+            in_flight = {}
+            try:
+                while pending or in_flight:
+                    while pending and len(in_flight) < max_in_flight:
+                        path = pending.pop()
+                        in_flight[executor.submit(_extract_in_worker, path, timeout)] = path
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path = in_flight.pop(future)
+                        try:
+                            result = future.result()
+                        except BrokenProcessPool:
+                            in_flight[future] = path
+                            raise
+                        yield path, result
+            except BrokenProcessPool:
+                # Процесс пула аварийно завершился; виновника не узнать, поэтому файл, который
+                # дважды оказался среди незавершенных при падении, считается неразборчивым
+                for path in in_flight.values():
+                    crashes[path] = crashes.get(path, 0) + 1
+                    if crashes[path] >= 2:
+                        logger.error("Extraction of %s crashed the worker process, skipping", path)
+                        yield path, None
+                    else:
+                        pending.append(path)
+                logger.warning("Extraction worker pool crashed, restarting with %s file(s) left", len(pending))
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def iter_pages(self, pdf_path):
+        """Генератор подготовленного текста страниц; страница извлекается только по запросу."""
+        with open(pdf_path, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            for page in reader.pages:
+                yield self._preprocess_text(page.extract_text())
+
+    def extract_text(self, pdf_path):
+        return '\n'.join(self.iter_pages(pdf_path)) + '\n'
+
+    def _extract_required_text(self, pdf_path):
+        """Читает страницы, пока не будет прочитан раздел об участниках."""
+        tracker = SectionTracker()
+        pages = []
+        page_count = 0
+        for page_text in self.iter_pages(pdf_path):
+            page_count += 1
+            pages.append(page_text)
+            tracker.feed(page_text)
+            if tracker.is_complete('founders'):
+                break
+        logger.debug("Read %s page(s) of %s, sections seen: %s", page_count, pdf_path, tracker.seen)
+        return '\n'.join(pages) + '\n'
+
     def _preprocess_text(self, text):
-        text = re.sub(r'^\s*\d+\s*', '', text, flags=re.MULTILINE)
+        # Убираем номера строк таблицы в начале строки, но не день в датах вида 12.10.2017
+        text = re.sub(r'^\s*\d+(?![\d.])\s*', '', text, flags=re.MULTILINE)
         text = re.sub(r'\s+', ' ', text)
         return text.strip()
 
@@ -56,7 +161,7 @@ class PDFExtractor:
         match = self.company_name_pattern.search(text)
         if match:
             name = match.group(1).strip()
-            logger.debug(f"Extracted full company name: {name}")
+            logger.debug("Extracted full company name: %s", name)
             return f'ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ "{name}"'
         logger.warning("Full company name not found in PDF")
         return ''
@@ -65,12 +170,23 @@ class PDFExtractor:
         match = self.short_name_pattern.search(text)
         if match:
             name = match.group(1).strip()
-            logger.debug(f"Extracted short company name: {name}")
+            logger.debug("Extracted short company name: %s", name)
             return name
         logger.warning("Short company name not found in PDF")
         return ''
 
     def _extract_founders(self, text) -> List[Dict[str, str]]:
+        document = EgrulDocument(text)
+        if not document.has_section('founders'):
+            logger.warning("Founders section not found in PDF, falling back to pattern search")
+            return self._extract_founders_legacy(text)
+
+        founders = [record.to_dict() for record in document.founders]
+        if not founders:
+            logger.warning("No founders found in PDF")
+        return founders
+
+    def _extract_founders_legacy(self, text) -> List[Dict[str, str]]:
         founders = set()
         matches = self.founder_pattern.finditer(text)
         for match in matches:
@@ -85,6 +201,39 @@ class PDFExtractor:
         return [{"name": name, "inn": inn} for name, inn in founders]
 
 
+class ExtractionTimeout(Exception):
+    """Разбор одного PDF превысил отведенное время."""
+
+
+# Экземпляр PDFExtractor процесса пула extract_many: шаблоны компилируются один раз на процесс
+_worker_extractor = None
+
+
+def _init_worker(include_full_text):
+    global _worker_extractor
+    _worker_extractor = PDFExtractor(include_full_text=include_full_text)
+
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+
+def _extract_in_worker(pdf_path, timeout):
+    # SIGALRM есть только в POSIX; в Windows таймаут на файл не ограничивается
+    use_alarm = bool(timeout) and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.alarm(int(timeout))
+    try:
+        return _worker_extractor.extract_data(pdf_path)
+    except ExtractionTimeout:
+        logger.error("Extraction of %s timed out after %ss", pdf_path, timeout)
+        return None
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+
+
 def print_formatted_data(data):
     print(f"\n{Fore.CYAN}{Style.BRIGHT}Extracted Data:{Style.RESET_ALL}")
     print(f"{Fore.GREEN}Full Company Name: {Style.RESET_ALL}{data['full_name']}")
@@ -97,6 +246,17 @@ def print_formatted_data(data):
 
 
 if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        # Пакетный разбор: python pdf_extractor.py downloads/*.pdf
+        for path, data in PDFExtractor.extract_many(sys.argv[1:]):
+            if data:
+                print(f"{Fore.GREEN}{path}{Style.RESET_ALL}: {data['short_name']}, founders: {len(data['founders'])}")
+            else:
+                print(f"{Fore.RED}{path}: failed to extract data{Style.RESET_ALL}")
+        sys.exit(0)
+
     extractor = PDFExtractor()
     pdf_path = "/Users/roma/work/ParcerINN/downloads/7704256957.pdf"
     data = extractor.extract_data(pdf_path)
@@ -0,0 +1,293 @@
+import json
+import queue
+import hashlib
+import threading
+from logger import get_logger, log_context
+from metrics import span
+from excerpt_cache import file_hash
+from sinks import SheetsSink
+from config import PIPELINE_FETCH_WORKERS, PIPELINE_EXTRACT_WORKERS, PIPELINE_DIFF_WORKERS, PIPELINE_QUEUE_SIZE
+
+logger = get_logger('ParserINN')
+
+# Маркер конца потока данных между стадиями
+_STOP = object()
+
+
+class Pipeline:
+    """
+    Конвейер обработки ИНН: загрузка -> извлечение из PDF -> сравнение -> запись в таблицу.
+
+    Стадии работают в своих потоках и связаны ограниченными очередями, поэтому сетевая загрузка
+    следующих ИНН идет одновременно с разбором PDF и записью предыдущих, а медленная стадия
+    притормаживает быстрые. Ошибка при обработке одного ИНН не влияет на остальные.
+
+    :param parser_factory: функция без аргументов, создающая парсер ЕГРЮЛ; каждый поток загрузки
+        получает свой экземпляр, так как браузер нельзя использовать из нескольких потоков
+    :param journal: RunJournal; ИНН, уже записанные в этом прогоне, пропускаются, а скачанные
+        до перезапуска PDF используются повторно
+    :param sink: получатель обработанных строк (sinks.py); по умолчанию таблица через gs_handler,
+        из которой в любом случае читаются текущие данные компаний
+    :param coordinator: Coordinator; загрузку и разбор выписок выполняют узлы обработки,
+        а конвейер только сравнивает их результаты и пишет в таблицу
+    """
+
+    def __init__(self, parser_factory, pdf_extractor, data_processor, gs_handler,
+                 fetch_workers=PIPELINE_FETCH_WORKERS, extract_workers=PIPELINE_EXTRACT_WORKERS,
+                 diff_workers=PIPELINE_DIFF_WORKERS, queue_size=PIPELINE_QUEUE_SIZE, journal=None, coordinator=None,
+                 sink=None):
+        self.parser_factory = parser_factory
+        self.pdf_extractor = pdf_extractor
+        self.data_processor = data_processor
+        self.gs_handler = gs_handler
+        self.fetch_workers = fetch_workers
+        self.extract_workers = extract_workers
+        self.diff_workers = diff_workers
+        self.queue_size = queue_size
+        self.journal = journal
+        self.coordinator = coordinator
+        self.sink = sink or SheetsSink(gs_handler)
+
+        # Клиент Google API не потокобезопасен, поэтому обращения к таблице сериализуются
+        self._sheet_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {}
+
+        # Состояние компаний и индекс участников обновляются только после того, как строка
+        # действительно записана в таблицу
+        self.state_store = data_processor.state_store
+        self.founder_index = data_processor.founder_index
+        self._pending_state = {}
+        self._state_lock = threading.Lock()
+        if self.state_store is not None or self.founder_index is not None or self.journal is not None:
+            self.sink.add_flush_listener(self._on_rows_written)
+
+    def run(self, inn_list):
+        """Обрабатывает список ИНН и возвращает счетчики по стадиям."""
+        self.stats = {'total': len(inn_list), 'resumed': 0, 'fetched': 0, 'extracted': 0, 'unchanged': 0,
+                      'processed': 0, 'written': 0, 'failed': 0}
+
+        if self.journal is not None:
+            pending = self.journal.pending(inn_list)
+            self.stats['resumed'] = len(inn_list) - len(pending)
+            if self.stats['resumed']:
+                logger.info("Skipping %s INNs already written before restart", self.stats['resumed'])
+            inn_list = pending
+
+        if self.coordinator is not None:
+            return self._run_distributed(inn_list)
+
+        inn_queue = queue.Queue()
+        extract_queue = queue.Queue(self.queue_size)
+        diff_queue = queue.Queue(self.queue_size)
+        sink_queue = queue.Queue(self.queue_size)
+
+        for inn in inn_list:
+            inn_queue.put(inn)
+
+        threads = self._start_stages([
+            (self._fetch_worker, self.fetch_workers, inn_queue, extract_queue),
+            (self._extract_worker, self.extract_workers, extract_queue, diff_queue),
+            (self._diff_worker, self.diff_workers, diff_queue, sink_queue),
+            (self._sink_worker, 1, sink_queue, None),
+        ])
+        self._stop_stages(threads)
+
+        # ИНН, которые не взял ни один поток загрузки (например, не запустился браузер)
+        while not inn_queue.empty():
+            inn = inn_queue.get_nowait()
+            if inn is not _STOP:
+                logger.warning("INN %s was not processed: no fetch workers available", inn)
+                self._fail(inn, 'fetch')
+
+        logger.info("Pipeline finished: %s", self.stats)
+        return self.stats
+
+    def _run_distributed(self, inn_list):
+        """Сравнение и запись результатов, которые узлы обработки возвращают координатору."""
+        diff_queue = queue.Queue(self.queue_size)
+        sink_queue = queue.Queue(self.queue_size)
+        threads = self._start_stages([
+            (self._diff_worker, self.diff_workers, diff_queue, sink_queue),
+            (self._sink_worker, 1, sink_queue, None),
+        ])
+        try:
+            for inn, pdf_data in self.coordinator.run(inn_list):
+                if not pdf_data:
+                    logger.warning("Workers failed to process INN %s", inn)
+                    self._fail(inn, 'fetch')
+                    continue
+                self._count('fetched')
+                self._count('extracted')
+                diff_queue.put((inn, pdf_data))
+        finally:
+            self._stop_stages(threads)
+
+        logger.info("Pipeline finished: %s", self.stats)
+        return self.stats
+
+    @staticmethod
+    def _start_stages(stages):
+        threads = []
+        for target, count, in_queue, out_queue in stages:
+            stage_threads = [
+                threading.Thread(target=target, args=(in_queue, out_queue),
+                                 name=f"{target.__name__.strip('_')}-{i}", daemon=True)
+                for i in range(max(1, count))
+            ]
+            for thread in stage_threads:
+                thread.start()
+            threads.append((stage_threads, in_queue))
+        return threads
+
+    @staticmethod
+    def _stop_stages(threads):
+        # Останавливаем стадии по порядку: следующая получает маркеры конца только после того,
+        # как все потоки предыдущей завершились и выложили свои результаты
+        for stage_threads, in_queue in threads:
+            for _ in stage_threads:
+                in_queue.put(_STOP)
+            for thread in stage_threads:
+                thread.join()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _fail(self, inn, stage):
+        self._count('failed')
+        if self.journal is not None:
+            self.journal.record(inn, 'failed', at=stage)
+
+    def _journal(self, inn, stage, **fields):
+        if self.journal is not None:
+            self.journal.record(inn, stage, **fields)
+
+    def _fetch_worker(self, in_queue, out_queue):
+        parser = None
+        try:
+            parser = self.parser_factory()
+            while True:
+                inn = in_queue.get()
+                if inn is _STOP:
+                    break
+                with log_context(inn=inn, stage='fetch'), span('pipeline.fetch', inn):
+                    try:
+                        logger.info("Processing INN: %s", inn)
+                        pdf_file = self.journal.fetched_pdf(inn) if self.journal is not None else None
+                        if pdf_file:
+                            logger.info("Reusing PDF fetched before restart for INN %s: %s", inn, pdf_file)
+                        else:
+                            pdf_file = parser.get_pdf(inn)
+                            if not pdf_file:
+                                logger.warning("Failed to get PDF for INN: %s", inn)
+                                self._fail(inn, 'fetch')
+                                continue
+                            if self.journal is not None:
+                                self._journal(inn, 'fetched', pdf_path=pdf_file, hash=file_hash(pdf_file))
+                        self._count('fetched')
+                        out_queue.put((inn, pdf_file))
+                    except Exception as e:
+                        logger.error("Error fetching INN %s: %s", inn, e, exc_info=True)
+                        self._fail(inn, 'fetch')
+        except Exception as e:
+            # Не удалось создать парсер: оставшиеся ИНН разберут другие потоки загрузки
+            logger.error("Fetch worker failed: %s", e, exc_info=True)
+        finally:
+            if parser is not None and hasattr(parser, 'close'):
+                parser.close()
+
+    def _extract_worker(self, in_queue, out_queue):
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                break
+            inn, pdf_file = item
+            with log_context(inn=inn, stage='extract'), span('pipeline.extract', inn):
+                try:
+                    pdf_data = self.pdf_extractor.extract_data(pdf_file)
+                    if not pdf_data:
+                        logger.warning("Failed to extract data from PDF for INN: %s", inn)
+                        self._fail(inn, 'extract')
+                        continue
+                    logger.debug("Extracted data from PDF for INN %s: %s", inn, pdf_data)
+                    logger.info("Number of founders extracted: %s", len(pdf_data.get('founders', [])))
+                    self._count('extracted')
+                    if self.journal is not None:
+                        self._journal(inn, 'extracted', pdf_path=pdf_file, hash=_result_hash(pdf_data))
+                    out_queue.put((inn, pdf_data))
+                except Exception as e:
+                    logger.error("Error extracting data for INN %s: %s", inn, e, exc_info=True)
+                    self._fail(inn, 'extract')
+
+    def _diff_worker(self, in_queue, out_queue):
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                break
+            inn, pdf_data = item
+            with log_context(inn=inn, stage='diff'), span('pipeline.diff', inn):
+                try:
+                    if self.data_processor.is_unchanged(inn, pdf_data):
+                        logger.info("INN %s is unchanged since the last run, skipping", inn)
+                        self._count('unchanged')
+                        # Время проверки обновляется отдельно от времени изменения данных, иначе после
+                        # перезапуска планировщик сочтет компанию давно не проверенной
+                        if self.state_store is not None:
+                            self.state_store.mark_checked([inn])
+                        self._journal(inn, 'written', unchanged=True)
+                        continue
+
+                    with self._sheet_lock:
+                        current_data = self.gs_handler.get_company_data(inn)
+                    logger.debug("Current data for INN %s: %s", inn, current_data)
+
+                    processed_data = self.data_processor.process(inn, pdf_data, current_data or {})
+                    logger.debug("Processed data for INN %s: %s", inn, processed_data)
+                    logger.info("Number of current founders after processing: %s",
+                                len(processed_data['current_founders'].split(',')))
+                    logger.info("Number of former founders after processing: %s",
+                                len(processed_data['former_founders'].split(',')))
+                    self._count('processed')
+                    out_queue.put((inn, processed_data, self.data_processor.state_for(pdf_data),
+                                   pdf_data.get('founders', [])))
+                except Exception as e:
+                    logger.error("Error processing INN %s: %s", inn, e, exc_info=True)
+                    self._fail(inn, 'diff')
+
+    def _sink_worker(self, in_queue, out_queue):
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                break
+            inn, processed_data, state, founders = item
+            with log_context(inn=inn, stage='write'), span('pipeline.write', inn):
+                try:
+                    if self.state_store is not None or self.founder_index is not None:
+                        with self._state_lock:
+                            self._pending_state[inn] = (state, processed_data['name'], founders)
+                    with self._sheet_lock:
+                        update_result = self.sink.write(inn, processed_data)
+                    logger.info("Update result for INN %s: %s", inn, update_result)
+                    if update_result:
+                        self._count('written')
+                    else:
+                        self._fail(inn, 'write')
+                except Exception as e:
+                    logger.error("Error writing INN %s: %s", inn, e, exc_info=True)
+                    self._fail(inn, 'write')
+
+    def _on_rows_written(self, inns):
+        with self._state_lock:
+            written = [(inn, self._pending_state.pop(inn)) for inn in inns if inn in self._pending_state]
+        if self.state_store is not None:
+            self.state_store.save_many([(inn,) + state for inn, (state, _, _) in written])
+        for inn, (_, name, founders) in written:
+            self.data_processor.index_founders(inn, name, founders)
+        # Стадия written отмечается только после подтвержденной записи в таблицу
+        for inn in inns:
+            self._journal(inn, 'written')
+
+
+def _result_hash(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
@@ -0,0 +1,180 @@
+import math
+import time
+import heapq
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from config import SCHEDULER_WINDOW, SCHEDULER_TICK, SCHEDULER_REFRESH_INTERVAL, SCHEDULER_CHANGED_DAYS, \
+    SCHEDULER_CHANGED_FACTOR
+
+logger = logging.getLogger(__name__)
+
+CHANGE_DATE_FORMATS = ('%d.%m.%Y', '%Y-%m-%d')
+
+
+def _parse_change_date(value) -> Optional[float]:
+    for date_format in CHANGE_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).timestamp()
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+
+class PriorityScheduler:
+    """
+    Непрерывный планировщик проверки ИНН вместо ежедневного прогона всего списка.
+
+    ИНН хранятся в куче по времени следующей проверки (давно не проверенные - первыми).
+    Каждая компания проверяется не реже раза в window секунд, а недавно изменившиеся
+    (дата изменения моложе changed_days дней) - в changed_factor раз чаще. За один тик
+    берется столько ИНН, сколько приходится на тик при равномерном распределении всех
+    проверок по окну, поэтому нагрузка на ЕГРЮЛ и квоту Google Sheets не идет всплесками.
+
+    :param clock: источник времени, по умолчанию time.time
+    """
+
+    def __init__(self, window=SCHEDULER_WINDOW, tick=SCHEDULER_TICK, changed_days=SCHEDULER_CHANGED_DAYS,
+                 changed_factor=SCHEDULER_CHANGED_FACTOR, clock=time.time):
+        self.window = window
+        self.tick = tick
+        self.changed_days = changed_days
+        self.changed_factor = max(1.0, changed_factor)
+        self.clock = clock
+
+        self._heap = []  # (время проверки, -приоритет, ИНН)
+        self._due: Dict[str, float] = {}  # актуальное время проверки; записи кучи с другим временем устарели
+        self._changed_at: Dict[str, Optional[float]] = {}
+        self._last_checked: Dict[str, float] = {}
+        self._last_lag = 0.0
+        self._checked = 0
+
+    def priority(self, inn) -> float:
+        """Во сколько раз чаще базового окна проверяется компания."""
+        changed_at = self._changed_at.get(inn)
+        if changed_at is not None and self.clock() - changed_at < self.changed_days * 86400:
+            return self.changed_factor
+        return 1.0
+
+    def interval(self, inn) -> float:
+        return self.window / self.priority(inn)
+
+    def update_inns(self, change_dates: Dict[str, str], last_checked: Optional[Dict[str, float]] = None):
+        """
+        Синхронизирует очередь со списком ИНН из таблицы.
+
+        Новые ИНН ставятся в очередь сразу (или по времени прошлой проверки из last_checked),
+        удаленные из таблицы - перестают проверяться.
+
+        :param change_dates: ИНН -> дата изменения из таблицы
+        :param last_checked: ИНН -> время последней проверки (например, из хранилища состояния)
+        """
+        last_checked = last_checked or {}
+        added = 0
+        for inn, change_date in change_dates.items():
+            self._changed_at[inn] = _parse_change_date(change_date)
+            if inn in self._due:
+                continue
+            checked_at = self._last_checked.get(inn) or last_checked.get(inn)
+            if checked_at:
+                self._last_checked[inn] = checked_at
+            self._schedule(inn, checked_at + self.interval(inn) if checked_at else 0.0)
+            added += 1
+
+        removed = [inn for inn in self._due if inn not in change_dates]
+        for inn in removed:
+            del self._due[inn]
+            self._changed_at.pop(inn, None)
+        if removed:
+            # Убираем удаленные ИНН из кучи, чтобы она не росла
+            self._heap = [entry for entry in self._heap if self._due.get(entry[2]) == entry[0]]
+            heapq.heapify(self._heap)
+
+        if added or removed:
+            logger.info("Scheduler queue updated: %s added, %s removed, %s total", added, len(removed), len(self._due))
+
+    def _schedule(self, inn, due):
+        self._due[inn] = due
+        heapq.heappush(self._heap, (due, -self.priority(inn), inn))
+
+    def batch_size(self) -> int:
+        """Число проверок за тик, при котором все проверки окна распределены равномерно."""
+        checks_per_window = sum(self.priority(inn) for inn in self._due)
+        return math.ceil(checks_per_window * self.tick / self.window) if checks_per_window else 0
+
+    def next_batch(self) -> List[str]:
+        """Забирает из очереди ИНН, срок проверки которых наступил, не больше batch_size."""
+        now = self.clock()
+        limit = self.batch_size()
+        batch = []
+        while self._heap and len(batch) < limit and self._heap[0][0] <= now:
+            due, _, inn = heapq.heappop(self._heap)
+            if self._due.get(inn) != due:
+                continue
+            batch.append(inn)
+            self._last_lag = now - due if due else 0.0
+        return batch
+
+    def complete(self, inns):
+        """Отмечает ИНН проверенными и ставит их в очередь на следующую проверку."""
+        now = self.clock()
+        for inn in inns:
+            if inn not in self._due:
+                continue
+            self._last_checked[inn] = now
+            self._schedule(inn, now + self.interval(inn))
+        self._checked += len(inns)
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Метрики очереди.
+
+        queue_depth - число ИНН в очереди, overdue - ИНН с наступившим сроком,
+        max_lag - наибольшее отставание от срока в секундах, last_lag - отставание
+        последнего взятого ИНН, checked - проверено с момента запуска.
+        """
+        now = self.clock()
+        overdue = sum(1 for due in self._due.values() if due <= now)
+        # У еще не проверенных ИНН срока нет, они учитываются отдельно
+        lags = [now - due for due in self._due.values() if 0 < due <= now]
+        never_checked = sum(1 for inn in self._due if inn not in self._last_checked)
+        return {
+            'queue_depth': len(self._due),
+            'overdue': overdue,
+            'never_checked': never_checked,
+            'max_lag': round(max(lags, default=0.0), 1),
+            'last_lag': round(self._last_lag, 1),
+            'batch_size': self.batch_size(),
+            'checked': self._checked,
+        }
+
+    def run_forever(self, process_batch: Callable[[List[str]], object], load_inns: Callable[[], Dict[str, str]],
+                    last_checked: Optional[Dict[str, float]] = None, refresh_interval=SCHEDULER_REFRESH_INTERVAL):
+        """
+        Основной цикл: раз в тик обрабатывает очередную порцию ИНН, периодически перечитывая список.
+
+        :param process_batch: обработка списка ИНН (main.process_companies)
+        :param load_inns: загрузка ИНН -> дата изменения из таблицы
+        :param last_checked: время прошлых проверок для начального заполнения очереди
+        """
+        last_refresh = None
+        while True:
+            started = self.clock()
+            if last_refresh is None or started - last_refresh >= refresh_interval:
+                try:
+                    self.update_inns(load_inns(), last_checked if last_refresh is None else None)
+                except Exception as e:
+                    logger.error("Error loading INN list for scheduler: %s", e, exc_info=True)
+                last_refresh = started
+
+            batch = self.next_batch()
+            if batch:
+                try:
+                    process_batch(batch)
+                except Exception as e:
+                    logger.error("Error processing scheduled batch: %s", e, exc_info=True)
+                # Неудачные ИНН не ставятся в начало очереди, чтобы не забивать ее повторами
+                self.complete(batch)
+            logger.info("Scheduler metrics: %s", self.metrics())
+
+            time.sleep(max(0.0, self.tick - (self.clock() - started)))
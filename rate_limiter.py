@@ -0,0 +1,204 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from typing import Dict
+from metrics import span, inc
+from config import EGRUL_RATE_INITIAL, EGRUL_RATE_MIN, EGRUL_RATE_MAX, EGRUL_RATE_INCREASE, EGRUL_RATE_DECREASE, \
+    EGRUL_RATE_BURST, EGRUL_BREAKER_THRESHOLD, EGRUL_BREAKER_COOLDOWN, EGRUL_BREAKER_MAX_COOLDOWN, RETRY_DELAY, \
+    RETRY_MAX_DELAY
+
+logger = logging.getLogger(__name__)
+
+# Виды неудачных обращений к сайту
+TIMEOUT = 'timeout'  # страница или выписка не дождались
+NO_BUTTON = 'no_button'  # в результатах поиска нет кнопки выписки
+THROTTLED = 'throttled'  # HTTP 429/503 или капча
+ERROR = 'error'  # прочие ошибки: соединение, 5xx, неожиданный ответ
+
+# Сигналы, при которых сайт, скорее всего, перегружен, и темп нужно снизить
+CONGESTION_SIGNALS = (TIMEOUT, NO_BUTTON, THROTTLED)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+def backoff_delay(attempt, base=RETRY_DELAY, cap=RETRY_MAX_DELAY):
+    """Пауза перед повтором: экспоненциальный рост с полным случайным разбросом (full jitter)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RateLimiter:
+    """
+    Общий для всех потоков ограничитель обращений к ЕГРЮЛ.
+
+    Темп (ИНН в минуту) регулируется по схеме AIMD: успешно обработанный ИНН прибавляет increase,
+    а признак перегрузки сайта (таймаут, пропавшая кнопка, 429/капча) умножает темп на decrease.
+    Запросы выдаются из корзины токенов, поэтому потоки не уходят на сайт одновременно,
+    а равномерно в пределах текущего темпа.
+
+    Если подряд случилось breaker_threshold неудач, автоматический выключатель
+    останавливает все потоки на cooldown секунд. Затем пропускается один пробный запрос:
+    успех возвращает обычную работу, неудача удваивает паузу (не больше max_cooldown).
+    """
+
+    def __init__(self, rate=EGRUL_RATE_INITIAL, min_rate=EGRUL_RATE_MIN, max_rate=EGRUL_RATE_MAX,
+                 increase=EGRUL_RATE_INCREASE, decrease=EGRUL_RATE_DECREASE, burst=EGRUL_RATE_BURST,
+                 breaker_threshold=EGRUL_BREAKER_THRESHOLD, cooldown=EGRUL_BREAKER_COOLDOWN,
+                 max_cooldown=EGRUL_BREAKER_MAX_COOLDOWN):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.breaker_threshold = breaker_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self._condition = threading.Condition()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+
+        self.state = CLOSED
+        self._cooldown = cooldown
+        self._opened_until = 0.0
+        self._probe_in_flight = False
+        self._consecutive_failures = 0
+
+        self._completed = deque()  # время успешных выписок за последнюю минуту
+        self._counters = {'success': 0, TIMEOUT: 0, NO_BUTTON: 0, THROTTLED: 0, ERROR: 0, 'breaker_trips': 0}
+        self._last_report = time.monotonic()
+
+    def acquire(self):
+        """Ждет разрешения на следующее обращение к сайту."""
+        with span('egrul.rate_wait'), self._condition:
+            while True:
+                now = time.monotonic()
+                wait = self._breaker_wait(now)
+                if wait is None:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        if self.state == HALF_OPEN:
+                            self._probe_in_flight = True
+                        return
+                    wait = (1 - self._tokens) * 60.0 / self.rate
+                self._condition.wait(wait)
+
+    def _breaker_wait(self, now):
+        """Сколько ждать из-за выключателя или None, если обращение разрешено."""
+        if self.state == OPEN:
+            if now < self._opened_until:
+                return self._opened_until - now
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+            logger.info("Circuit breaker half-open: sending a probe request")
+        if self.state == HALF_OPEN and self._probe_in_flight:
+            # Пока пробный запрос не завершился, остальные ждут
+            return 1.0
+        return None
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate / 60.0)
+        self._refilled_at = now
+
+    def on_success(self, completed=True):
+        """
+        Учитывает успешное обращение.
+
+        Темп увеличивается один раз на ИНН, сколько бы обращений ни понадобилось для его обработки.
+
+        :param completed: обращение завершило обработку ИНН: темп увеличивается, а ИНН учитывается
+            в темпе ИНН в минуту; промежуточное обращение (поиск для пробы) только сбрасывает счетчик
+            неудач и закрывает выключатель
+        """
+        with self._condition:
+            self._counters['success'] += 1
+            self._consecutive_failures = 0
+            if self.state != CLOSED:
+                logger.info("Circuit breaker closed: EGRUL is responding again")
+                self.state = CLOSED
+                self._cooldown = self.base_cooldown
+                self._probe_in_flight = False
+            now = time.monotonic()
+            if completed:
+                self._complete(now)
+            self._report(now)
+            self._condition.notify_all()
+
+    def mark_completed(self):
+        """Учитывает ИНН, обработанный без отдельного обращения (например, по пробе изменений)."""
+        with self._condition:
+            self._complete(time.monotonic())
+
+    def _complete(self, now):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+        self._completed.append(now)
+
+    def on_failure(self, kind=ERROR):
+        """Учитывает неудачное обращение; kind - один из TIMEOUT, NO_BUTTON, THROTTLED, ERROR."""
+        inc('egrul_failures', kind=kind)
+        with self._condition:
+            self._counters[kind] += 1
+            self._consecutive_failures += 1
+            if kind in CONGESTION_SIGNALS:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                # Корзину опустошаем, чтобы накопленные токены не ушли на сайт пачкой
+                self._tokens = min(self._tokens, 0.0)
+
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                self._trip(now, min(self.max_cooldown, self._cooldown * 2))
+            elif self.state == CLOSED and self._consecutive_failures >= self.breaker_threshold:
+                self._trip(now, self._cooldown)
+            self._report(now)
+            self._condition.notify_all()
+
+    def _trip(self, now, cooldown):
+        self._cooldown = cooldown
+        self.state = OPEN
+        self._opened_until = now + cooldown
+        self._probe_in_flight = False
+        self._counters['breaker_trips'] += 1
+        logger.warning("Circuit breaker open: pausing EGRUL requests for %.0fs after %s consecutive failures",
+                       cooldown, self._consecutive_failures)
+
+    def inns_per_minute(self) -> int:
+        with self._condition:
+            self._trim(time.monotonic())
+            return len(self._completed)
+
+    def _trim(self, now):
+        while self._completed and now - self._completed[0] > 60:
+            self._completed.popleft()
+
+    def metrics(self) -> Dict[str, float]:
+        with self._condition:
+            self._trim(time.monotonic())
+            metrics = {'rate_limit': round(self.rate, 2), 'inns_per_minute': len(self._completed),
+                       'breaker': self.state}
+            metrics.update(self._counters)
+            return metrics
+
+    def _report(self, now):
+        # Текущий темп выводится в лог не чаще раза в минуту
+        if now - self._last_report < 60:
+            return
+        self._last_report = now
+        self._trim(now)
+        logger.info("EGRUL rate: %s INNs/min, limit %.1f/min, breaker %s, counters %s",
+                    len(self._completed), self.rate, self.state, self._counters)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Возвращает общий для процесса ограничитель обращений к ЕГРЮЛ."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
@@ -0,0 +1,173 @@
+import os
+import json
+import glob
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from config import RUN_JOURNAL_ENABLED, RUN_JOURNAL_DIR, RUN_JOURNAL_FSYNC_INTERVAL, RUN_JOURNAL_FSYNC_BATCH, \
+    RUN_JOURNAL_KEEP, RUN_JOURNAL_MAX_AGE
+
+logger = logging.getLogger(__name__)
+
+# Стадии обработки ИНН в порядке выполнения
+STAGES = ('fetched', 'extracted', 'written')
+
+
+class RunJournal:
+    """
+    Журнал прогона process_companies: заголовок с хэшем списка ИНН прогона и по строке JSON
+    на каждую завершенную стадию ИНН.
+
+    Файл только дописывается, поэтому после падения процесса в нем остаются все стадии,
+    кроме последних несброшенных записей. fsync выполняется пачками: раз в fsync_interval
+    секунд или каждые fsync_batch записей. Последняя строка может быть оборвана - при
+    открытии журнала она отрезается.
+
+    :param inn_list_hash: хэш списка ИНН (inn_list_hash) для заголовка нового журнала
+    :ivar entries: ИНН -> стадия -> запись журнала (путь к PDF, хэш результата)
+    """
+
+    def __init__(self, path, inn_list_hash=None, fsync_interval=RUN_JOURNAL_FSYNC_INTERVAL,
+                 fsync_batch=RUN_JOURNAL_FSYNC_BATCH):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self.entries: Dict[str, Dict[str, Dict]] = {}
+        self.completed = False
+        self.inn_list_hash = inn_list_hash
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        exists = os.path.exists(path)
+        if exists:
+            self.inn_list_hash = None
+            self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+        if not exists:
+            header = {'event': 'run_started', 'ts': round(self.started_at, 3), 'inn_list_hash': inn_list_hash}
+            self._file.write(json.dumps(header) + '\n')
+            self._sync()
+
+    def _load(self):
+        complete = 0
+        with open(self.path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                complete += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('event') == 'run_started':
+                    self.inn_list_hash = entry.get('inn_list_hash')
+                    self.started_at = entry.get('ts', self.started_at)
+                elif entry.get('event') == 'run_completed':
+                    self.completed = True
+                elif entry.get('inn'):
+                    self.entries.setdefault(entry['inn'], {})[entry['stage']] = entry
+        if complete < os.path.getsize(self.path):
+            # Оборванная при падении строка отрезается, иначе следующая запись склеилась бы с ней
+            logger.warning("Truncating incomplete last line of run journal %s", self.path)
+            with open(self.path, 'r+b') as file:
+                file.truncate(complete)
+
+    def record(self, inn, stage, **fields):
+        """Дописывает завершение стадии ИНН (fetched, extracted, written или failed)."""
+        entry = {'inn': inn, 'stage': stage, 'ts': round(time.time(), 3)}
+        entry.update(fields)
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            stages = self.entries.setdefault(inn, {})
+            stages[stage] = entry
+            if stage == 'written':
+                stages.pop('failed', None)
+            self._file.write(line)
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_batch or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def is_written(self, inn) -> bool:
+        return 'written' in self.entries.get(inn, {})
+
+    def fetched_pdf(self, inn) -> Optional[str]:
+        """Путь к PDF, скачанному до перезапуска, если файл еще на месте и не изменился."""
+        entry = self.entries.get(inn, {}).get('fetched')
+        if not entry or not entry.get('pdf_path') or not os.path.exists(entry['pdf_path']):
+            return None
+        if entry.get('hash'):
+            from excerpt_cache import file_hash
+            if file_hash(entry['pdf_path']) != entry['hash']:
+                return None
+        return entry['pdf_path']
+
+    def pending(self, inn_list):
+        """ИНН списка, которые еще не записаны в таблицу в этом прогоне."""
+        return [inn for inn in inn_list if not self.is_written(inn)]
+
+    def close(self, completed=False):
+        """Сбрасывает журнал на диск; completed=True помечает прогон завершенным."""
+        with self._lock:
+            if self._file.closed:
+                return
+            if completed:
+                self._file.write(json.dumps({'event': 'run_completed', 'ts': round(time.time(), 3)}) + '\n')
+                self.completed = True
+            self._sync()
+            self._file.close()
+
+
+def inn_list_hash(inn_list: Iterable[str]) -> str:
+    """Хэш набора ИНН прогона; порядок строк в таблице на него не влияет."""
+    return hashlib.sha256('\n'.join(sorted(set(inn_list))).encode('utf-8')).hexdigest()
+
+
+def open_run_journal(inn_list, journal_dir=RUN_JOURNAL_DIR, keep=RUN_JOURNAL_KEEP,
+                     max_age=RUN_JOURNAL_MAX_AGE) -> Optional[RunJournal]:
+    """
+    Открывает журнал незавершенного прогона того же списка ИНН для продолжения или начинает новый.
+
+    Прерванный прогон продолжается, только если список ИНН совпадает и журнал начат не раньше
+    max_age секунд назад (0 - без ограничения). Иначе записанные когда-то ИНН пропускались бы
+    в других прогонах, например в порциях планировщика в непрерывном режиме.
+
+    :return: RunJournal или None, если журнал отключен в конфигурации
+    """
+    if not RUN_JOURNAL_ENABLED:
+        return None
+    os.makedirs(journal_dir, exist_ok=True)
+    paths = sorted(glob.glob(os.path.join(journal_dir, 'run-*.jsonl')))
+    list_hash = inn_list_hash(inn_list)
+
+    if paths:
+        journal = RunJournal(paths[-1])
+        if not journal.completed:
+            age = time.time() - journal.started_at
+            if journal.inn_list_hash != list_hash:
+                logger.info("Not resuming unfinished run %s: the INN list has changed", paths[-1])
+            elif max_age and age > max_age:
+                logger.info("Not resuming unfinished run %s: started %.0f s ago", paths[-1], age)
+            else:
+                written = sum(1 for stages in journal.entries.values() if 'written' in stages)
+                logger.info("Resuming unfinished run from %s: %s INNs already written", paths[-1], written)
+                return journal
+        journal.close()
+
+    # Старые журналы больше не нужны для продолжения, оставляем несколько последних для разбора
+    for old_path in paths[:max(0, len(paths) - keep + 1)]:
+        os.remove(old_path)
+
+    path = os.path.join(journal_dir, f"run-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.jsonl")
+    logger.info("Starting new run journal %s", path)
+    return RunJournal(path, inn_list_hash=list_hash)
@@ -0,0 +1,283 @@
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+RANGE_PATTERN = re.compile(r'^(?:(?P<sheet>[^!]+)!)?(?P<c1>[A-Z]+)(?P<r1>\d*)(?::(?P<c2>[A-Z]+)(?P<r2>\d*))?$')
+DEFAULT_SHEET = 'Sheet1'
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+class Spreadsheet:
+    """Значения одного листа: список строк, строка - список ячеек (строк)."""
+
+    def __init__(self, rows=None):
+        self.rows = [list(row) for row in rows or []]
+
+    def parse_range(self, range_name):
+        """A1-диапазон -> (первая строка, последняя строка, первая колонка, последняя колонка), с 0."""
+        match = RANGE_PATTERN.match(range_name)
+        if not match:
+            raise ValueError(f'Unable to parse range: {range_name}')
+        c1, r1, c2, r2 = match.group('c1', 'r1', 'c2', 'r2')
+        first_row = int(r1) - 1 if r1 else 0
+        last_row = int(r2) - 1 if r2 else (first_row if c2 is None and r1 else None)
+        first_col = _column_index(c1)
+        last_col = _column_index(c2) if c2 else first_col
+        return first_row, last_row, first_col, last_col
+
+    def get(self, range_name):
+        first_row, last_row, first_col, last_col = self.parse_range(range_name)
+        end = len(self.rows) if last_row is None else min(last_row + 1, len(self.rows))
+        values = []
+        for row in self.rows[first_row:end]:
+            cells = row[first_col:last_col + 1]
+            # API не возвращает пустые ячейки в конце строки и пустые строки в конце диапазона
+            while cells and cells[-1] == '':
+                cells.pop()
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def update(self, range_name, values):
+        first_row, _, first_col, _ = self.parse_range(range_name)
+        for offset, new_cells in enumerate(values):
+            index = first_row + offset
+            while len(self.rows) <= index:
+                self.rows.append([])
+            row = self.rows[index]
+            end = first_col + len(new_cells)
+            if len(row) < end:
+                row.extend([''] * (end - len(row)))
+            row[first_col:end] = ['' if cell is None else str(cell) for cell in new_cells]
+        return len(values), max((len(cells) for cells in values), default=0)
+
+
+class SheetsEmulator:
+    """
+    Локальный эмулятор Google Sheets API v4 в объеме, который использует GoogleSheetsHandler:
+    spreadsheets.values get, update, batchGet и batchUpdate.
+
+    :param latency: задержка каждого ответа в секундах
+    :param error_rate: доля запросов, на которые эмулятор отвечает HTTP 429 RESOURCE_EXHAUSTED
+    :param quota_per_minute: предел запросов за скользящую минуту, как квота Sheets API на пользователя
+        (0 - без ограничения); запросы сверх предела получают HTTP 429
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, quota_per_minute=0):
+        self.spreadsheets = {}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_per_minute = quota_per_minute
+        self.lock = threading.Lock()
+        self._recent = deque()
+        self.counters = {'requests': 0, 'reads': 0, 'writes': 0, 'rows_written': 0, 'quota_errors': 0}
+
+    def add_spreadsheet(self, spreadsheet_id, rows=None) -> Spreadsheet:
+        with self.lock:
+            sheet = self.spreadsheets[spreadsheet_id] = Spreadsheet(rows)
+        return sheet
+
+    def admit(self):
+        """Учитывает запрос; возвращает False, если запрос нужно отклонить по квоте."""
+        now = time.monotonic()
+        with self.lock:
+            self.counters['requests'] += 1
+            if self.error_rate and random.random() < self.error_rate:
+                self.counters['quota_errors'] += 1
+                return False
+            if self.quota_per_minute:
+                while self._recent and now - self._recent[0] > 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.quota_per_minute:
+                    self.counters['quota_errors'] += 1
+                    return False
+                self._recent.append(now)
+        return True
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+def _strip_sheet(range_name):
+    return range_name.split('!', 1)[1] if '!' in range_name else range_name
+
+
+def _a1(range_name):
+    return range_name if '!' in range_name else f'{DEFAULT_SHEET}!{range_name}'
+
+
+def make_handler(emulator):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_PUT(self):
+            self._dispatch('PUT')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def _dispatch(self, method):
+            url = urlparse(self.path)
+            try:
+                body = self._read_body()
+            except ValueError as e:
+                # Как настоящий API: ошибка клиента не должна выглядеть как успешная запись нуля строк
+                self._send_error(400, 'INVALID_ARGUMENT', f'Invalid JSON payload received. {e}')
+                return
+            if emulator.latency:
+                time.sleep(emulator.latency)
+            if not emulator.admit():
+                self._send_error(429, 'RESOURCE_EXHAUSTED',
+                                 "Quota exceeded for quota metric 'Requests' and limit "
+                                 "'Requests per minute per user'")
+                return
+
+            match = re.match(r'^/v4/spreadsheets/([^/]+)/values(?:/(.+)|:(batchGet|batchUpdate))$', url.path)
+            if not match:
+                self._send_error(404, 'NOT_FOUND', 'Requested entity was not found.')
+                return
+            spreadsheet_id, range_name, action = match.group(1), match.group(2), match.group(3)
+            sheet = emulator.spreadsheets.get(spreadsheet_id)
+            if sheet is None:
+                self._send_error(404, 'NOT_FOUND', 'Requested entity was not found.')
+                return
+
+            emulator.count('reads' if method == 'GET' else 'writes')
+            try:
+                params = parse_qs(url.query)
+                if method == 'GET' and range_name:
+                    self._send_json(self._get(sheet, unquote(range_name)))
+                elif method == 'PUT' and range_name:
+                    self._send_json(self._update(spreadsheet_id, sheet, unquote(range_name), body))
+                elif method == 'GET' and action == 'batchGet':
+                    value_ranges = [self._get(sheet, range_name) for range_name in params.get('ranges', [])]
+                    self._send_json({'spreadsheetId': spreadsheet_id, 'valueRanges': value_ranges})
+                elif method == 'POST' and action == 'batchUpdate':
+                    responses = [self._update(spreadsheet_id, sheet, item['range'], item)
+                                 for item in body.get('data', [])]
+                    self._send_json({
+                        'spreadsheetId': spreadsheet_id,
+                        'totalUpdatedRows': sum(r['updatedRows'] for r in responses),
+                        'totalUpdatedColumns': max((r['updatedColumns'] for r in responses), default=0),
+                        'totalUpdatedCells': sum(r['updatedCells'] for r in responses),
+                        'totalUpdatedSheets': 1 if responses else 0,
+                        'responses': responses,
+                    })
+                else:
+                    self._send_error(404, 'NOT_FOUND', 'Requested entity was not found.')
+            except (ValueError, KeyError) as e:
+                self._send_error(400, 'INVALID_ARGUMENT', str(e))
+
+        def _get(self, sheet, range_name):
+            with emulator.lock:
+                values = sheet.get(_strip_sheet(range_name))
+            result = {'range': _a1(range_name), 'majorDimension': 'ROWS'}
+            if values:
+                result['values'] = values
+            return result
+
+        def _update(self, spreadsheet_id, sheet, range_name, body):
+            with emulator.lock:
+                rows, columns = sheet.update(_strip_sheet(range_name), body.get('values', []))
+                emulator.counters['rows_written'] += rows
+            return {'spreadsheetId': spreadsheet_id, 'updatedRange': _a1(range_name), 'updatedRows': rows,
+                    'updatedColumns': columns, 'updatedCells': rows * columns}
+
+        def _read_body(self):
+            """Тело запроса JSON; пустое тело - {}, неразбираемое - ValueError."""
+            length = int(self.headers.get('Content-Length', 0))
+            if not length:
+                return {}
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+            if not isinstance(body, dict):
+                raise ValueError('Request body must be a JSON object')
+            return body
+
+        def _send_error(self, code, status, message):
+            self._send_json({'error': {'code': code, 'message': message, 'status': status}}, code)
+
+        def _send_json(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=UTF-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def start_emulator(emulator=None, host='127.0.0.1', port=0):
+    """
+    Запускает эмулятор в фоновом потоке и возвращает сервер; адрес для SHEETS_API_ENDPOINT -
+    http://<хост>:<server.server_address[1]>/.
+    """
+    emulator = emulator or SheetsEmulator()
+    server = ThreadingHTTPServer((host, port), make_handler(emulator))
+    server.daemon_threads = True
+    server.emulator = emulator
+    thread = threading.Thread(target=server.serve_forever, name='sheets-emulator', daemon=True)
+    thread.start()
+    return server
+
+
+def synthetic_rows(count, first_inn=7700000000, founders=3):
+    """Строки листа A-E для count компаний (начиная со строки 2, над ними строка заголовков)."""
+    rows = [['ИНН', 'Название', 'Текущие участники', 'Бывшие участники', 'Дата изменения']]
+    for number in range(count):
+        inn = str(first_inn + number)
+        participants = ', '.join(f'УЧАСТНИК {number}-{i} {770000000000 + number * 10 + i}' for i in range(founders))
+        rows.append([inn, f'ООО "КОМПАНИЯ-{number}"', participants, '', '01.01.2024'])
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Локальный эмулятор Google Sheets API v4')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--spreadsheet-id', default='local')
+    parser.add_argument('--rows', type=int, default=1000, help='компаний в листе')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, сек')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов HTTP 429')
+    parser.add_argument('--quota-per-minute', type=int, default=0, help='предел запросов в минуту, 0 - без предела')
+    args = parser.parse_args(argv)
+
+    emulator = SheetsEmulator(args.latency, args.error_rate, args.quota_per_minute)
+    emulator.add_spreadsheet(args.spreadsheet_id, synthetic_rows(args.rows))
+    server = start_emulator(emulator, port=args.port)
+    print(f"Эмулятор Sheets API запущен: SHEETS_API_ENDPOINT=http://127.0.0.1:{server.server_address[1]}/ "
+          f"GOOGLE_SHEET_ID={args.spreadsheet_id}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(60)
+            print(f"Sheets emulator stats: {emulator.stats()}", file=sys.stderr)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
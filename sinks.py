@@ -0,0 +1,329 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, List, Set, Tuple
+from metrics import span
+from config import OUTPUT_SINKS, OUTPUT_SQLITE_PATH, OUTPUT_JSONL_PATH, OUTPUT_CSV_PATH, OUTPUT_BATCH_SIZE, \
+    SHEETS_SYNC_AT_END
+
+logger = logging.getLogger(__name__)
+
+# Колонки строки компании, как в таблице A-E
+FIELDS = ('name', 'current_founders', 'former_founders', 'change_date')
+
+
+class Sink(ABC):
+    """
+    Получатель обработанных данных компаний (результат DataProcessor.process).
+
+    write принимает строку, а слушатели add_flush_listener вызываются со списком ИНН,
+    когда строки надежно сохранены (записаны в таблицу, зафиксированы в базе, сброшены на диск).
+
+    :cvar merges_writes: несколько записей одного ИНН до сохранения объединяются в одну строку
+        и подтверждаются одним уведомлением; иначе каждая запись подтверждается отдельно
+    """
+    merges_writes = False
+
+    def __init__(self):
+        self._flush_listeners = []
+
+    def add_flush_listener(self, callback):
+        """Регистрирует callback(список ИНН), вызываемый после сохранения строк."""
+        self._flush_listeners.append(callback)
+
+    def _notify_written(self, inns):
+        for callback in self._flush_listeners:
+            try:
+                callback(inns)
+            except Exception as e:
+                logger.error("Flush listener failed: %s", e, exc_info=True)
+
+    @abstractmethod
+    def write(self, inn, data) -> bool:
+        """Принимает строку компании; False, если ее не удалось принять или сохранить."""
+
+    def flush(self) -> bool:
+        return True
+
+    def close(self):
+        self.flush()
+
+
+class SheetsSink(Sink):
+    """
+    Запись в Google Sheets через GoogleSheetsHandler (отложенная запись пачками - его настройка).
+
+    :param sync_at_end: строки копятся в памяти и отправляются в таблицу при close, поэтому прогон
+        идет со скоростью локальных получателей, а таблица обновляется один раз в конце
+    """
+    merges_writes = True
+
+    def __init__(self, gs_handler, sync_at_end=SHEETS_SYNC_AT_END):
+        super().__init__()
+        self.gs_handler = gs_handler
+        self.sync_at_end = sync_at_end
+        self._deferred: Dict[str, Dict] = {}
+        gs_handler.add_flush_listener(self._notify_written)
+
+    def write(self, inn, data) -> bool:
+        if self.sync_at_end:
+            self._deferred[inn] = data
+            return True
+        return self.gs_handler.update_company_data(inn, data)
+
+    def flush(self) -> bool:
+        return self.gs_handler.flush()
+
+    def close(self):
+        if self._deferred:
+            logger.info("Syncing %s rows to the sheet", len(self._deferred))
+            for inn, data in self._deferred.items():
+                if not self.gs_handler.update_company_data(inn, data):
+                    logger.error("Failed to sync INN %s to the sheet", inn)
+            self._deferred = {}
+        self.gs_handler.close()
+
+
+class SQLiteSink(Sink):
+    """
+    Таблица companies в SQLite: последняя строка каждой компании.
+    Строки вставляются пачками по batch_size в одной транзакции.
+    """
+
+    def __init__(self, db_path=OUTPUT_SQLITE_PATH, batch_size=OUTPUT_BATCH_SIZE):
+        super().__init__()
+        self.batch_size = batch_size
+        self._buffer: List[tuple] = []
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS companies (
+                inn TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                current_founders TEXT NOT NULL,
+                former_founders TEXT NOT NULL,
+                change_date TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def write(self, inn, data) -> bool:
+        self._buffer.append((inn,) + tuple(data.get(field, '') for field in FIELDS) + (time.time(),))
+        if len(self._buffer) >= self.batch_size:
+            return self.flush()
+        return True
+
+    def flush(self) -> bool:
+        if not self._buffer:
+            return True
+        rows = self._buffer
+        try:
+            with span('sink.sqlite'), self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO companies VALUES (?, ?, ?, ?, ?, ?)', rows)
+        except sqlite3.Error as e:
+            # Строки остаются в буфере и будут записаны при следующем flush
+            logger.error("Failed to write %s rows to SQLite: %s", len(rows), e)
+            return False
+        self._buffer = []
+        self._notify_written([row[0] for row in rows])
+        return True
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+class JSONLSink(Sink):
+    """
+    Лента изменений: файл только дописывается, по строке JSON на каждую записанную компанию.
+    Строки сбрасываются на диск (fsync) пачками по batch_size.
+    """
+
+    def __init__(self, path=OUTPUT_JSONL_PATH, batch_size=OUTPUT_BATCH_SIZE):
+        super().__init__()
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._unsynced: List[str] = []
+
+    def write(self, inn, data) -> bool:
+        entry = {'ts': round(time.time(), 3), 'inn': inn}
+        entry.update((field, data.get(field, '')) for field in FIELDS)
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._unsynced.append(inn)
+        if len(self._unsynced) >= self.batch_size:
+            return self.flush()
+        return True
+
+    def flush(self) -> bool:
+        if not self._unsynced:
+            return True
+        try:
+            with span('sink.jsonl'):
+                self._file.flush()
+                os.fsync(self._file.fileno())
+        except OSError as e:
+            logger.error("Failed to sync change feed: %s", e)
+            return False
+        inns, self._unsynced = self._unsynced, []
+        self._notify_written(inns)
+        return True
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class CSVSink(Sink):
+    """
+    Выгрузка в CSV: строки прогона объединяются с уже выгруженными и файл целиком
+    перезаписывается при close (через временный файл). Кодировка utf-8-sig для Excel.
+    """
+    merges_writes = True
+
+    def __init__(self, path=OUTPUT_CSV_PATH):
+        super().__init__()
+        self.path = path
+        self._rows: Dict[str, Dict] = {}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def write(self, inn, data) -> bool:
+        self._rows[inn] = data
+        return True
+
+    def close(self):
+        if not self._rows:
+            return
+        rows = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8-sig', newline='') as file:
+                rows = {row['inn']: row for row in csv.DictReader(file)}
+        for inn, data in self._rows.items():
+            rows[inn] = dict({field: data.get(field, '') for field in FIELDS}, inn=inn)
+
+        tmp_path = self.path + '.tmp'
+        with span('sink.csv'), open(tmp_path, 'w', encoding='utf-8-sig', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=('inn',) + FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows.values())
+        os.replace(tmp_path, self.path)
+        logger.info("Exported %s companies to %s", len(rows), self.path)
+        self._notify_written(list(self._rows))
+        self._rows = {}
+
+
+class MultiSink(Sink):
+    """
+    Запись в несколько получателей. Запись ИНН считается сохраненной, когда ее подтвердили все получатели.
+
+    Каждая запись получает порядковый номер в пределах ИНН; подтверждения учитываются как набор
+    получателей для пары (ИНН, номер записи), поэтому повторное уведомление одного получателя
+    или повторная запись того же ИНН не засчитываются за подтверждение других получателей.
+    """
+
+    def __init__(self, sinks: List[Sink]):
+        super().__init__()
+        self.sinks = sinks
+        self._lock = threading.Lock()
+        self._sequence: Dict[str, int] = {}
+        # Номера записей, еще не подтвержденных получателем: получатель -> ИНН -> номера по порядку
+        self._outstanding: List[Dict[str, Deque[int]]] = [{} for _ in sinks]
+        self._confirmations: Dict[Tuple[str, int], Set[int]] = {}
+        for position, sink in enumerate(sinks):
+            sink.add_flush_listener(lambda inns, position=position: self._on_sink_written(position, inns))
+
+    def _on_sink_written(self, position, inns):
+        merges_writes = self.sinks[position].merges_writes
+        outstanding = self._outstanding[position]
+        written = []
+        with self._lock:
+            for inn in inns:
+                sequences = outstanding.get(inn)
+                if not sequences:
+                    # Повторное уведомление об уже подтвержденной записи
+                    continue
+                for _ in range(len(sequences) if merges_writes else 1):
+                    key = (inn, sequences.popleft())
+                    confirmed = self._confirmations.get(key)
+                    if confirmed is None:
+                        # Запись не принял другой получатель, сохраненной она уже не будет
+                        continue
+                    confirmed.add(position)
+                    if len(confirmed) == len(self.sinks):
+                        del self._confirmations[key]
+                        written.append(inn)
+                if not sequences:
+                    del outstanding[inn]
+        if written:
+            self._notify_written(written)
+
+    def write(self, inn, data) -> bool:
+        # Номер записи регистрируется до вызова получателей: они могут подтвердить запись сразу
+        with self._lock:
+            sequence = self._sequence[inn] = self._sequence.get(inn, 0) + 1
+            self._confirmations[(inn, sequence)] = set()
+            for outstanding in self._outstanding:
+                outstanding.setdefault(inn, deque()).append(sequence)
+
+        # Ошибка одного получателя не мешает записи в остальные
+        results = [self._write_to(sink, inn, data) for sink in self.sinks]
+        if not all(results):
+            with self._lock:
+                self._confirmations.pop((inn, sequence), None)
+                for result, outstanding in zip(results, self._outstanding):
+                    sequences = outstanding.get(inn)
+                    if not result and sequences and sequence in sequences:
+                        sequences.remove(sequence)
+                        if not sequences:
+                            del outstanding[inn]
+        return all(results)
+
+    @staticmethod
+    def _write_to(sink, inn, data) -> bool:
+        try:
+            return sink.write(inn, data)
+        except Exception as e:
+            logger.error("Failed to write INN %s to %s: %s", inn, type(sink).__name__, e, exc_info=True)
+            return False
+
+    def flush(self) -> bool:
+        results = [sink.flush() for sink in self.sinks]
+        return all(results)
+
+    def close(self):
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logger.error("Failed to close %s: %s", type(sink).__name__, e, exc_info=True)
+
+
+def create_sink(gs_handler, names=OUTPUT_SINKS) -> Sink:
+    """
+    Создает получатель по списку имен через запятую: sheets, sqlite, jsonl, csv.
+    Несколько имен объединяются в MultiSink.
+    """
+    sinks = []
+    for name in (name.strip() for name in names.split(',')):
+        if name == 'sheets':
+            sinks.append(SheetsSink(gs_handler))
+        elif name == 'sqlite':
+            sinks.append(SQLiteSink())
+        elif name == 'jsonl':
+            sinks.append(JSONLSink())
+        elif name == 'csv':
+            sinks.append(CSVSink())
+        elif name:
+            raise ValueError(f"Неизвестный получатель данных: {name}")
+    if not sinks:
+        raise ValueError("OUTPUT_SINKS не содержит ни одного получателя")
+    return sinks[0] if len(sinks) == 1 else MultiSink(sinks)
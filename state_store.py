@@ -0,0 +1,185 @@
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import STATE_STORE_ENABLED, STATE_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+FOUNDER_INN_PATTERN = re.compile(r'\b(\d{10}|\d{12})\b')
+
+
+def founder_key(name, inn):
+    """Нормализованный идентификатор участника: ИНН, а при его отсутствии - наименование."""
+    if inn:
+        return inn
+    return ' '.join(name.upper().split())
+
+
+def parse_founder_string(value) -> Tuple[str, str]:
+    """
+    Разбирает участника из ячейки таблицы ("ФИО ИНН", иногда с датой и переводами строк).
+
+    :return: (наименование, ИНН)
+    """
+    value = ' '.join(value.split())
+    match = FOUNDER_INN_PATTERN.search(value)
+    if not match:
+        return value, ''
+    return value[:match.start()].strip(), match.group(1)
+
+
+def compute_fingerprint(name, founders: Iterable[Tuple[str, str]]):
+    """Отпечаток состояния компании: наименование и отсортированный набор участников."""
+    digest = hashlib.sha1(name.encode('utf-8'))
+    for key in sorted(founder_key(founder_name, inn) for founder_name, inn in founders):
+        digest.update(b'\x00')
+        digest.update(key.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class StateStore:
+    """
+    Локальное состояние компаний после последнего успешного прогона.
+
+    Для каждого ИНН хранится отпечаток (наименование + набор участников) и нормализованный
+    набор участников, чтобы сравнивать новые выписки с ним, а не с текстом ячеек таблицы.
+    updated_at - время последнего сохранения изменившихся данных, checked_at - время последней
+    проверки, в том числе без изменений (по нему планировщик определяет очередь после перезапуска).
+    """
+
+    def __init__(self, db_path=STATE_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS companies (
+                inn TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                checked_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS founders (
+                company_inn TEXT NOT NULL,
+                founder_key TEXT NOT NULL,
+                name TEXT NOT NULL,
+                founder_inn TEXT NOT NULL,
+                PRIMARY KEY (company_inn, founder_key)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS probes (
+                inn TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                checked_at REAL NOT NULL
+            );
+        ''')
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(companies)')}
+        if 'checked_at' not in columns:
+            # База прежней версии: время проверки начинается с времени последнего сохранения
+            self._conn.execute('ALTER TABLE companies ADD COLUMN checked_at REAL')
+            self._conn.execute('UPDATE companies SET checked_at = updated_at')
+        self._conn.commit()
+
+    def get_fingerprint(self, inn) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute('SELECT fingerprint FROM companies WHERE inn = ?', (inn,)).fetchone()
+        return row[0] if row else None
+
+    def get_founders(self, inn) -> Optional[Dict[str, Tuple[str, str]]]:
+        """
+        Участники компании по состоянию последнего прогона.
+
+        :return: ключ участника -> (наименование, ИНН) или None, если компания еще не обрабатывалась
+        """
+        with self._lock:
+            known = self._conn.execute('SELECT 1 FROM companies WHERE inn = ?', (inn,)).fetchone()
+            if known is None:
+                return None
+            rows = self._conn.execute(
+                'SELECT founder_key, name, founder_inn FROM founders WHERE company_inn = ?', (inn,)).fetchall()
+        return {key: (name, founder_inn) for key, name, founder_inn in rows}
+
+    def get_probe(self, inn) -> Optional[str]:
+        """Отпечаток результата поиска ЕГРЮЛ на момент последней скачанной выписки."""
+        with self._lock:
+            row = self._conn.execute('SELECT fingerprint FROM probes WHERE inn = ?', (inn,)).fetchone()
+        return row[0] if row else None
+
+    def save_probe(self, inn, fingerprint, checked_at):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO probes (inn, fingerprint, checked_at) VALUES (?, ?, ?)',
+                               (inn, fingerprint, checked_at))
+
+    def checked_times(self) -> Dict[str, float]:
+        """ИНН -> время последней проверки компании (для начального заполнения планировщика)."""
+        with self._lock:
+            rows = self._conn.execute('SELECT inn, COALESCE(checked_at, updated_at) FROM companies').fetchall()
+        return dict(rows)
+
+    def mark_checked(self, inns: Iterable[str]):
+        """Отмечает проверку компаний, данные которых не изменились; updated_at не меняется."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany('UPDATE companies SET checked_at = ? WHERE inn = ?', [(now, inn) for inn in inns])
+
+    def iter_companies(self):
+        """
+        Перебирает все сохраненные компании.
+
+        :return: генератор (ИНН, наименование, дата обновления, [(наименование участника, ИНН участника)])
+        """
+        with self._lock:
+            companies = self._conn.execute('SELECT inn, name, updated_at FROM companies ORDER BY inn').fetchall()
+            rows = self._conn.execute(
+                'SELECT company_inn, name, founder_inn FROM founders ORDER BY company_inn').fetchall()
+        founders = {}
+        for company_inn, name, founder_inn in rows:
+            founders.setdefault(company_inn, []).append((name, founder_inn))
+        for inn, name, updated_at in companies:
+            yield inn, name, updated_at, founders.get(inn, [])
+
+    def save_many(self, items: List[Tuple[str, str, str, List[Tuple[str, str]]]]):
+        """
+        Сохраняет состояние компаний одной транзакцией.
+
+        :param items: список (ИНН, отпечаток, наименование, [(наименование участника, ИНН участника)])
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            for inn, fingerprint, name, founders in items:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO companies (inn, name, fingerprint, updated_at, checked_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (inn, name, fingerprint, now, now))
+                self._conn.execute('DELETE FROM founders WHERE company_inn = ?', (inn,))
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO founders (company_inn, founder_key, name, founder_inn) '
+                    'VALUES (?, ?, ?, ?)',
+                    [(inn, founder_key(founder_name, founder_inn), founder_name, founder_inn)
+                     for founder_name, founder_inn in founders])
+        logger.info("Saved state for %s companies", len(items))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """Возвращает общее для процесса хранилище состояния или None, если оно отключено в конфигурации."""
+    global _store
+    if not STATE_STORE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = StateStore()
+        return _store
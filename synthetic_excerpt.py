@@ -0,0 +1,305 @@
+import os
+import sys
+import zlib
+import random
+import argparse
+from typing import Dict, List, Optional
+
+# Строк текста на странице выписки (A4, кегль 8)
+LINES_PER_PAGE = 60
+# Длина строки, после которой значение ячейки переносится, как в таблице выписки
+WRAP_WIDTH = 90
+
+SURNAMES = ['ИВАНОВ', 'ПЕТРОВ', 'СИДОРОВ', 'КУЗНЕЦОВ', 'СМИРНОВ', 'ПОПОВ', 'ВАСИЛЬЕВ', 'СОКОЛОВ',
+            'МИХАЙЛОВ', 'НОВИКОВ', 'ФЕДОРОВ', 'МОРОЗОВ', 'ВОЛКОВ', 'АЛЕКСЕЕВ', 'ЛЕБЕДЕВ', 'СЕМЕНОВ']
+NAMES = ['ИВАН', 'ПЕТР', 'СЕРГЕЙ', 'АЛЕКСЕЙ', 'ДМИТРИЙ', 'АНДРЕЙ', 'МИХАИЛ', 'НИКОЛАЙ', 'ОЛЕГ', 'ЮРИЙ']
+PATRONYMICS = ['ИВАНОВИЧ', 'ПЕТРОВИЧ', 'СЕРГЕЕВИЧ', 'АЛЕКСЕЕВИЧ', 'ДМИТРИЕВИЧ', 'АНДРЕЕВИЧ',
+               'МИХАЙЛОВИЧ', 'НИКОЛАЕВИЧ']
+WORDS = ['РОМАШКА', 'ВЕКТОР', 'ГОРИЗОНТ', 'СФЕРА', 'АЛЬЯНС', 'ПРОГРЕСС', 'ГАРАНТ', 'ЛИДЕР', 'СТРОЙИНВЕСТ',
+         'ТЕХНОЛОГИИ', 'ЛОГИСТИК', 'ФАКТОР', 'КАПИТАЛ', 'РЕСУРС', 'ПАРТНЕР', 'ДЕВЕЛОПМЕНТ']
+ACTIVITIES = [
+    ('62.01', 'Разработка компьютерного программного обеспечения'),
+    ('62.02', 'Деятельность консультативная и работы в области компьютерных технологий'),
+    ('46.90', 'Торговля оптовая неспециализированная'),
+    ('68.20', 'Аренда и управление собственным или арендованным недвижимым имуществом'),
+    ('70.22', 'Консультирование по вопросам коммерческой деятельности и управления'),
+    ('41.20', 'Строительство жилых и нежилых зданий'),
+    ('49.41', 'Деятельность автомобильного грузового транспорта'),
+    ('64.99', 'Предоставление прочих финансовых услуг, кроме услуг по страхованию и пенсионному обеспечению'),
+]
+
+FULL_FORM = 'ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ'
+
+
+def _digits(rng, count):
+    return str(rng.randint(1, 9)) + ''.join(str(rng.randint(0, 9)) for _ in range(count - 1))
+
+
+def _date(rng):
+    return f'{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(2003, 2024)}'
+
+
+def make_company(inn, founders=3, holding_share=0.0, seed=None) -> Dict:
+    """
+    Описание синтетической компании: наименования, ОГРН и участники.
+
+    :param founders: число участников
+    :param holding_share: доля участников - юридических лиц (выписки холдингов)
+    :param seed: зерно генератора; одинаковые параметры дают одинаковую компанию
+    """
+    rng = random.Random(f'{seed}-{inn}')
+    name = f'{rng.choice(WORDS)}-{rng.randint(1, 999)}'
+    participants = []
+    seen = set()
+    while len(participants) < founders:
+        if rng.random() < holding_share:
+            founder = {'name': f'{FULL_FORM} "{rng.choice(WORDS)} {rng.choice(WORDS)}-{rng.randint(1, 9999)}"',
+                       'inn': _digits(rng, 10), 'ogrn': _digits(rng, 13), 'kind': 'org'}
+        else:
+            founder = {'name': f'{rng.choice(SURNAMES)} {rng.choice(NAMES)} {rng.choice(PATRONYMICS)}',
+                       'inn': _digits(rng, 12), 'kind': 'person'}
+        if (founder['name'], founder['inn']) in seen:
+            continue
+        seen.add((founder['name'], founder['inn']))
+        founder['date'] = _date(rng)
+        founder['share'] = str(round(100 / founders, 4))
+        founder['nominal'] = str(rng.randint(1, 1000) * 100)
+        participants.append(founder)
+
+    return {
+        'inn': inn,
+        'ogrn': _digits(rng, 13),
+        'full_name': f'{FULL_FORM} "{name}"',
+        'short_name': f'ООО "{name}"',
+        'founders': participants,
+        'seed': seed,
+    }
+
+
+def excerpt_rows(company, pages=None) -> List[str]:
+    """
+    Строки таблицы выписки: номер строки, заголовок поля и значение, как их отдает PDF ЕГРЮЛ.
+
+    :param pages: дополнить выписку сведениями о видах деятельности и записях до этого числа страниц
+    """
+    rng = random.Random(f"{company['seed']}-{company['inn']}-rows")
+    rows = []
+
+    def row(text):
+        rows.append(f'{len(rows) + 1} {text}')
+
+    def record():
+        return f'ГРН и дата внесения в ЕГРЮЛ записи, содержащей указанные сведения {_digits(rng, 13)} {_date(rng)}'
+
+    row('Наименование')
+    row(f"Полное наименование на русском языке {company['full_name']}")
+    row(record())
+    row(f"Сокращенное наименование на русском языке {company['short_name']}")
+    row(record())
+    row('Место нахождения и адрес юридического лица')
+    row(f'Адрес юридического лица 1{rng.randint(10000, 99999)}, Г.МОСКВА, УЛ. {rng.choice(WORDS)}, Д. {rng.randint(1, 99)}')
+    row(record())
+    row('Сведения о регистрации')
+    row(f"ОГРН {company['ogrn']}")
+    row(f'Дата регистрации {_date(rng)}')
+    row(record())
+    row('Сведения о регистрирующем органе по месту нахождения юридического лица')
+    row('Наименование регистрирующего органа Межрайонная инспекция Федеральной налоговой службы № 46 по г. Москве')
+    row(record())
+    row('Сведения об уставном капитале / складочном капитале / уставном фонде / паевом фонде')
+    row(f'Вид Уставный капитал Размер (в рублях) {rng.randint(100, 10000) * 1000}')
+    row(record())
+    row('Сведения о лице, имеющем право без доверенности действовать от имени юридического лица')
+    row(record())
+    row(f'Фамилия Имя Отчество {rng.choice(SURNAMES)} {rng.choice(NAMES)} {rng.choice(PATRONYMICS)}')
+    row(f'ИНН {_digits(rng, 12)}')
+    row('Должность ГЕНЕРАЛЬНЫЙ ДИРЕКТОР')
+
+    row('Сведения об участниках / учредителях юридического лица')
+    for founder in company['founders']:
+        row(f"ГРН и дата внесения в ЕГРЮЛ сведений о данном лице {_digits(rng, 13)} {founder['date']}")
+        if founder['kind'] == 'org':
+            row(f"ОГРН {founder['ogrn']}")
+            row(f"ИНН {founder['inn']}")
+            row(f"Полное наименование {founder['name']}")
+        else:
+            row(f"Фамилия Имя Отчество {founder['name']}")
+            row(f"ИНН {founder['inn']}")
+        row(f"ГРН и дата внесения в ЕГРЮЛ записи, содержащей указанные сведения {_digits(rng, 13)} {founder['date']}")
+        row(f"Номинальная стоимость доли (в рублях) {founder['nominal']}")
+        row(f"Размер доли (в процентах) {founder['share']}")
+
+    row('Сведения об учете в налоговом органе')
+    row(f"ИНН юридического лица {company['inn']}")
+    row(f'КПП юридического лица {_digits(rng, 9)}')
+    row(record())
+    row('Сведения о видах экономической деятельности')
+    for code, title in rng.sample(ACTIVITIES, rng.randint(2, len(ACTIVITIES))):
+        row(f'Код и наименование вида деятельности {code} {title}')
+        row(record())
+
+    row('Сведения о записях, внесенных в Единый государственный реестр юридических лиц')
+    target_lines = (pages or 0) * LINES_PER_PAGE
+    while len(_wrap(rows)) < target_lines or rows[-1].endswith('юридических лиц'):
+        row(f'ГРН и дата внесения записи в ЕГРЮЛ {_digits(rng, 13)} {_date(rng)}')
+        row('Причина внесения записи в ЕГРЮЛ Изменение сведений о юридическом лице, содержащихся в ЕГРЮЛ')
+        row('Наименование регистрирующего органа, которым запись внесена в ЕГРЮЛ '
+            'Межрайонная инспекция Федеральной налоговой службы № 46 по г. Москве')
+    return rows
+
+
+def _wrap(rows) -> List[str]:
+    """Переносит длинные значения на следующие строки, как в ячейках таблицы выписки."""
+    lines = []
+    for text in rows:
+        while len(text) > WRAP_WIDTH:
+            cut = text.rfind(' ', 0, WRAP_WIDTH)
+            if cut <= 0:
+                cut = WRAP_WIDTH
+            lines.append(text[:cut])
+            text = text[cut:].lstrip()
+        lines.append(text)
+    return lines
+
+
+def paginate(company, rows) -> List[List[str]]:
+    """Разбивает строки по страницам и добавляет шапку и колонтитулы."""
+    lines = _wrap(rows)
+    body = LINES_PER_PAGE - 2
+    chunks = [lines[i:i + body] for i in range(0, len(lines), body)] or [[]]
+    stamp = '01.07.2024 12:00'
+    pages = []
+    for number, chunk in enumerate(chunks, start=1):
+        page = []
+        if number == 1:
+            page += ['ВЫПИСКА', 'из Единого государственного реестра юридических лиц',
+                     company['full_name'], f"ОГРН {company['ogrn']}"]
+        page += chunk
+        page.append(f"Страница {number} из {len(chunks)} Выписка из ЕГРЮЛ {stamp} ОГРН {company['ogrn']}")
+        pages.append(page)
+    return pages
+
+
+def _to_unicode_cmap():
+    """CMap ToUnicode для однобайтовой кодировки cp1251, по которой извлекается текст."""
+    chars = []
+    for code in range(0x80, 0x100):
+        try:
+            char = bytes([code]).decode('cp1251')
+        except UnicodeDecodeError:
+            continue
+        chars.append(f'<{code:02X}> <{ord(char):04X}>')
+    blocks = [chars[i:i + 100] for i in range(0, len(chars), 100)]
+    body = ''.join(f'{len(block)} beginbfchar\n' + '\n'.join(block) + '\nendbfchar\n' for block in blocks)
+    return (
+        '/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+        '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n'
+        '/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+        '1 begincodespacerange\n<00> <FF>\nendcodespacerange\n'
+        '1 beginbfrange\n<20> <7E> <0020>\nendbfrange\n'
+        f'{body}endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n'
+    ).encode('ascii')
+
+
+def _pdf_string(text):
+    data = text.encode('cp1251', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def build_pdf(pages: List[List[str]]) -> bytes:
+    """Собирает PDF со сжатыми потоками страниц; текст извлекается PyPDF2 через ToUnicode."""
+    objects: List[Optional[bytes]] = [None, None]  # каталог и дерево страниц заполняются в конце
+
+    def add(obj):
+        objects.append(obj)
+        return len(objects)
+
+    def stream(data, compress=True):
+        if compress:
+            data = zlib.compress(data)
+            return b'<</Length %d/Filter/FlateDecode>>stream\n' % len(data) + data + b'\nendstream'
+        return b'<</Length %d>>stream\n' % len(data) + data + b'\nendstream'
+
+    cmap = add(stream(_to_unicode_cmap(), compress=False))
+    font = add(b'<</Type/Font/Subtype/Type1/BaseFont/Helvetica'
+               b'/Encoding<</Type/Encoding/BaseEncoding/WinAnsiEncoding>>/ToUnicode %d 0 R>>' % cmap)
+
+    kids = []
+    for lines in pages:
+        content = [b'BT /F1 8 Tf 12 TL 40 800 Td']
+        for line in lines:
+            content.append(_pdf_string(line) + b" '")
+        content.append(b'ET')
+        contents = add(stream(b'\n'.join(content)))
+        kids.append(add(b'<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]'
+                        b'/Resources<</Font<</F1 %d 0 R>>>>/Contents %d 0 R>>' % (font, contents)))
+
+    objects[0] = b'<</Type/Catalog/Pages 2 0 R>>'
+    objects[1] = b'<</Type/Pages/Kids[%s]/Count %d>>' % (b' '.join(b'%d 0 R' % kid for kid in kids), len(kids))
+
+    body = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += b'%d 0 obj\n' % number + obj + b'\nendobj\n'
+    xref_offset = len(body)
+    body += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    body += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    body += b'trailer<</Size %d/Root 1 0 R>>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref_offset)
+    return body
+
+
+def excerpt_pdf(company, pages=None) -> bytes:
+    """PDF выписки для компании из make_company."""
+    return build_pdf(paginate(company, excerpt_rows(company, pages)))
+
+
+def generate_corpus(directory, count, founders=3, pages=None, holding_share=0.0, seed=0,
+                    first_inn=7700000000) -> List[Dict]:
+    """
+    Записывает count выписок в directory как <ИНН>.pdf.
+
+    :return: описания компаний (make_company) с путем к файлу в поле path
+    """
+    os.makedirs(directory, exist_ok=True)
+    companies = []
+    for number in range(count):
+        company = make_company(str(first_inn + number), founders, holding_share, seed)
+        path = os.path.join(directory, f"{company['inn']}.pdf")
+        with open(path, 'wb') as file:
+            file.write(excerpt_pdf(company, pages))
+        company['path'] = path
+        companies.append(company)
+    return companies
+
+
+def sheet_rows(companies, changed_share, seed) -> List[List[str]]:
+    """Строки листа для корпуса: у части компаний состав участников отличается от выписки."""
+    rng = random.Random(seed)
+    rows = []
+    for company in companies:
+        founders = [f"{founder['name']} {founder['inn']}" for founder in company['founders']]
+        if founders and rng.random() < changed_share:
+            founders = founders[1:] + ['ВЫБЫВШИЙ УЧАСТНИК 770000000001']
+        rows.append([company['inn'], company['short_name'], ', '.join(sorted(founders)), '', '01.01.2024'])
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Генератор синтетических выписок ЕГРЮЛ в PDF')
+    parser.add_argument('directory')
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--founders', type=int, default=3, help='участников в каждой выписке')
+    parser.add_argument('--pages', type=int, default=None, help='дополнить выписку до этого числа страниц')
+    parser.add_argument('--holding-share', type=float, default=0.0,
+                        help='доля участников - юридических лиц, от 0 до 1')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    companies = generate_corpus(args.directory, args.count, args.founders, args.pages, args.holding_share, args.seed)
+    size = sum(os.path.getsize(company['path']) for company in companies)
+    print(f"Записано выписок: {len(companies)} в {args.directory}, {size / 1024:.0f} КБ", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+import sys
+import pytest
+
+# Модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def emulator():
+    """Эмулятор Sheets API с листом 'local' из пяти компаний (строки 2-6)."""
+    from sheets_emulator import SheetsEmulator, start_emulator, synthetic_rows
+
+    emulator = SheetsEmulator()
+    emulator.add_spreadsheet('local', synthetic_rows(5))
+    server = start_emulator(emulator)
+    emulator.url = f'http://127.0.0.1:{server.server_address[1]}'
+    yield emulator
+    server.shutdown()
+
+
+@pytest.fixture
+def handler(emulator, monkeypatch):
+    """GoogleSheetsHandler, подключенный к эмулятору; повторы записи без пауз."""
+    from google.auth.credentials import AnonymousCredentials
+    from googleapiclient.discovery import build
+    import google_sheets_handler
+
+    monkeypatch.setattr(google_sheets_handler, 'backoff_delay', lambda attempt: 0)
+    service = build('sheets', 'v4', credentials=AnonymousCredentials(), static_discovery=True,
+                    cache_discovery=False, client_options={'api_endpoint': emulator.url + '/'})
+    handler = google_sheets_handler.GoogleSheetsHandler(service=service)
+    handler.sheet_id = 'local'
+    return handler
@@ -0,0 +1,47 @@
+import time
+import pytest
+from change_probe import ChangeProbe, fingerprint_result_text, fingerprint_search_row
+from excerpt_cache import ExcerptCache
+from state_store import StateStore
+
+ROW = {'n': 'ООО "А"', 'i': '7700000001', 'o': '1027700000001', 'a': 'Г.МОСКВА', 't': 'token-1'}
+
+
+@pytest.fixture
+def probe(tmp_path):
+    store = StateStore(str(tmp_path / 'state.sqlite'))
+    cache = ExcerptCache(str(tmp_path / 'cache'))
+    pdf_path = tmp_path / '7700000001.pdf'
+    pdf_path.write_bytes(b'%PDF-1.4 excerpt')
+    cache.put_pdf('7700000001', str(pdf_path))
+    yield ChangeProbe(store, cache, max_age=3600)
+    cache.close()
+    store.close()
+
+
+def test_fingerprint_ignores_tokens_and_spacing():
+    assert fingerprint_search_row(ROW) == fingerprint_search_row(dict(ROW, t='token-2', n='ООО  "А"'))
+    assert fingerprint_search_row(ROW) != fingerprint_search_row(dict(ROW, a='Г.КАЗАНЬ'))
+    assert fingerprint_result_text('ООО "А"\n ИНН 1') == fingerprint_result_text('ООО "А" ИНН 1')
+
+
+def test_unchanged_result_reuses_cached_excerpt(probe):
+    fingerprint = fingerprint_search_row(ROW)
+    assert probe.cached_if_unchanged('7700000001', fingerprint) is None
+    probe.remember('7700000001', fingerprint)
+
+    assert probe.cached_if_unchanged('7700000001', fingerprint).endswith('.pdf')
+    assert probe.cached_if_unchanged('7700000001', fingerprint_search_row(dict(ROW, a='Г.КАЗАНЬ'))) is None
+    assert probe.stats() == {'probes': 3, 'skipped': 1, 'changed': 2, 'expired': 0}
+
+
+def test_old_excerpt_is_downloaded_again(probe):
+    fingerprint = fingerprint_search_row(ROW)
+    probe.remember('7700000001', fingerprint)
+    time.sleep(0.01)
+    # Более строгое ограничение запроса действует, более мягкое - нет
+    assert probe.cached_if_unchanged('7700000001', fingerprint, max_age=0) is None
+    assert probe.cached_if_unchanged('7700000001', fingerprint, max_age=10 ** 9) is not None
+    probe.max_age = 0
+    assert probe.cached_if_unchanged('7700000001', fingerprint, max_age=10 ** 9) is None
+    assert probe.stats()['expired'] == 2
@@ -0,0 +1,70 @@
+import os
+import json
+import pytest
+import cli
+import config
+import logger
+import pdf_extractor
+from synthetic_excerpt import excerpt_pdf, make_company
+
+
+@pytest.fixture
+def log_levels(monkeypatch):
+    """Уровни, с которыми команда настроила логирование; файл журнала не трогается."""
+    levels = []
+    monkeypatch.setattr(logger, 'setup_logging', lambda level=None: levels.append(level))
+    return levels
+
+
+@pytest.mark.parametrize('argv, handler, expected', [
+    (['fetch', '7700000001', '7700000002', '--max-age', '60', '--workers', '2'], cli.cmd_fetch,
+     {'inns': ['7700000001', '7700000002'], 'max_age': 60.0, 'workers': 2, 'write': False, 'quiet': True}),
+    (['parse', 'a.pdf', '--workers', '3', '--full-text'], cli.cmd_parse,
+     {'pdfs': ['a.pdf'], 'workers': 3, 'full_text': True, 'quiet': True}),
+    (['run', '--once'], cli.cmd_run, {'inns': [], 'once': True, 'quiet': False}),
+    (['worker', '--coordinator', 'http://host:8091', '--exit-when-idle'], cli.cmd_worker,
+     {'coordinator': 'http://host:8091', 'threads': None, 'exit_when_idle': True, 'quiet': False}),
+])
+def test_subcommands_dispatch_to_handlers(argv, handler, expected):
+    args = cli.build_parser().parse_args(argv)
+    assert args.handler is handler
+    assert {key: getattr(args, key) for key in expected} == expected
+
+
+def test_command_is_required(capsys):
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args([])
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args(['fetch', '--backend', 'ftp', '7700000001'])
+
+
+def test_main_fills_backend_and_quiet_logging(monkeypatch, log_levels):
+    calls = []
+    monkeypatch.setattr(cli, 'cmd_fetch', lambda args: calls.append(args) or 0)
+    monkeypatch.setattr(config, 'EGRUL_BACKEND', 'http')
+
+    assert cli.main(['fetch', '7700000001']) == 0
+    assert calls[0].backend == 'http'
+    assert log_levels == ['WARNING']
+
+    assert cli.main(['--log-level', 'debug', 'fetch', '--backend', 'selenium', '7700000001']) == 0
+    assert calls[1].backend == 'selenium'
+    assert log_levels[1] == 'DEBUG'
+
+
+def test_parse_prints_json_line_per_file(tmp_path, monkeypatch, capsys, log_levels):
+    monkeypatch.setattr(pdf_extractor, 'get_excerpt_cache', lambda: None)
+    company = make_company('7700000001', founders=2, seed=0)
+    good = os.path.join(str(tmp_path), 'good.pdf')
+    with open(good, 'wb') as file:
+        file.write(excerpt_pdf(company))
+    broken = os.path.join(str(tmp_path), 'broken.pdf')
+    with open(broken, 'wb') as file:
+        file.write(b'not a pdf')
+
+    assert cli.main(['parse', good, broken]) == 1
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [line['path'] for line in lines] == [good, broken]
+    assert lines[0]['short_name'] == company['short_name']
+    assert len(lines[0]['founders']) == 2
+    assert lines[1]['error'] == 'extraction failed'
@@ -0,0 +1,94 @@
+import time
+import threading
+import pytest
+import requests
+from coordinator import TOKEN_HEADER, Coordinator, WorkQueue
+
+
+def make_queue(tmp_path, **kwargs):
+    return WorkQueue(str(tmp_path / 'work_queue.sqlite'), **kwargs)
+
+
+def complete(work_queue, unit):
+    work_queue.complete(unit['id'], 'w1', [{'inn': inn, 'data': {'name': inn}} for inn in unit['inns']])
+
+
+def test_claim_complete_and_collect(tmp_path):
+    work_queue = make_queue(tmp_path)
+    run_id = work_queue.add_run(['1', '2', '3'], unit_size=2)
+    first = work_queue.claim('w1')
+    assert first['inns'] == ['1', '2']
+    assert work_queue.heartbeat(first['id'], 'w1')
+    assert not work_queue.heartbeat(first['id'], 'w2')
+    complete(work_queue, first)
+    assert work_queue.collect(run_id) == [(['1', '2'], [{'inn': '1', 'data': {'name': '1'}},
+                                                         {'inn': '2', 'data': {'name': '2'}}])]
+    assert work_queue.collect(run_id) == []
+    assert work_queue.status(run_id)['units'] == {'done': 1, 'pending': 1}
+
+
+def test_expired_lease_is_reassigned_then_failed(tmp_path):
+    work_queue = make_queue(tmp_path, lease_seconds=-1, max_attempts=2)
+    run_id = work_queue.add_run(['1'], unit_size=10)
+    assert work_queue.claim('w1')['inns'] == ['1']
+    assert work_queue.claim('w2')['inns'] == ['1']
+    work_queue.expire()
+    assert work_queue.claim('w3') is None
+    assert work_queue.collect(run_id) == [(['1'], None)]
+
+
+def test_new_run_cancels_unfinished_units(tmp_path):
+    work_queue = make_queue(tmp_path)
+    work_queue.add_run(['1', '2'], unit_size=1)
+    run_id = work_queue.add_run(['3'], unit_size=1)
+    assert work_queue.claim('w1')['inns'] == ['3']
+    assert work_queue.status(run_id)['units'] == {'leased': 1}
+
+
+def test_run_yields_units_completed_while_consumer_is_busy(tmp_path):
+    work_queue = make_queue(tmp_path)
+    coordinator = Coordinator(work_queue, unit_size=1)
+    results = coordinator.run(['1', '2', '3'])
+    units = []
+
+    def worker():
+        # Узел забирает все порции прогона и сразу завершает первую
+        while len(units) < 3:
+            unit = work_queue.claim('w1')
+            if unit is None:
+                time.sleep(0.01)
+                continue
+            units.append(unit)
+        complete(work_queue, units[0])
+        coordinator.notify()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    seen = [next(results)[0]]
+    thread.join()
+    # Пока потребитель обрабатывает результат, узел завершает оставшиеся порции
+    for unit in units[1:]:
+        complete(work_queue, unit)
+    seen.extend(inn for inn, _ in results)
+    assert seen == ['1', '2', '3']
+    coordinator.close()
+
+
+def test_start_requires_token_on_public_address(tmp_path):
+    coordinator = Coordinator(make_queue(tmp_path), token=None)
+    with pytest.raises(ValueError):
+        coordinator.start(host='0.0.0.0', port=0)
+    coordinator.start(host='127.0.0.1', port=0)
+    coordinator.close()
+
+
+def test_server_rejects_requests_without_token(tmp_path):
+    coordinator = Coordinator(make_queue(tmp_path), token='secret')
+    server = coordinator.start(host='127.0.0.1', port=0)
+    url = f'http://127.0.0.1:{server.server_address[1]}/claim'
+    try:
+        assert requests.post(url, json={'worker': 'w1'}, timeout=5).status_code == 403
+        response = requests.post(url, json={'worker': 'w1'}, headers={TOKEN_HEADER: 'secret'}, timeout=5)
+        assert response.json() == {'unit': None}
+    finally:
+        coordinator.close()
@@ -0,0 +1,52 @@
+from data_processor import DataProcessor
+from synthetic_excerpt import make_company, sheet_rows
+
+
+def records_and_rows(companies, changed_share=0.3):
+    records = {c['inn']: {'short_name': c['short_name'],
+                          'founders': [{'name': f['name'], 'inn': f['inn']} for f in c['founders']]}
+               for c in companies}
+    rows = {row[0]: {'name': row[1], 'current_founders': row[2], 'former_founders': row[3], 'change_date': row[4]}
+            for row in sheet_rows(companies, changed_share, seed=0)}
+    return records, rows
+
+
+def test_process_detects_added_and_removed_founders():
+    processor = DataProcessor()
+    current = {'name': 'ООО "А"', 'current_founders': 'ИВАНОВ ИВАН 770101010101,\nПЕТРОВ ПЕТР 770202020202 01.01.2020',
+               'change_date': '01.01.2020'}
+    pdf_data = {'short_name': 'ООО "А"', 'founders': [{'name': 'ИВАНОВ ИВАН', 'inn': '770101010101'},
+                                                      {'name': 'СИДОРОВ ОЛЕГ', 'inn': '770303030303'}]}
+    result = processor.process('7701000001', pdf_data, current)
+    assert result['current_founders'] == 'ИВАНОВ ИВАН 770101010101, СИДОРОВ ОЛЕГ 770303030303'
+    assert result['former_founders'] == 'ПЕТРОВ ПЕТР 770202020202 01.01.2020'
+    assert result['change_date'] == processor.current_date
+
+    unchanged = processor.process('7701000001', pdf_data, {**current, 'current_founders': result['current_founders']})
+    assert unchanged['former_founders'] == ''
+    assert unchanged['change_date'] == '01.01.2020'
+
+
+def test_process_many_matches_process_on_benchmark_corpus():
+    companies = [make_company(str(7700000000 + number), founders=1 + number % 7, holding_share=0.3, seed=0)
+                 for number in range(200)]
+    records, rows = records_and_rows(companies)
+    processor = DataProcessor()
+    batched = dict(processor.process_many(records, rows).iter_updates())
+    assert batched == {inn: processor.process(inn, records[inn], rows[inn]) for inn in records}
+
+
+def test_process_many_keeps_each_company_spelling():
+    # Один и тот же участник (по ИНН) записан в строках двух компаний по-разному
+    records = {
+        '1': {'short_name': 'ООО "А"', 'founders': [{'name': 'Иванов И.И.', 'inn': '770101010101'}]},
+        '2': {'short_name': 'ООО "Б"', 'founders': []},
+    }
+    rows = {
+        '1': {'name': 'ООО "А"', 'current_founders': '', 'change_date': ''},
+        '2': {'name': 'ООО "Б"', 'current_founders': 'ИВАНОВ ИВАН ИВАНОВИЧ 770101010101', 'change_date': ''},
+    }
+    processor = DataProcessor()
+    change_set = processor.process_many(records, rows)
+    assert dict(change_set.iter_updates()) == {inn: processor.process(inn, records[inn], rows[inn]) for inn in records}
+    assert change_set.founders('2')['removed'] == ['ИВАНОВ ИВАН ИВАНОВИЧ 770101010101']
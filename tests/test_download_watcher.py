@@ -0,0 +1,48 @@
+import time
+import threading
+import pytest
+from download_watcher import DownloadTimeout, wait_for_download
+
+PDF = b'%PDF-1.4\n' + b'0' * 2000 + b'\n%%EOF\n'
+
+
+def write(path, data):
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+def test_returns_complete_pdf(tmp_path):
+    write(tmp_path / 'ul-1.pdf', PDF)
+    assert wait_for_download(str(tmp_path), pattern='ul-*.pdf', timeout=2, poll_interval=0.01) == \
+        str(tmp_path / 'ul-1.pdf')
+
+
+def test_waits_for_partial_download_to_finish(tmp_path):
+    partial = tmp_path / 'ul-1.pdf.crdownload'
+    write(partial, PDF[:100])
+    write(tmp_path / 'ul-1.pdf', PDF)
+
+    def finish():
+        partial.unlink()
+
+    timer = threading.Timer(0.2, finish)
+    started = time.monotonic()
+    timer.start()
+    try:
+        path = wait_for_download(str(tmp_path), pattern='ul-*.pdf', timeout=2, poll_interval=0.01)
+    finally:
+        timer.join()
+    assert path == str(tmp_path / 'ul-1.pdf')
+    assert time.monotonic() - started >= 0.2
+
+
+def test_ignores_truncated_and_unrelated_files(tmp_path):
+    write(tmp_path / 'ul-1.pdf', PDF[:-10])
+    write(tmp_path / 'report.pdf', PDF)
+    with pytest.raises(DownloadTimeout):
+        wait_for_download(str(tmp_path), pattern='ul-*.pdf', timeout=0.1, poll_interval=0.01)
+
+
+def test_missing_directory_times_out(tmp_path):
+    with pytest.raises(DownloadTimeout):
+        wait_for_download(str(tmp_path / 'missing'), timeout=0.05, poll_interval=0.01)
@@ -0,0 +1,102 @@
+import os
+from selenium.common.exceptions import WebDriverException
+import driver_pool
+from driver_pool import BLOCKED_URLS, DriverPool, PooledDriver
+
+
+class FakeDriver:
+    def __init__(self):
+        self.alive = True
+        self.quit_called = False
+        self.download_paths = []
+
+    def execute_cdp_cmd(self, command, params):
+        if command == 'Page.setDownloadBehavior':
+            self.download_paths.append(params['downloadPath'])
+
+    def execute_script(self, script):
+        if not self.alive:
+            raise WebDriverException('chrome not reachable')
+        return 1
+
+    def quit(self):
+        self.quit_called = True
+
+
+def make_pool(tmp_path, monkeypatch, **kwargs):
+    pool = DriverPool(str(tmp_path), **kwargs)
+    started = []
+
+    def start_driver():
+        pooled = PooledDriver(FakeDriver(), os.path.join(str(tmp_path), f'worker-{len(started)}'))
+        pooled.set_download_dir(pooled.download_dir)
+        started.append(pooled)
+        return pooled
+
+    monkeypatch.setattr(pool, '_start_driver', start_driver)
+    return pool, started
+
+
+def test_stylesheets_are_not_blocked():
+    assert '*.css' not in BLOCKED_URLS
+    assert '*.png' in BLOCKED_URLS
+
+
+def test_driver_path_is_taken_from_cache_file(tmp_path, monkeypatch):
+    driver_file = tmp_path / 'chromedriver'
+    driver_file.write_text('')
+    cache_file = tmp_path / 'chromedriver.path'
+    installs = []
+
+    class Manager:
+        def install(self):
+            installs.append(1)
+            return str(driver_file)
+
+    monkeypatch.setattr(driver_pool, 'CHROMEDRIVER_PATH', '')
+    monkeypatch.setattr(driver_pool, 'CHROMEDRIVER_CACHE_FILE', str(cache_file))
+    monkeypatch.setattr(driver_pool, 'ChromeDriverManager', Manager)
+
+    assert driver_pool.get_driver_path() == str(driver_file)
+    assert driver_pool.get_driver_path() == str(driver_file)
+    assert len(installs) == 1
+
+    driver_file.unlink()
+    driver_pool.get_driver_path()
+    assert len(installs) == 2
+
+
+def test_lease_reuses_idle_driver(tmp_path, monkeypatch):
+    pool, started = make_pool(tmp_path, monkeypatch, size=2, max_uses=10)
+    with pool.lease() as first:
+        with pool.lease() as second:
+            assert first is not second
+    with pool.lease() as again:
+        assert again in (first, second)
+    assert len(started) == 2
+    # Возвращенный браузер снова качает в свою директорию
+    assert again.driver.download_paths[-1] == again.download_dir
+
+
+def test_worn_out_and_dead_drivers_are_restarted(tmp_path, monkeypatch):
+    pool, started = make_pool(tmp_path, monkeypatch, size=1, max_uses=2)
+    for _ in range(2):
+        with pool.lease():
+            pass
+    assert started[0].driver.quit_called
+    assert not os.path.exists(started[0].download_dir)
+
+    with pool.lease() as pooled:
+        pooled.driver.alive = False
+    assert pooled.driver.quit_called
+    with pool.lease():
+        pass
+    assert len(started) == 3
+
+
+def test_close_quits_idle_drivers(tmp_path, monkeypatch):
+    pool, started = make_pool(tmp_path, monkeypatch, size=2)
+    with pool.lease():
+        pass
+    pool.close()
+    assert started[0].driver.quit_called
@@ -0,0 +1,41 @@
+import os
+import pytest
+import egrul_http_parser
+from egrul_http_parser import EgrulHttpParser
+from egrul_stub_server import EgrulStub, PLACEHOLDER_PDF, start_stub_server
+from rate_limiter import RateLimiter
+
+THROTTLE_PAGE = b'<html><body>Too many requests</body></html>'
+
+
+@pytest.fixture
+def parser(tmp_path, monkeypatch):
+    monkeypatch.setattr(egrul_http_parser, 'get_excerpt_cache', lambda: None)
+    monkeypatch.setattr(egrul_http_parser, 'get_change_probe', lambda: None)
+    monkeypatch.setattr(egrul_http_parser, 'backoff_delay', lambda attempt: 0)
+    server = start_stub_server(EgrulStub(pdf_source=lambda inn: THROTTLE_PAGE if inn == '7700000002' else PLACEHOLDER_PDF))
+    parser = EgrulHttpParser(base_url=f'http://127.0.0.1:{server.server_address[1]}', download_path=str(tmp_path),
+                             rate_limiter=RateLimiter(rate=6000, burst=100))
+    yield parser
+    parser.close()
+    server.shutdown()
+
+
+def test_downloads_pdf(parser, tmp_path):
+    pdf_path = parser.get_pdf('7700000001')
+    assert pdf_path == os.path.join(str(tmp_path), '7700000001.pdf')
+    with open(pdf_path, 'rb') as file:
+        assert file.read(5) == b'%PDF-'
+    assert os.listdir(tmp_path) == ['7700000001.pdf']
+
+
+def test_rejects_non_pdf_response(parser, tmp_path):
+    assert parser.get_pdf('7700000002') is None
+    assert os.listdir(tmp_path) == []
+    assert parser.limiter.metrics()['throttled'] > 0
+
+
+def test_search_row_without_token_is_a_failure(parser, monkeypatch):
+    monkeypatch.setattr(parser, 'search', lambda inn: {'i': inn})
+    assert parser.get_pdf('7700000001') is None
+    assert parser.limiter.metrics()['error'] == egrul_http_parser.MAX_RETRIES
@@ -0,0 +1,52 @@
+import os
+import json
+import pytest
+from egrul_sections import EgrulDocument, SectionTracker
+from pdf_extractor import PDFExtractor
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+with open(os.path.join(CORPUS_DIR, 'expected.json'), encoding='utf-8') as file:
+    EXPECTED = json.load(file)
+
+
+@pytest.fixture(scope='module')
+def extractor():
+    return PDFExtractor(excerpt_cache=None)
+
+
+def load_text(extractor, case):
+    # Текст выписки готовится так же, как страницы PDF: без номеров строк и лишних пробелов
+    with open(os.path.join(CORPUS_DIR, f'{case}.txt'), encoding='utf-8') as file:
+        return extractor._preprocess_text(file.read())
+
+
+@pytest.mark.parametrize('case', sorted(EXPECTED))
+def test_founders_match_expected(extractor, case):
+    founders = [record.to_dict() for record in EgrulDocument(load_text(extractor, case)).founders]
+    assert founders == EXPECTED[case]['founders']
+
+
+@pytest.mark.parametrize('case', sorted(EXPECTED))
+def test_legacy_pattern_regression(extractor, case):
+    legacy = extractor._extract_founders_legacy(load_text(extractor, case))
+    assert sorted([founder['name'], founder['inn']] for founder in legacy) == EXPECTED[case]['legacy']
+    # Прежнее выражение не извлекает дату участия и долю
+    assert all(set(founder) == {'name', 'inn'} for founder in legacy)
+    assert all(record['record_date'] and record['share'] for record in EXPECTED[case]['founders'])
+
+
+def test_quoted_heading_does_not_end_founders_section(extractor):
+    document = EgrulDocument(load_text(extractor, 'quoted_heading'))
+    assert [record.inn for record in document.founders] == ['7705000005', '770606060606', '770707070707']
+    assert 'НОВИКОВА' in document.section_text('founders')
+
+
+def test_section_tracker_ignores_quoted_headings(extractor):
+    text = load_text(extractor, 'quoted_heading')
+    tracker = SectionTracker()
+    tracker.feed(text[:text.index('НОВИКОВА')])
+    assert not tracker.is_complete('founders')
+    tracker.feed(text[text.index('НОВИКОВА'):])
+    assert tracker.is_complete('founders')
+    assert tracker.seen == ['registration', 'management', 'founders', 'tax']
@@ -0,0 +1,83 @@
+import os
+import time
+import sqlite3
+from excerpt_cache import ExcerptCache, file_hash
+
+
+def make_pdf(directory, name, size=1000):
+    path = os.path.join(str(directory), name)
+    with open(path, 'wb') as file:
+        file.write(b'%PDF-' + name.encode() * (size // len(name)))
+    return path
+
+
+def test_ttl_and_max_age(tmp_path):
+    cache = ExcerptCache(str(tmp_path / 'cache'))
+    cache.put_pdf('1', make_pdf(tmp_path, 'a.pdf'))
+    cache.put_pdf('2', make_pdf(tmp_path, 'b.pdf'), ttl=0)
+    time.sleep(0.01)
+
+    assert cache.get_pdf('1') is not None
+    assert cache.get_pdf('2') is None
+    assert cache.get_pdf('2', max_age=60) is not None
+    assert cache.get_pdf('1', max_age=0) is None
+    cache.close()
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = ExcerptCache(str(tmp_path / 'cache'), max_bytes=1500, lease=0)
+    first = make_pdf(tmp_path, 'a.pdf')
+    cache.put_pdf('1', first)
+    cache.put_parsed(file_hash(first), 1, {'short_name': 'А'})
+    cache.put_pdf('2', make_pdf(tmp_path, 'b.pdf'))
+
+    assert cache.get_pdf('1') is None
+    assert cache.get_parsed(file_hash(first), 1) is None
+    assert cache.get_pdf('2') is not None
+    assert cache.stats()['evictions'] == 1
+    cache.close()
+
+
+def test_recently_handed_out_file_is_not_evicted(tmp_path):
+    cache = ExcerptCache(str(tmp_path / 'cache'), max_bytes=1500, lease=60)
+    cache.put_pdf('1', make_pdf(tmp_path, 'a.pdf'))
+    path = cache.get_pdf('1')
+    cache.put_pdf('2', make_pdf(tmp_path, 'b.pdf'))
+
+    assert os.path.exists(path)
+    assert cache.get_pdf('1') == path
+    assert cache.stats()['evictions'] == 0
+    cache.close()
+
+
+def test_parsed_results_do_not_count_as_objects(tmp_path):
+    cache = ExcerptCache(str(tmp_path / 'cache'))
+    cache.put_parsed('f' * 64, 1, {'short_name': 'А'})
+    assert cache.get_parsed('f' * 64, 1) == {'short_name': 'А'}
+    assert cache.get_parsed('f' * 64, 2) is None
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['parsed']) == (0, 0, 1)
+    cache.close()
+
+
+def test_index_of_previous_version_is_migrated(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    os.makedirs(cache_dir)
+    conn = sqlite3.connect(str(cache_dir / 'index.sqlite'))
+    conn.executescript('''
+        CREATE TABLE excerpts (inn TEXT PRIMARY KEY, hash TEXT NOT NULL, fetched_at REAL NOT NULL, ttl REAL NOT NULL);
+        CREATE TABLE objects (hash TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL,
+                              parser_version INTEGER, parsed TEXT);
+        INSERT INTO objects VALUES ('a', 0, 1, 4, '{"short_name": "А"}');
+        INSERT INTO objects VALUES ('b', 1000, 1, NULL, NULL);
+    ''')
+    conn.commit()
+    conn.close()
+
+    cache = ExcerptCache(str(cache_dir))
+    assert cache.get_parsed('a', 4) == {'short_name': 'А'}
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes']) == (1, 1000)
+    cache.put_pdf('1', make_pdf(tmp_path, 'c.pdf'))
+    assert cache.get_pdf('1') is not None
+    cache.close()
@@ -0,0 +1,43 @@
+from founder_index import FounderIndex, query_key
+from state_store import StateStore
+
+
+def test_update_company_opens_and_closes_periods(tmp_path):
+    index = FounderIndex(str(tmp_path / 'founders.sqlite'))
+    founders = [{'name': 'ИВАНОВ ИВАН', 'inn': '770101010101', 'record_date': '12.03.2010'},
+                {'name': 'ООО "Б"', 'inn': ''}]
+    assert index.update_company('7700000001', 'ООО "А"', founders, '2024-01-01') == (2, 0)
+    # Повторная выписка с тем же составом ничего не меняет
+    assert index.update_company('7700000001', 'ООО "А"', founders, '2024-02-01') == (0, 0)
+    assert index.update_company('7700000001', 'ООО "А"', founders[:1], '2024-03-01') == (0, 1)
+
+    [current] = index.founders_of('7700000001')
+    assert current['founder_inn'] == '770101010101'
+    assert current['started_at'] == '2010-03-12'
+    ended = [row for row in index.founders_of('7700000001', include_ended=True) if row['ended_at']]
+    assert [(row['founder_name'], row['started_at'], row['ended_at']) for row in ended] == \
+        [('ООО "Б"', '2024-01-01', '2024-03-01')]
+    assert index.companies_of(' ооо  "б" ') == []
+    assert len(index.companies_of('ооо "б"', include_ended=True)) == 1
+    assert index.stats() == {'participations': 2, 'active': 1}
+    index.close()
+
+
+def test_companies_of_founder(tmp_path):
+    index = FounderIndex(str(tmp_path / 'founders.sqlite'))
+    person = {'name': 'ИВАНОВ ИВАН', 'inn': '770101010101'}
+    index.update_company('7700000001', 'ООО "А"', [person], '2024-01-01')
+    index.update_company('7700000002', 'ООО "В"', [person], '2024-01-02')
+    assert [row['company_inn'] for row in index.companies_of('770101010101')] == ['7700000001', '7700000002']
+    assert query_key('770101010101') == '770101010101'
+    index.close()
+
+
+def test_rebuild_from_state(tmp_path):
+    store = StateStore(str(tmp_path / 'state.sqlite'))
+    store.save_many([('7700000001', 'fp', 'ООО "А"', [('ИВАНОВ ИВАН', '770101010101')])])
+    index = FounderIndex(str(tmp_path / 'founders.sqlite'))
+    assert index.rebuild_from_state(store) == 1
+    assert index.founders_of('7700000001')[0]['company_name'] == 'ООО "А"'
+    index.close()
+    store.close()
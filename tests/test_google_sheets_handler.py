@@ -0,0 +1,94 @@
+import google_sheets_handler
+from sheets_emulator import synthetic_rows
+
+ROWS = synthetic_rows(5)
+
+
+def row_data(row):
+    return {'name': row[1], 'current_founders': row[2], 'former_founders': row[3], 'change_date': row[4]}
+
+
+def test_reads_are_served_from_one_snapshot(handler, emulator):
+    inns = handler.get_inn_list()
+    assert inns == [row[0] for row in ROWS[1:]]
+    for inn in inns:
+        assert handler.get_company_data(inn)['inn'] == inn
+    assert [handler.find_row(inn) for inn in inns] == [2, 3, 4, 5, 6]
+    assert handler.find_row('7799999999') is None
+    assert emulator.stats()['reads'] == 1
+
+
+def test_first_row_wins_for_duplicate_inn(handler, emulator):
+    emulator.spreadsheets['local'].rows.append([ROWS[2][0], 'ДУБЛИКАТ'])
+    assert handler.find_row(ROWS[2][0]) == 3
+    assert handler.get_company_data(ROWS[2][0])['name'] == ROWS[2][1]
+    assert handler.get_inn_list().count(ROWS[2][0]) == 2
+
+
+def test_unchanged_row_is_not_written(handler, emulator):
+    written = []
+    handler.add_flush_listener(written.extend)
+    assert handler.update_company_data(ROWS[1][0], row_data(ROWS[1]))
+    assert handler._pending == {}
+    assert written == [ROWS[1][0]]
+    assert emulator.stats()['writes'] == 0
+
+    changed = dict(row_data(ROWS[1]), change_date='01.07.2024')
+    assert handler.update_company_data(ROWS[1][0], changed)
+    # Повтор той же строки, пока она в буфере, не ставится в очередь второй раз и не подтверждается раньше записи
+    assert handler.update_company_data(ROWS[1][0], changed)
+    assert written == [ROWS[1][0]]
+    assert handler.flush()
+    assert written == [ROWS[1][0], ROWS[1][0]]
+    assert emulator.stats()['writes'] == 1
+
+
+def test_column_search_without_snapshot(handler, emulator):
+    handler.use_snapshot = False
+    assert handler.find_row(ROWS[3][0]) == 4
+    assert handler.get_company_data(ROWS[3][0])['name'] == ROWS[3][1]
+    assert emulator.stats()['reads'] == 2
+
+
+def changed_row(row):
+    return dict(row_data(row), change_date='01.07.2024')
+
+
+def test_full_buffer_is_flushed_in_one_request(handler, emulator, monkeypatch):
+    monkeypatch.setattr(google_sheets_handler, 'SHEETS_BATCH_SIZE', 2)
+    handler.update_company_data(ROWS[1][0], changed_row(ROWS[1]))
+    assert emulator.stats()['writes'] == 0
+    handler.update_company_data(ROWS[2][0], changed_row(ROWS[2]))
+    assert emulator.stats()['writes'] == 1
+    assert handler._pending == {}
+    assert [row[4] for row in emulator.spreadsheets['local'].rows[1:4]] == ['01.07.2024', '01.07.2024', '01.01.2024']
+
+
+def test_failed_batch_stays_buffered(handler, emulator, monkeypatch):
+    monkeypatch.setattr(google_sheets_handler, 'SHEETS_BATCH_SIZE', 2)
+    handler.get_inn_list()
+    # Первая пачка получает 429 на все попытки, вторая записывается
+    failures = [google_sheets_handler.MAX_RETRIES]
+    admit = emulator.admit
+
+    def failing_admit():
+        if failures[0]:
+            failures[0] -= 1
+            emulator.count('quota_errors')
+            return False
+        return admit()
+
+    monkeypatch.setattr(emulator, 'admit', failing_admit)
+    written = []
+    handler.add_flush_listener(written.extend)
+    handler._pending = {row[0]: (index, [row[0], 'ООО "НОВОЕ"', '', '', '01.07.2024'])
+                        for index, row in enumerate(ROWS[1:4], start=2)}
+
+    assert not handler.flush()
+    assert sorted(handler._pending) == [ROWS[1][0], ROWS[2][0]]
+    assert written == [ROWS[3][0]]
+
+    assert handler.flush()
+    assert handler._pending == {}
+    assert sorted(written) == [row[0] for row in ROWS[1:4]]
+    assert [row[1] for row in emulator.spreadsheets['local'].rows[1:4]] == ['ООО "НОВОЕ"'] * 3
@@ -0,0 +1,111 @@
+import time
+import threading
+import pytest
+from lookup_service import CompanyLookup, NotFound
+
+
+class BlockingParser:
+    """Парсер, который отдает выписку только после release (или сразу, если release уже вызван)."""
+
+    def __init__(self, gate):
+        self.gate = gate
+
+    def get_pdf(self, inn, max_age=None):
+        self.gate.wait(5)
+        return None if inn == '7700000000' else f'{inn}.pdf'
+
+
+class FakeExtractor:
+    def extract_data(self, pdf_path, include_full_text=True):
+        return {'short_name': f'ООО "{pdf_path[:-4]}"', 'founders': []}
+
+
+def make_lookup(gate=None, **kwargs):
+    if gate is None:
+        gate = threading.Event()
+        gate.set()
+    return CompanyLookup(lambda: BlockingParser(gate), FakeExtractor(), **kwargs)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def run_concurrently(lookup, calls):
+    results = [None] * len(calls)
+
+    def run(position, inn, max_age):
+        results[position] = lookup.get(inn, max_age)
+
+    threads = [threading.Thread(target=run, args=(position,) + call) for position, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_requests_share_one_fetch():
+    gate = threading.Event()
+    lookup = make_lookup(gate)
+    threads, results = run_concurrently(lookup, [('7700000001', 60)] * 8)
+    wait_for(lambda: lookup.stats()['coalesced'] == 7)
+    gate.set()
+    for thread in threads:
+        thread.join()
+
+    assert lookup.stats()['fetches'] == 1
+    assert len({result[1] for result in results}) == 1
+    assert all(result[2] == 'egrul' for result in results)
+
+
+def test_strict_joiner_reuses_result_fetched_after_its_request():
+    gate = threading.Event()
+    lookup = make_lookup(gate)
+    threads, results = run_concurrently(lookup, [('7700000001', 60)])
+    wait_for(lambda: lookup.stats()['fetches'] == 1)
+    threads += run_concurrently(lookup, [('7700000001', 0)])[0]
+    wait_for(lambda: lookup.stats()['coalesced'] == 1)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert lookup.stats()['fetches'] == 1
+
+
+def test_max_age_controls_reuse():
+    lookup = make_lookup()
+    data, fetched_at, source = lookup.get('7700000001', 60)
+    assert source == 'egrul'
+    assert lookup.get('7700000001', 60) == (data, fetched_at, 'memory')
+    assert lookup.get('7700000001', 0)[2] == 'egrul'
+    assert lookup.stats()['fetches'] == 2
+
+
+@pytest.mark.parametrize('max_age', [-1, float('nan'), float('inf')])
+def test_invalid_max_age_is_rejected(max_age):
+    lookup = make_lookup()
+    with pytest.raises(ValueError):
+        lookup.get('7700000001', max_age)
+    assert lookup.stats()['fetches'] == 0
+
+
+def test_least_recently_used_company_is_evicted():
+    lookup = make_lookup(lru_size=2)
+    lookup.get('7700000001', 60)
+    lookup.get('7700000002', 60)
+    assert lookup.get('7700000001', 60)[2] == 'memory'
+    lookup.get('7700000003', 60)
+
+    assert lookup.stats()['lru_size'] == 2
+    assert lookup.get('7700000001', 60)[2] == 'memory'
+    assert lookup.get('7700000002', 60)[2] == 'egrul'
+
+
+def test_not_found_is_not_cached():
+    lookup = make_lookup()
+    for _ in range(2):
+        with pytest.raises(NotFound):
+            lookup.get('7700000000', 60)
+    assert lookup.stats()['fetches'] == 2
+    assert lookup.stats()['errors'] == 2
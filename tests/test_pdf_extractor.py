@@ -0,0 +1,115 @@
+import os
+import time
+import signal
+import threading
+import multiprocessing
+import pytest
+import pdf_extractor
+from pdf_extractor import PDFExtractor
+from synthetic_excerpt import excerpt_pdf, make_company
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(pdf_extractor, 'get_excerpt_cache', lambda: None)
+
+
+def write_excerpt(directory, inn, founders=3, pages=None):
+    company = make_company(inn, founders=founders, holding_share=0.3, seed=0)
+    path = os.path.join(str(directory), f'{inn}.pdf')
+    with open(path, 'wb') as file:
+        file.write(excerpt_pdf(company, pages))
+    return company, path
+
+
+def expected_founders(company):
+    return sorted((founder['name'], founder['inn']) for founder in company['founders'])
+
+
+def test_reading_stops_after_founders_section(tmp_path):
+    company, path = write_excerpt(tmp_path, '7700000001', founders=4, pages=12)
+    extractor = PDFExtractor()
+    read = []
+    iter_pages = extractor.iter_pages
+
+    def counting_iter_pages(pdf_path):
+        for page in iter_pages(pdf_path):
+            read.append(page)
+            yield page
+
+    extractor.iter_pages = counting_iter_pages
+    data = extractor.extract_data(path, include_full_text=False)
+    total = len(list(iter_pages(path)))
+
+    assert total >= 12
+    assert len(read) < total
+    assert sorted((founder['name'], founder['inn']) for founder in data['founders']) == expected_founders(company)
+    assert data['short_name'] == company['short_name']
+    assert 'full_text' not in data
+
+
+def test_full_text_reads_every_page(tmp_path):
+    company, path = write_excerpt(tmp_path, '7700000002', pages=4)
+    data = PDFExtractor().extract_data(path, include_full_text=True)
+    assert 'Сведения о записях' in data['full_text']
+    assert sorted((founder['name'], founder['inn']) for founder in data['founders']) == expected_founders(company)
+
+
+needs_fifo = pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='нужен именованный канал (POSIX)')
+
+
+@pytest.fixture
+def worker_env(monkeypatch):
+    # Процессы пула читают конфигурацию заново
+    monkeypatch.setenv('EXCERPT_CACHE_ENABLED', 'false')
+
+
+def test_extract_many_returns_every_file(tmp_path, worker_env):
+    companies = {path: company for company, path in (write_excerpt(tmp_path, f'770000001{number}')
+                                                     for number in range(3))}
+    results = dict(PDFExtractor.extract_many(list(companies), workers=2))
+    assert set(results) == set(companies)
+    for path, data in results.items():
+        assert data['short_name'] == companies[path]['short_name']
+
+
+@needs_fifo
+def test_extract_many_times_out_hanging_file(tmp_path, worker_env):
+    # Чтение из канала без писателя блокируется навсегда
+    hanging = str(tmp_path / 'hanging.pdf')
+    os.mkfifo(hanging)
+    _, good = write_excerpt(tmp_path, '7700000021')
+    results = dict(PDFExtractor.extract_many([hanging, good], workers=1, timeout=1))
+    assert results[hanging] is None
+    assert results[good]['founders']
+
+
+@needs_fifo
+def test_extract_many_skips_file_that_keeps_crashing_the_worker(tmp_path, worker_env):
+    crashing = str(tmp_path / 'crashing.pdf')
+    os.mkfifo(crashing)
+    _, good = write_excerpt(tmp_path, '7700000031')
+    stop = threading.Event()
+
+    def kill_reader():
+        # Когда процесс пула открыл канал, он завершается аварийно, как при падении разбора
+        while not stop.is_set():
+            try:
+                fd = os.open(crashing, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError:
+                time.sleep(0.05)
+                continue
+            for child in multiprocessing.active_children():
+                os.kill(child.pid, signal.SIGKILL)
+            os.close(fd)
+            time.sleep(0.2)
+
+    killer = threading.Thread(target=kill_reader, daemon=True)
+    killer.start()
+    try:
+        results = dict(PDFExtractor.extract_many([good, crashing], workers=1, timeout=0))
+    finally:
+        stop.set()
+        killer.join()
+    assert results[crashing] is None
+    assert results[good]['founders']
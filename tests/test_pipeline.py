@@ -0,0 +1,114 @@
+import os
+from data_processor import DataProcessor
+from founder_index import FounderIndex
+from pipeline import Pipeline
+from run_journal import RunJournal
+from sinks import Sink
+
+FOUNDERS = {
+    '7700000001': [{'name': 'ИВАНОВ ИВАН', 'inn': '770101010101'}],
+    '7700000002': [{'name': 'ПЕТРОВ ПЕТР', 'inn': '770202020202'}],
+    '7700000003': [{'name': 'СИДОРОВ ОЛЕГ', 'inn': '770303030303'}],
+    '7700000004': [{'name': 'КУЗНЕЦОВ ЮРИЙ', 'inn': '770404040404'}],
+}
+
+
+class FakeParser:
+    """Отдает путь <ИНН>.pdf; с directory файл создается, как после скачивания."""
+
+    def __init__(self, missing=(), directory=None):
+        self.missing = set(missing)
+        self.directory = directory
+
+    def get_pdf(self, inn):
+        if inn in self.missing:
+            return None
+        if self.directory is None:
+            return f'{inn}.pdf'
+        path = os.path.join(self.directory, f'{inn}.pdf')
+        with open(path, 'wb') as file:
+            file.write(b'%PDF-')
+        return path
+
+
+class FakeExtractor:
+    def __init__(self, broken=()):
+        self.broken = set(broken)
+
+    def extract_data(self, pdf_file):
+        inn = os.path.basename(pdf_file)[:-len('.pdf')]
+        if inn in self.broken:
+            return None
+        return {'short_name': f'ООО "{inn}"', 'founders': FOUNDERS[inn]}
+
+
+class FakeSheets:
+    def get_company_data(self, inn):
+        return {}
+
+
+class ConfirmingSink(Sink):
+    """Подтверждает принятые строки сразу; строки ИНН из failing не принимаются."""
+
+    def __init__(self, failing=()):
+        super().__init__()
+        self.failing = set(failing)
+        self.rows = {}
+
+    def write(self, inn, data):
+        if inn in self.failing:
+            return False
+        self.rows[inn] = data
+        self._notify_written([inn])
+        return True
+
+
+def make_pipeline(sink, parser=None, extractor=None, founder_index=None, **kwargs):
+    return Pipeline(lambda: parser or FakeParser(), extractor or FakeExtractor(),
+                    DataProcessor(founder_index=founder_index), FakeSheets(), fetch_workers=2, extract_workers=2,
+                    diff_workers=2, sink=sink, **kwargs)
+
+
+def test_run_counts_each_stage():
+    sink = ConfirmingSink(failing=['7700000004'])
+    pipeline = make_pipeline(sink, parser=FakeParser(missing=['7700000002']),
+                             extractor=FakeExtractor(broken=['7700000003']))
+
+    stats = pipeline.run(sorted(FOUNDERS))
+    assert stats == {'total': 4, 'resumed': 0, 'fetched': 3, 'extracted': 2, 'unchanged': 0, 'processed': 2,
+                     'written': 1, 'failed': 3}
+    assert list(sink.rows) == ['7700000001']
+    assert sink.rows['7700000001']['current_founders'] == 'ИВАНОВ ИВАН 770101010101'
+
+
+def test_inns_fail_when_no_parser_can_be_created():
+    def broken_factory():
+        raise RuntimeError('chrome did not start')
+
+    pipeline = Pipeline(broken_factory, FakeExtractor(), DataProcessor(), FakeSheets(), fetch_workers=2,
+                        sink=ConfirmingSink())
+    stats = pipeline.run(sorted(FOUNDERS))
+    assert (stats['fetched'], stats['failed']) == (0, 4)
+
+
+def test_resumed_run_skips_written_inns(tmp_path):
+    journal = RunJournal(str(tmp_path / 'run.jsonl'))
+    journal.record('7700000001', 'written')
+    sink = ConfirmingSink()
+
+    stats = make_pipeline(sink, parser=FakeParser(directory=str(tmp_path)), journal=journal).run(sorted(FOUNDERS))
+    assert (stats['resumed'], stats['written']) == (1, 3)
+    assert sorted(sink.rows) == ['7700000002', '7700000003', '7700000004']
+    assert all(journal.is_written(inn) for inn in FOUNDERS)
+    journal.close()
+
+
+def test_founder_index_is_updated_only_for_confirmed_writes(tmp_path):
+    index = FounderIndex(str(tmp_path / 'founders.sqlite'))
+    pipeline = make_pipeline(ConfirmingSink(failing=['7700000002']), founder_index=index)
+
+    stats = pipeline.run(['7700000001', '7700000002'])
+    assert stats['written'] == 1 and stats['failed'] == 1
+    assert [row['founder_inn'] for row in index.founders_of('7700000001')] == ['770101010101']
+    assert index.founders_of('7700000002') == []
+    index.close()
@@ -0,0 +1,46 @@
+from rate_limiter import RateLimiter, CLOSED, OPEN, HALF_OPEN, TIMEOUT, ERROR
+
+
+def make_limiter(**kwargs):
+    options = dict(rate=10, min_rate=1, max_rate=100, increase=1, decrease=0.5, burst=100,
+                   breaker_threshold=3, cooldown=0)
+    options.update(kwargs)
+    return RateLimiter(**options)
+
+
+def test_rate_grows_once_per_completed_inn():
+    limiter = make_limiter()
+    # Проба и скачивание одного ИНН: темп и число ИНН в минуту растут один раз
+    limiter.acquire()
+    limiter.on_success(completed=False)
+    limiter.acquire()
+    limiter.on_success()
+    assert limiter.rate == 11
+    assert limiter.inns_per_minute() == 1
+
+    limiter.mark_completed()
+    assert limiter.rate == 12
+    assert limiter.inns_per_minute() == 2
+
+
+def test_congestion_decreases_rate_and_errors_do_not():
+    limiter = make_limiter()
+    limiter.on_failure(TIMEOUT)
+    assert limiter.rate == 5
+    limiter.on_failure(ERROR)
+    assert limiter.rate == 5
+    assert limiter.metrics()[TIMEOUT] == 1
+
+
+def test_breaker_opens_and_probe_success_closes_it():
+    limiter = make_limiter()
+    for _ in range(3):
+        limiter.on_failure(ERROR)
+    assert limiter.state == OPEN
+
+    # Пауза нулевая: следующее обращение - пробное
+    limiter.acquire()
+    assert limiter.state == HALF_OPEN
+    limiter.on_success(completed=False)
+    assert limiter.state == CLOSED
+    assert limiter.inns_per_minute() == 0
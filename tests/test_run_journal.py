@@ -0,0 +1,93 @@
+import os
+import json
+from run_journal import RunJournal, open_run_journal
+
+
+def interrupt(journal, written):
+    for inn in written:
+        journal.record(inn, 'written')
+    journal.close(completed=False)
+
+
+def test_resumes_unfinished_run_of_the_same_list(tmp_path):
+    journal = open_run_journal(['1', '2', '3'], journal_dir=str(tmp_path))
+    interrupt(journal, ['1'])
+
+    resumed = open_run_journal(['3', '2', '1'], journal_dir=str(tmp_path))
+    assert resumed.path == journal.path
+    assert resumed.pending(['1', '2', '3']) == ['2', '3']
+    resumed.close(completed=True)
+
+    fresh = open_run_journal(['1', '2', '3'], journal_dir=str(tmp_path))
+    assert fresh.path != journal.path
+    assert fresh.pending(['1', '2', '3']) == ['1', '2', '3']
+    fresh.close()
+
+
+def test_does_not_resume_a_different_inn_list(tmp_path):
+    journal = open_run_journal(['1', '2'], journal_dir=str(tmp_path))
+    interrupt(journal, ['1'])
+
+    other = open_run_journal(['1', '5'], journal_dir=str(tmp_path))
+    assert other.path != journal.path
+    assert other.pending(['1', '5']) == ['1', '5']
+    other.close()
+
+
+def test_does_not_resume_an_old_run(tmp_path):
+    journal = open_run_journal(['1', '2'], journal_dir=str(tmp_path))
+    interrupt(journal, ['1'])
+    with open(journal.path, encoding='utf-8') as file:
+        lines = file.readlines()
+    header = json.loads(lines[0])
+    header['ts'] -= 3600
+    lines[0] = json.dumps(header) + '\n'
+    with open(journal.path, 'w', encoding='utf-8') as file:
+        file.writelines(lines)
+
+    stale = open_run_journal(['1', '2'], journal_dir=str(tmp_path), max_age=600)
+    assert stale.path != journal.path
+    stale.close()
+
+
+def test_truncated_line_is_skipped(tmp_path):
+    path = str(tmp_path / 'run-1.jsonl')
+    journal = RunJournal(path, inn_list_hash='x')
+    journal.record('1', 'failed', at='fetch')
+    journal.record('1', 'written')
+    journal.record('2', 'fetched', pdf_path=str(tmp_path / 'missing.pdf'))
+    journal.close()
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write('{"inn": "3", "sta')
+
+    reloaded = RunJournal(path)
+    assert reloaded.inn_list_hash == 'x'
+    assert reloaded.is_written('1')
+    assert '3' not in reloaded.entries
+    assert reloaded.fetched_pdf('2') is None
+    reloaded.close()
+
+
+def test_record_after_truncated_tail_is_kept(tmp_path):
+    path = str(tmp_path / 'run-1.jsonl')
+    journal = RunJournal(path, inn_list_hash='x')
+    journal.record('1', 'written')
+    journal.close()
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write('{"inn": "3", "sta')
+
+    resumed = RunJournal(path)
+    resumed.record('4', 'written')
+    resumed.close()
+
+    reloaded = RunJournal(path)
+    assert reloaded.is_written('1')
+    assert reloaded.is_written('4')
+    assert '3' not in reloaded.entries
+    reloaded.close()
+
+
+def test_old_journals_are_pruned(tmp_path):
+    for number in range(5):
+        open_run_journal([str(number)], journal_dir=str(tmp_path), keep=3).close(completed=True)
+    assert len(os.listdir(tmp_path)) == 3
@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import subprocess
+import urllib.error
+import urllib.request
+import pytest
+from googleapiclient.errors import HttpError
+from sheets_emulator import Spreadsheet, synthetic_rows
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPDATE = {'name': 'ООО "НОВОЕ"', 'current_founders': 'ИВАНОВ ИВАН 770101010101', 'former_founders': '',
+          'change_date': '01.07.2024'}
+
+
+def test_synthetic_rows():
+    rows = synthetic_rows(3, founders=2)
+    assert rows[0][0] == 'ИНН'
+    assert [row[0] for row in rows[1:]] == ['7700000000', '7700000001', '7700000002']
+    assert rows[1][2].count(',') == 1
+
+
+def test_range_parsing():
+    sheet = Spreadsheet([['a', 'b', ''], ['c']])
+    assert sheet.parse_range('A2:E') == (1, None, 0, 4)
+    assert sheet.get('A1:C') == [['a', 'b'], ['c']]
+    assert sheet.update('B3', [['x']]) == (1, 1)
+    assert sheet.get('A3:B3') == [['', 'x']]
+
+
+def test_read_and_batch_update_round_trip(handler, emulator):
+    assert handler.get_inn_list() == [row[0] for row in synthetic_rows(5)[1:]]
+    assert handler.get_company_data('7700000001')['name'] == 'ООО "КОМПАНИЯ-1"'
+
+    written = []
+    handler.add_flush_listener(written.extend)
+    assert handler.update_company_data('7700000001', UPDATE)
+    assert handler.flush()
+    assert written == ['7700000001']
+    assert emulator.spreadsheets['local'].rows[2] == ['7700000001', 'ООО "НОВОЕ"', 'ИВАНОВ ИВАН 770101010101', '',
+                                                      '01.07.2024']
+
+    result = handler.service.spreadsheets().values().batchGet(
+        spreadsheetId='local', ranges=['A3:B3', 'A4:A4']).execute()
+    assert [item['values'] for item in result['valueRanges']] == [[['7700000001', 'ООО "НОВОЕ"']], [['7700000002']]]
+
+
+def test_quota_errors_keep_rows_buffered(handler, emulator):
+    handler.get_inn_list()
+    emulator.error_rate = 1.0
+    with pytest.raises(HttpError) as error:
+        handler.service.spreadsheets().values().get(spreadsheetId='local', range='A1:A2').execute()
+    assert error.value.resp.status == 429
+
+    assert handler.update_company_data('7700000001', UPDATE)
+    assert not handler.flush()
+    assert '7700000001' in handler._pending
+    assert emulator.stats()['quota_errors'] > 1
+
+    emulator.error_rate = 0.0
+    assert handler.flush()
+    assert handler._pending == {}
+
+
+def test_invalid_json_body_is_rejected(emulator):
+    request = urllib.request.Request(emulator.url + '/v4/spreadsheets/local/values:batchUpdate', data=b'{"data": [',
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request, timeout=5)
+    assert error.value.code == 400
+    assert json.loads(error.value.read())['error']['status'] == 'INVALID_ARGUMENT'
+    assert emulator.stats()['rows_written'] == 0
+
+
+def test_load_test_writes_every_row():
+    # Отдельный процесс: load_test настраивает окружение до импорта config
+    result = subprocess.run([sys.executable, 'load_test.py', '--rows', '60', '--updates', '40', '--writers', '2',
+                             '--batch-size', '10'], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout)
+    assert report['result']['rows_unwritten'] == 0
+    assert report['emulator']['rows_written'] == 40
@@ -0,0 +1,142 @@
+import csv
+import json
+import sqlite3
+import pytest
+from sinks import Sink, SQLiteSink, JSONLSink, CSVSink, MultiSink
+
+ROW = {'name': 'ООО "А"', 'current_founders': 'ИВАНОВ 770101010101', 'former_founders': '', 'change_date': '01.01.2024'}
+
+
+class ManualSink(Sink):
+    """Получатель, который подтверждает записи только по команде теста."""
+
+    def __init__(self, merges_writes=False):
+        super().__init__()
+        self.merges_writes = merges_writes
+        self.rows = []
+
+    def write(self, inn, data):
+        self.rows.append(inn)
+        return True
+
+    def confirm(self, inns):
+        self._notify_written(inns)
+
+
+def collect(sink):
+    written = []
+    sink.add_flush_listener(written.extend)
+    return written
+
+
+def test_sink_without_write_cannot_be_created():
+    class Incomplete(Sink):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_local_sinks_write_and_confirm(tmp_path):
+    sqlite_sink = SQLiteSink(str(tmp_path / 'companies.sqlite'), batch_size=2)
+    jsonl_sink = JSONLSink(str(tmp_path / 'changes.jsonl'), batch_size=2)
+    csv_sink = CSVSink(str(tmp_path / 'companies.csv'))
+    sink = MultiSink([sqlite_sink, jsonl_sink, csv_sink])
+    written = collect(sink)
+
+    sink.write('1', ROW)
+    sink.write('2', ROW)
+    assert written == []
+    sink.close()
+    assert sorted(written) == ['1', '2']
+
+    conn = sqlite3.connect(str(tmp_path / 'companies.sqlite'))
+    assert conn.execute('SELECT inn, name FROM companies ORDER BY inn').fetchall() == [('1', 'ООО "А"'), ('2', 'ООО "А"')]
+    conn.close()
+    with open(tmp_path / 'changes.jsonl', encoding='utf-8') as file:
+        assert [json.loads(line)['inn'] for line in file] == ['1', '2']
+    with open(tmp_path / 'companies.csv', encoding='utf-8-sig', newline='') as file:
+        assert [row['inn'] for row in csv.DictReader(file)] == ['1', '2']
+
+
+class FailingConnection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def executemany(self, sql, rows):
+        raise sqlite3.OperationalError('database is locked')
+
+
+def test_sqlite_keeps_rows_after_failed_commit(tmp_path):
+    sink = SQLiteSink(str(tmp_path / 'companies.sqlite'), batch_size=2)
+    written = collect(sink)
+    conn, sink._conn = sink._conn, FailingConnection()
+
+    assert sink.write('1', ROW)
+    assert not sink.write('2', ROW)
+    assert written == []
+
+    sink._conn = conn
+    assert sink.flush()
+    assert written == ['1', '2']
+    assert conn.execute('SELECT COUNT(*) FROM companies').fetchone() == (2,)
+    sink.close()
+
+
+def test_duplicate_notifications_do_not_confirm_other_sinks():
+    first, second = ManualSink(), ManualSink()
+    sink = MultiSink([first, second])
+    written = collect(sink)
+
+    sink.write('1', ROW)
+    first.confirm(['1'])
+    first.confirm(['1'])
+    assert written == []
+    second.confirm(['1'])
+    assert written == ['1']
+
+
+def test_repeated_inn_needs_every_sink_for_each_write():
+    first, second = ManualSink(), ManualSink()
+    sink = MultiSink([first, second])
+    written = collect(sink)
+
+    sink.write('1', ROW)
+    sink.write('1', ROW)
+    first.confirm(['1', '1'])
+    second.confirm(['1'])
+    assert written == ['1']
+    second.confirm(['1'])
+    assert written == ['1', '1']
+
+
+def test_failing_sink_does_not_block_the_others():
+    class BrokenSink(ManualSink):
+        def write(self, inn, data):
+            raise OSError('disk full')
+
+    broken, plain = BrokenSink(), ManualSink()
+    sink = MultiSink([broken, plain])
+    written = collect(sink)
+
+    assert not sink.write('1', ROW)
+    assert plain.rows == ['1']
+    plain.confirm(['1'])
+    assert written == []
+    assert sink._confirmations == {}
+    assert sink._outstanding == [{}, {}]
+
+
+def test_merging_sink_confirms_all_its_pending_writes():
+    merging, plain = ManualSink(merges_writes=True), ManualSink()
+    sink = MultiSink([merging, plain])
+    written = collect(sink)
+
+    sink.write('1', ROW)
+    sink.write('1', ROW)
+    merging.confirm(['1'])
+    plain.confirm(['1', '1'])
+    assert written == ['1', '1']
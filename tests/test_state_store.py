@@ -0,0 +1,51 @@
+import time
+import sqlite3
+from state_store import StateStore, compute_fingerprint, founder_key, parse_founder_string
+
+
+def test_parse_founder_string():
+    assert parse_founder_string('ИВАНОВ  ИВАН\nИВАНОВИЧ 770101010101 12.03.2010') == \
+        ('ИВАНОВ ИВАН ИВАНОВИЧ', '770101010101')
+    assert parse_founder_string('ООО "РОМАШКА"') == ('ООО "РОМАШКА"', '')
+
+
+def test_fingerprint_ignores_founder_order_and_name_case():
+    first = compute_fingerprint('ООО "А"', [('Иванов', '770101010101'), ('ООО "Б"', '')])
+    second = compute_fingerprint('ООО "А"', [('ооо  "б"', ''), ('ИВАНОВ', '770101010101')])
+    assert first == second
+    assert founder_key('ооо  "б"', '') == 'ООО "Б"'
+
+
+def test_save_and_read_state(tmp_path):
+    store = StateStore(str(tmp_path / 'state.sqlite'))
+    assert store.get_founders('1') is None
+    store.save_many([('1', 'fp', 'ООО "А"', [('ИВАНОВ', '770101010101')])])
+    assert store.get_fingerprint('1') == 'fp'
+    assert store.get_founders('1') == {'770101010101': ('ИВАНОВ', '770101010101')}
+    assert list(store.iter_companies())[0][3] == [('ИВАНОВ', '770101010101')]
+    store.close()
+
+
+def test_mark_checked_keeps_updated_at(tmp_path):
+    store = StateStore(str(tmp_path / 'state.sqlite'))
+    store.save_many([('1', 'fp', 'ООО "А"', [])])
+    updated_at = list(store.iter_companies())[0][2]
+    time.sleep(0.01)
+    store.mark_checked(['1'])
+    assert list(store.iter_companies())[0][2] == updated_at
+    assert store.checked_times()['1'] > updated_at
+    store.close()
+
+
+def test_adds_checked_at_to_old_database(tmp_path):
+    path = str(tmp_path / 'state.sqlite')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE companies (inn TEXT PRIMARY KEY, name TEXT NOT NULL, fingerprint TEXT NOT NULL, '
+                 'updated_at REAL NOT NULL)')
+    conn.execute("INSERT INTO companies VALUES ('1', 'ООО', 'fp', 100.0)")
+    conn.commit()
+    conn.close()
+
+    store = StateStore(path)
+    assert store.checked_times() == {'1': 100.0}
+    store.close()